@@ -1,14 +1,33 @@
+import base64
+import io
+import json
 import os
 import logging
-from flask import Flask, render_template, request, jsonify, send_file
+import math
+import shutil
+import threading
+import time
+from PIL import Image
+from flask import Flask, Response, render_template, request, jsonify, send_file, send_from_directory, g, url_for
 import tempfile
 import uuid
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import HTTPException
 from werkzeug.middleware.proxy_fix import ProxyFix
-from logo_processor import process_logo, process_card_logo
+import logo_processor
+import tiling
+from logo_processor import process_logo, process_text_logo, process_card_logo, render_logo, render_card_logo, render_svg_logo, render_svg_card_logo, ImageTooLargeError, ENCODER_PROFILES, resolve_profile, process_outputs, render_outputs, card_preparation, trimmed_preparation, warm_encoders, render_thumbnail, render_svg_thumbnail, logo_geometry, card_geometry, svg_extent, THUMBNAIL_SIZE, CARD_PREVIEW_SCALE, LOGO_FIT_BOX, MAX_SCALE_FACTOR
+from logo_cache import LogoCache, compute_handle
+from render_cache import RenderCache, content_digest, normalize_params, render_key
+from timing import StageRecorder, activate, deactivate, metrics, recording
+from font_registry import REFERENCE_SIZE, font_source, get_font
+from card_templates import CARD_TEMPLATES, DEFAULT_TEMPLATE, card_template_options, load_card_templates_config, preload_card_templates, template_digest
+from batch import TARGETS, WORKER_SETTINGS as BATCH_WORKER_SETTINGS, BatchRenderer, extract_archive, save_uploads
+from jobs import JobQueue, QueueFull
+from live_preview import LivePreviewHub, is_valid_channel
 
-# Configuration du logging
-logging.basicConfig(level=logging.DEBUG)
+# Configuration du logging : INFO par défaut, DEBUG (journaux détaillés de chaque rendu) à la demande
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
 
 # Create the app
 app = Flask(__name__)
@@ -22,12 +41,227 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['PROCESSED_FOLDER'] = PROCESSED_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+app.config['LOGO_CACHE_SIZE'] = int(os.environ.get('LOGO_CACHE_SIZE', 32))
+app.config['LOGO_CACHE_DIR'] = os.environ.get('LOGO_CACHE_DIR')  # cache disque optionnel
+
 # Créer les dossiers s'ils n'existent pas
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(PROCESSED_FOLDER, exist_ok=True)
 
+app.config['RENDER_CACHE_MAX_AGE'] = int(os.environ.get('RENDER_CACHE_MAX_AGE', 24 * 3600))  # secondes
+app.config['RENDER_CACHE_MAX_BYTES'] = int(os.environ.get('RENDER_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+# Cache HTTP des rendus servis par /processed : leur nom dérive d'une empreinte (source, paramètres,
+# version du rendu), le contenu d'un nom ne change donc jamais et se garde sans revalidation
+app.config['PROCESSED_MAX_AGE'] = int(os.environ.get('PROCESSED_MAX_AGE', 365 * 24 * 3600))  # secondes
+# Derrière un proxy : corps des rendus délégué au proxy (X-Sendfile pour Apache/lighttpd, ou
+# X-Accel-Redirect vers une location interne nginx pointant sur processed/)
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
+app.config['PROCESSED_ACCEL_REDIRECT'] = os.environ.get('PROCESSED_ACCEL_REDIRECT')  # ex. /internal/processed/
+
+# Budget de pixels des images envoyées : au-delà, refus (413) avant décodage
+app.config['MAX_INPUT_PIXELS'] = int(os.environ.get('MAX_INPUT_PIXELS', logo_processor.MAX_INPUT_PIXELS))
+logo_processor.MAX_INPUT_PIXELS = app.config['MAX_INPUT_PIXELS']
+
+# Très grandes images : étapes pixel par pixel (niveaux de gris, détourage, réduction) par bandes
+# de TILE_ROWS lignes sur TILE_THREADS threads, au-delà de TILE_MIN_PIXELS (voir tiling)
+app.config['TILE_MIN_PIXELS'] = int(os.environ.get('TILE_MIN_PIXELS', tiling.TILE_MIN_PIXELS))
+app.config['TILE_ROWS'] = int(os.environ.get('TILE_ROWS', tiling.TILE_ROWS))
+app.config['TILE_THREADS'] = int(os.environ.get('TILE_THREADS', tiling.TILE_THREADS))
+tiling.TILE_MIN_PIXELS = app.config['TILE_MIN_PIXELS']
+tiling.TILE_ROWS = app.config['TILE_ROWS']
+tiling.TILE_THREADS = app.config['TILE_THREADS']
+
+app.config['STAGE_TIMING'] = os.environ.get('STAGE_TIMING', '1') == '1'  # Server-Timing et /metrics
+
+# Modèles de carte : modèles supplémentaires optionnels, décodés une fois au démarrage (voir preload)
+if os.environ.get('CARD_TEMPLATES_FILE'):
+    load_card_templates_config(os.environ['CARD_TEMPLATES_FILE'])
+
+# Rendus nommés par empreinte dans processed/, purgés par un concierge en tâche de fond
+render_cache = RenderCache(
+    PROCESSED_FOLDER,
+    max_age=app.config['RENDER_CACHE_MAX_AGE'],
+    max_bytes=app.config['RENDER_CACHE_MAX_BYTES']
+)
+
+metrics.add_collector(lambda: [
+    (f"logo_render_cache_{name}_total", f"Render cache {name}", value)
+    for name, value in render_cache.stats().items()
+])
+
+# Rendus asynchrones (async=1) : file bornée consommée par des threads du processus, statuts
+# partagés entre workers par JOB_STATE_DIR
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+app.config['JOB_QUEUE_SIZE'] = int(os.environ.get('JOB_QUEUE_SIZE', 16))
+app.config['JOB_RESULT_TTL'] = int(os.environ.get('JOB_RESULT_TTL', 600))  # secondes
+app.config['JOB_MAX_WAIT'] = float(os.environ.get('JOB_MAX_WAIT', 25))  # attente longue max, secondes
+app.config['JOB_STATE_DIR'] = os.environ.get('JOB_STATE_DIR', os.path.join(PROCESSED_FOLDER, '.jobs'))  # vide : statuts en mémoire
+job_queue = JobQueue(
+    workers=app.config['JOB_WORKERS'],
+    max_pending=app.config['JOB_QUEUE_SIZE'],
+    result_ttl=app.config['JOB_RESULT_TTL'],
+    state_dir=app.config['JOB_STATE_DIR'] or None
+)
+
+metrics.add_collector(lambda: [
+    (f"logo_render_jobs_{name}_total", f"Render jobs {name}", value)
+    for name, value in job_queue.stats().items() if name != 'pending'
+])
+
+# Aperçus en direct (SSE) : un rendu au plus par canal, la demande la plus récente l'emporte
+# Chaque flux SSE occupe un thread : flux bornés en nombre (sous le nombre de threads du worker)
+# et en durée (le client se reconnecte), canaux partagés entre workers par LIVE_STATE_DIR
+app.config['LIVE_WORKERS'] = int(os.environ.get('LIVE_WORKERS', 4))
+app.config['LIVE_MAX_STREAMS'] = int(os.environ.get('LIVE_MAX_STREAMS', max(1, int(os.environ.get('GUNICORN_THREADS', 16)) // 2)))
+app.config['LIVE_STREAM_LIFETIME'] = float(os.environ.get('LIVE_STREAM_LIFETIME', 30))  # secondes
+app.config['LIVE_STATE_DIR'] = os.environ.get('LIVE_STATE_DIR', os.path.join(PROCESSED_FOLDER, '.live'))  # vide : canaux en mémoire
+live_hub = LivePreviewHub(
+    workers=app.config['LIVE_WORKERS'],
+    max_streams=app.config['LIVE_MAX_STREAMS'],
+    stream_lifetime=app.config['LIVE_STREAM_LIFETIME'],
+    state_dir=app.config['LIVE_STATE_DIR'] or None
+)
+
+metrics.add_collector(lambda: [
+    (f"logo_live_preview_{name}_total", f"Live previews {name}", value)
+    for name, value in live_hub.stats().items()
+])
+
+# Logos téléversés une seule fois puis référencés par handle lors des ajustements
+logo_cache = LogoCache(
+    max_entries=app.config['LOGO_CACHE_SIZE'],
+    disk_dir=app.config['LOGO_CACHE_DIR']
+)
+
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'svg'}
 
+# Traitement par lots : pool de processus (créé au premier lot) et délai par élément ; les
+# fichiers d'un lot sont écrits dans un dossier temporaire (BATCH_TMP_DIR, sinon celui du système)
+app.config['BATCH_WORKERS'] = int(os.environ.get('BATCH_WORKERS', os.cpu_count() or 1))
+app.config['BATCH_ITEM_TIMEOUT'] = float(os.environ.get('BATCH_ITEM_TIMEOUT', 60))  # secondes
+app.config['BATCH_MAX_CONTENT_LENGTH'] = int(os.environ.get('BATCH_MAX_CONTENT_LENGTH', 64 * 1024 * 1024))
+app.config['BATCH_TMP_DIR'] = os.environ.get('BATCH_TMP_DIR') or None
+app.config['BATCH_START_METHOD'] = os.environ.get('BATCH_START_METHOD') or None  # forkserver ou spawn par défaut
+# Processus forkserver/spawn : budget de pixels et réglages des bandes transmis explicitement
+batch_renderer = BatchRenderer(
+    workers=app.config['BATCH_WORKERS'],
+    item_timeout=app.config['BATCH_ITEM_TIMEOUT'],
+    start_method=app.config['BATCH_START_METHOD'],
+    settings={name: app.config[name] for name in BATCH_WORKER_SETTINGS}
+)
+
+# Chronométrage par étape des routes de rendu
+TIMED_ENDPOINTS = {'process_logo_route', 'process_card_route', 'export_route', 'process_outputs_route'}
+
+@app.before_request
+def start_stage_timing():
+    if app.config['STAGE_TIMING'] and request.endpoint in TIMED_ENDPOINTS:
+        g.stage_recorder = StageRecorder()
+        g.stage_token = activate(g.stage_recorder)
+        g.stage_start = time.perf_counter()
+
+@app.after_request
+def report_stage_timing(response):
+    recorder = g.pop('stage_recorder', None)
+    if recorder is not None:
+        elapsed = time.perf_counter() - g.stage_start
+        timing = recorder.server_timing()
+        response.headers['Server-Timing'] = f"{timing + ', ' if timing else ''}total;dur={elapsed * 1000:.2f}"
+        metrics.observe_request(request.endpoint, recorder, elapsed)
+    return response
+
+@app.teardown_request
+def stop_stage_timing(error=None):
+    token = g.pop('stage_token', None)
+    if token is not None:
+        deactivate(token)
+
+# Démarrage en production (gunicorn -c gunicorn.conf.py) : preload() s'exécute dans le processus
+# maître avant le fork, les workers en partagent le résultat par copie sur écriture ; chaque
+# worker lance ensuite ses threads (init_worker) et mesure sa première requête
+_startup = {'preloaded': False, 'worker_ready': False, 'first_request': True}
+_startup_lock = threading.Lock()
+
+def preload():
+    """
+    Charge une fois ce que les rendus partagent en lecture seule : police et face de
+    référence, modèles de carte (pleine taille et aperçu), encodeurs de chaque profil,
+    puis un rendu de chauffe en mémoire (NumPy, détourage, texte).
+    """
+    with _startup_lock:
+        if _startup['preloaded']:
+            return
+        start = time.perf_counter()
+        font_source()
+        get_font(REFERENCE_SIZE)
+        preload_card_templates(scales=(None, CARD_PREVIEW_SCALE))
+        warm_encoders()
+        loaded = time.perf_counter()
+        try:
+            warm_up_render()
+        except Exception as e:
+            logging.warning(f"Rendu de chauffe impossible : {str(e)}")
+        elapsed = time.perf_counter() - start
+        _startup['preloaded'] = True
+    metrics.observe('logo_startup_seconds', elapsed, phase='preload')
+    logging.info(
+        f"Préchargement en {elapsed * 1000:.0f} ms (ressources {(loaded - start) * 1000:.0f} ms, "
+        f"rendu de chauffe {(elapsed - (loaded - start)) * 1000:.0f} ms)"
+    )
+
+def warm_up_render():
+    """Rendu complet d'un petit logo et d'un texte, en mémoire, sans passer par les caches."""
+    logo = Image.new('RGB', (64, 32), (255, 255, 255))
+    logo.paste((0, 0, 0), (8, 8, 56, 24))
+    buffer = io.BytesIO()
+    logo.save(buffer, 'PNG')
+    for preview in (True, False):
+        process_logo(io.BytesIO(buffer.getvalue()), None, preview=preview)
+        process_card_logo(io.BytesIO(buffer.getvalue()), None, preview=preview)
+    process_text_logo('Logo', None, preview=True)
+
+def create_app():
+    """Fabrique de l'application (gunicorn 'app:create_app()') : précharge puis retourne app."""
+    preload()
+    return app
+
+def init_worker(started=None):
+    """
+    Initialise le processus qui sert les requêtes (après le fork sous gunicorn) : lance le
+    concierge du cache des rendus et journalise le démarrage à froid depuis started
+    (time.perf_counter() au fork).
+    """
+    with _startup_lock:
+        if _startup['worker_ready']:
+            return
+        _startup['worker_ready'] = True
+    render_cache.start_janitor()
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        metrics.observe('logo_startup_seconds', elapsed, phase='cold_start')
+        logging.info(f"Worker {os.getpid()} prêt en {elapsed * 1000:.0f} ms")
+
+@app.before_request
+def start_first_request_timing():
+    if not _startup['worker_ready']:
+        # Serveur lancé sans create_app (flask run, main:app) : initialiser à la première requête
+        preload()
+        init_worker()
+    if _startup['first_request']:
+        with _startup_lock:
+            g.first_request_start = time.perf_counter() if _startup['first_request'] else None
+            _startup['first_request'] = False
+
+@app.after_request
+def report_first_request(response):
+    start = g.pop('first_request_start', None)
+    if start is not None:
+        elapsed = time.perf_counter() - start
+        metrics.observe('logo_startup_seconds', elapsed, phase='first_request')
+        logging.info(f"Worker {os.getpid()} : première requête ({request.endpoint}) servie en {elapsed * 1000:.0f} ms")
+    return response
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -35,9 +269,230 @@ def allowed_file(filename):
 def index():
     return render_template('index.html')
 
+def expired_handle_response():
+    return jsonify({'success': False, 'error': 'Logo expiré, veuillez le renvoyer', 'expired': True}), 404
+
+@app.route('/upload_logo', methods=['POST'])
+def upload_logo_route():
+    try:
+        file, data, error = read_uploaded_logo()
+        if error:
+            return error
+            
+        # Le handle est l'empreinte du contenu : un même logo renvoyé garde le même handle
+        handle = logo_cache.add(data, secure_filename(file.filename))
+        return jsonify({'success': True, 'handle': handle})
+        
+    except Exception as e:
+        logging.error(f"Error uploading logo: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def preview_requested():
+    # Aperçu basse résolution pour les ajustements interactifs (preview=1)
+    return request.form.get('preview') in ('1', 'true')
+
+def preview_filename(output_filename, preview):
+    return f"preview_{output_filename}" if preview else output_filename
+
+def trim_requested(values):
+    # Logo rogné à son contenu avant la mise en place, sans les marges du fichier (trim=1)
+    return values.get('trim') in ('1', 'true')
+
+def client_composite_requested():
+    # Aperçu composé par le navigateur : calque du logo et règles de placement, sans rendu du canevas (composite=client)
+    return request.form.get('composite') == 'client'
+
+def stream_requested():
+    # Réponse directe avec l'image rendue, sans passer par /processed (stream=1)
+    return request.form.get('stream') in ('1', 'true')
+
+def async_requested():
+    # Rendu placé dans la file de tâches, la réponse 202 donne l'identifiant à interroger (async=1)
+    return request.form.get('async') in ('1', 'true')
+
+# Type MIME d'un rendu d'après son extension, fixée par son profil d'encodage
+PROCESSED_MIMETYPES = {settings['extension']: settings['mimetype'] for settings in ENCODER_PROFILES.values()}
+
+def processed_mimetype(filename):
+    return PROCESSED_MIMETYPES.get(filename.rsplit('.', 1)[-1].lower(), 'application/octet-stream')
+
+def requested_profile(values, target, preview=False):
+    """
+    Profil d'encodage demandé (champ 'profile', voir logo_processor.ENCODER_PROFILES) ;
+    'auto' choisit WebP si le client l'annonce dans l'en-tête Accept, sinon le profil par défaut.
+    Lève ValueError si le profil est inconnu ou incompatible avec la cible.
+    """
+    profile = values.get('profile') or None
+    if profile == 'auto':
+        accepts_webp = any(mimetype == 'image/webp' for mimetype, _ in request.accept_mimetypes)
+        profile = 'webp' if accepts_webp else None
+    return resolve_profile(profile, target, preview)
+
+def profile_extension(profile):
+    return ENCODER_PROFILES[profile]['extension']
+
+def render_response(prefix, extension, source_digest, function, params, render):
+    """
+    Nomme le rendu d'après l'empreinte (source, fonction, paramètres) et ne le produit
+    que s'il n'est pas déjà dans processed/.
+
+    render(output_path) écrit le rendu dans output_path, ou retourne les octets encodés
+    si output_path est None. En mode stream, l'image est renvoyée dans la réponse même
+    (et gardée en cache) ; en mode async, le rendu est confié à la file de tâches ; sinon
+    la réponse JSON donne le nom du fichier. Les rendus identiques simultanés sont
+    fusionnés par le cache de rendus.
+    """
+    key = render_key(source_digest, function, params)
+    output_filename = preview_filename(f"{prefix}_{key}.{extension}", params.get('preview'))
+    mimetype = processed_mimetype(output_filename)
+    if async_requested():
+        return submit_render_job(output_filename, render, function)
+    if stream_requested():
+        cached_path = render_cache.lookup(output_filename)
+        if cached_path:
+            return send_file(cached_path, mimetype=mimetype)
+        data = render_cache.render_bytes(output_filename, render)
+        return send_file(io.BytesIO(data), mimetype=mimetype, download_name=output_filename)
+    render_cache.get_or_render(output_filename, render)
+    return jsonify({'success': True, 'filename': output_filename})
+
+def submit_render_job(output_filename, render, function):
+    """Confie le rendu à la file de tâches : 202 avec l'identifiant, ou 429 si la file est pleine."""
+    def work():
+        start = time.perf_counter()
+        with recording() as recorder:
+            render_cache.get_or_render(output_filename, render)
+        metrics.observe_request(f"{function}_job", recorder, time.perf_counter() - start)
+        return output_filename
+
+    try:
+        job = job_queue.submit(work)
+    except QueueFull as e:
+        response = jsonify({'success': False, 'error': str(e), 'retry_after': e.retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status_url': url_for('job_status_route', job_id=job.id)
+    }), 202
+
+def handle_preparation(kind, render_options):
+    """
+    Préparation en cache d'un logo téléversé pour le canevas ('logo') ou la carte ('card') :
+    celle de la carte dépend de la zone du modèle (voir logo_processor.card_preparation).
+    """
+    if kind == 'card':
+        kind = card_preparation(render_options['max_width'], render_options['max_height'])
+    return trimmed_preparation(kind, render_options.get('trim', False))
+
+def handle_renderer(handle, kind, render_options):
+    """
+    render(output_path) d'un logo déjà téléversé, sur le canevas ('logo') ou la carte ('card') :
+    le logo détouré en cache (rogné si render_options['trim']) est replacé, un SVG est dessiné
+    directement à la taille finale.
+    """
+    preparation = handle_preparation(kind, render_options)
+    render_options = dict(render_options)
+    trim = render_options.pop('trim', False)
+
+    def render(output_path):
+        if logo_cache.is_svg(handle):
+            render_svg = render_svg_logo if kind == 'logo' else render_svg_card_logo
+            return render_svg(logo_cache.get_svg(handle), output_path, trim=trim, **render_options)
+        prepared = logo_cache.get_prepared(handle, preparation)
+        render_prepared = render_logo if kind == 'logo' else render_card_logo
+        return render_prepared(prepared, output_path, **render_options)
+    return render
+
+def composite_handle(check_extension=True):
+    """
+    Retourne (handle, erreur) du logo à composer côté client : le handle du formulaire, ou le
+    logo envoyé, mis en cache comme par /upload_logo.
+    """
+    handle = request.form.get('handle')
+    if handle:
+        if handle not in logo_cache:
+            return None, expired_handle_response()
+        return handle, None
+    file, data, error = read_uploaded_logo(check_extension)
+    if error:
+        return None, error
+    return logo_cache.add(data, secure_filename(file.filename)), None
+
+def client_composite_response(handle, kind, render_options, template_name=None):
+    """
+    Réponse du mode composite=client pour le canevas ('logo') ou la carte ('card') : le calque
+    du logo détouré (PNG transparent de sa couleur, à la taille atteinte au facteur d'échelle
+    maximal) et les règles de placement de logo_layout / card_layout (voir
+    logo_processor.logo_geometry). Le calque ne dépend ni des curseurs ni de l'aperçu : il est
+    téléchargé une fois par logo, le navigateur compose ensuite chaque ajustement et seul
+    l'export final est rendu par le serveur.
+    """
+    trim = render_options.get('trim', False)
+    if kind == 'card':
+        layout = {name: render_options[name] for name in ('card_template_path', 'top_margin', 'right_margin', 'max_width', 'max_height')}
+        box = (layout['max_width'], layout['max_height'])
+    else:
+        layout = {}
+        box = LOGO_FIT_BOX
+    layer_size = (math.ceil(box[0] * MAX_SCALE_FACTOR), math.ceil(box[1] * MAX_SCALE_FACTOR))
+    if logo_cache.is_svg(handle):
+        svg = logo_cache.get_svg(handle)
+        size, _ = svg_extent(svg, trim)
+
+        def render(output_path):
+            return render_svg_thumbnail(svg, output_path, size=layer_size, trim=trim, invert=kind == 'card')
+    else:
+        prepared = logo_cache.get_prepared(handle, handle_preparation(kind, render_options))
+        size = prepared.size
+
+        def render(output_path):
+            return render_thumbnail(prepared, output_path, size=layer_size)
+    if kind == 'card':
+        geometry = card_geometry(size, **layout)
+        # Version dans l'URL : l'image mise en cache par le navigateur suit le fichier du modèle
+        geometry['background_url'] = url_for(
+            'card_template_image_route',
+            name=template_name or DEFAULT_TEMPLATE,
+            v=(template_digest(layout['card_template_path']) or '')[:16]
+        )
+    else:
+        geometry = logo_geometry(size)
+    key = render_key(handle, 'layer', {'preparation': handle_preparation(kind, render_options), 'size': list(layer_size)})
+    filename = f"layer_{key}.png"
+    render_cache.get_or_render(filename, render)
+    return jsonify({
+        'success': True,
+        'handle': handle,
+        'layer_url': url_for('processed_file', filename=filename),
+        'geometry': geometry
+    })
+
+def read_uploaded_logo(check_extension=True):
+    """Retourne (fichier, octets, erreur) pour le logo envoyé dans le formulaire."""
+    if 'logo' not in request.files:
+        return None, None, (jsonify({'success': False, 'error': 'Aucun fichier envoyé'}), 400)
+        
+    file = request.files['logo']
+    
+    if file.filename == '':
+        return None, None, (jsonify({'success': False, 'error': 'Aucun fichier sélectionné'}), 400)
+        
+    if check_extension and not allowed_file(file.filename):
+        return None, None, (jsonify({'success': False, 'error': 'Format de fichier non supporté'}), 400)
+        
+    return file, file.read(), None
+
+def is_svg_filename(filename):
+    return filename.lower().endswith('.svg')
+
 @app.route('/process_logo', methods=['POST'])
-def process_logo_route():
+def process_logo_route(preview=None):
     try:
+        if preview is None:
+            preview = preview_requested()
         # Récupérer le type (image ou text)
         logo_type = request.form.get('type', 'image')
         override_param = request.form.get('override')
@@ -49,40 +504,52 @@ def process_logo_route():
         vertical_offset = float(request.form.get('vertical_offset', 0))
         scale_factor = float(request.form.get('scale_factor', 1.0))
         
-        if logo_type == 'image':
-            # Traitement d'image
-            if 'logo' not in request.files:
-                return jsonify({'success': False, 'error': 'Aucun fichier envoyé'}), 400
+        try:
+            profile = requested_profile(request.form, 'logo', preview)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        extension = profile_extension(profile)
+        
+        render_options = dict(
+            horizontal_offset=horizontal_offset,
+            vertical_offset=vertical_offset,
+            scale_factor=scale_factor,
+            override_limits={'scale': override_scale, 'position': override_position},
+            preview=preview,
+            profile=profile
+        )
+        params = normalize_params(**render_options)
+        # Rognage des marges : logos image seulement, le texte est déjà ajusté à ses glyphes
+        image_options = dict(render_options, trim=trim_requested(request.form))
+        image_params = normalize_params(**image_options)
+        
+        if logo_type == 'image' and client_composite_requested():
+            handle, error = composite_handle()
+            if error:
+                return error
+            return client_composite_response(handle, 'logo', image_options)
+        
+        handle = request.form.get('handle')
+        
+        if logo_type == 'image' and handle:
+            # Logo déjà téléversé : le détourage n'est fait qu'en cas d'absence du rendu
+            if handle not in logo_cache:
+                return expired_handle_response()
                 
-            file = request.files['logo']
+            render = handle_renderer(handle, 'logo', image_options)
+            return render_response('processed', extension, handle, 'logo', image_params, render)
             
-            if file.filename == '':
-                return jsonify({'success': False, 'error': 'Aucun fichier sélectionné'}), 400
+        elif logo_type == 'image':
+            # Traitement d'image
+            file, data, error = read_uploaded_logo()
+            if error:
+                return error
                 
-            if not allowed_file(file.filename):
-                return jsonify({'success': False, 'error': 'Format de fichier non supporté'}), 400
+            # Traiter le logo en mémoire (aucun fichier temporaire dans uploads/)
+            def render(output_path):
+                return process_logo(io.BytesIO(data), output_path, is_svg=is_svg_filename(file.filename), **image_options)
                 
-            # Sauvegarder le fichier
-            filename = secure_filename(file.filename)
-            input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(input_path)
-            
-            # Générer un nom de fichier unique pour l'image traitée
-            output_filename = f"processed_{filename.rsplit('.', 1)[0]}.jpg"
-            output_path = os.path.join(app.config['PROCESSED_FOLDER'], output_filename)
-            
-            # Traiter le logo avec les nouveaux paramètres
-            process_logo(
-                input_path,
-                output_path,
-                horizontal_offset=horizontal_offset,
-                vertical_offset=vertical_offset,
-                scale_factor=scale_factor,
-                override_limits={'scale': override_scale, 'position': override_position}
-            )
-            
-            # Supprimer le fichier d'entrée
-            os.remove(input_path)
+            return render_response('processed', extension, compute_handle(data), 'logo', image_params, render)
             
         else:
             # Traitement de texte
@@ -91,43 +558,95 @@ def process_logo_route():
             if not text:
                 return jsonify({'success': False, 'error': 'Aucun texte fourni'}), 400
                 
-            # Générer un nom de fichier unique pour le texte traité
-            output_filename = f"text_{uuid.uuid4().hex[:8]}.jpg"
-            output_path = os.path.join(app.config['PROCESSED_FOLDER'], output_filename)
-            
             # Traiter le texte avec les mêmes paramètres
-            from logo_processor import process_text_logo
-            process_text_logo(
-                text,
-                output_path,
-                horizontal_offset=horizontal_offset,
-                vertical_offset=vertical_offset,
-                scale_factor=scale_factor,
-                override_limits={'scale': override_scale, 'position': override_position}
-            )
-        
-        return jsonify({
-            'success': True,
-            'filename': output_filename
-        })
+            def render(output_path):
+                return process_text_logo(text, output_path, **render_options)
+                
+            return render_response('text', extension, content_digest(text), 'text', params, render)
         
+    except ImageTooLargeError as e:
+        logging.warning(f"Rejected oversized image: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 413
     except Exception as e:
         logging.error(f"Error processing logo: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def processed_etag(filename):
+    """ETag fort d'un rendu : l'empreinte contenue dans son nom."""
+    return os.path.splitext(filename)[0].rsplit('_', 1)[-1]
+
+def send_processed(filename, as_attachment=False):
+    """
+    Envoie un rendu de processed/ avec un ETag fort et un cache long immutable.
+    If-None-Match est traité sans accès disque (304) et Range par send_file (206). Le corps
+    est délégué au proxy si PROCESSED_ACCEL_REDIRECT ou USE_X_SENDFILE est configuré.
+    """
+    etag = processed_etag(filename)
+    accel_redirect = app.config['PROCESSED_ACCEL_REDIRECT']
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    elif accel_redirect:
+        if not os.path.isfile(os.path.join(app.config['PROCESSED_FOLDER'], secure_filename(filename))):
+            return jsonify({'error': 'Resource not found'}), 404
+        response = app.response_class(mimetype=processed_mimetype(filename))
+        response.headers['X-Accel-Redirect'] = f"{accel_redirect.rstrip('/')}/{secure_filename(filename)}"
+        if as_attachment:
+            response.headers['Content-Disposition'] = f"attachment; filename={secure_filename(filename)}"
+    else:
+        # NotFound (404) si le rendu a été évincé
+        response = send_from_directory(
+            app.config['PROCESSED_FOLDER'],
+            filename,
+            mimetype=processed_mimetype(filename),
+            as_attachment=as_attachment,
+            etag=etag,
+            max_age=app.config['PROCESSED_MAX_AGE'],
+            conditional=True
+        )
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config['PROCESSED_MAX_AGE']
+    response.cache_control.immutable = True
+    return response
+
 @app.route('/processed/<filename>')
 def processed_file(filename):
+    return send_processed(filename, as_attachment=request.args.get('download') == 'true')
+
+@app.route('/jobs/<job_id>')
+def job_status_route(job_id):
+    """Statut d'une tâche ; ?wait=N attend jusqu'à N secondes qu'elle se termine (attente longue)."""
     try:
-        return send_file(
-            os.path.join(app.config['PROCESSED_FOLDER'], filename),
-            mimetype='image/png' if filename.lower().endswith('.png') else 'image/jpeg'
-        )
-    except Exception as e:
-        return str(e), 404
+        wait = min(float(request.args.get('wait', 0)), app.config['JOB_MAX_WAIT'])
+    except ValueError:
+        wait = 0
+    job = job_queue.get(job_id, wait=wait)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Tâche inconnue ou expirée'}), 404
+    data = job.to_dict()
+    if job.status == 'done':
+        data['filename'] = data.pop('result')
+        data['result_url'] = url_for('job_result_route', job_id=job.id)
+    return jsonify({'success': True, **data})
+
+@app.route('/jobs/<job_id>/result')
+def job_result_route(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Tâche inconnue ou expirée'}), 404
+    if job.status == 'failed':
+        return jsonify({'success': False, 'error': job.error}), 500
+    if job.status != 'done':
+        return jsonify({'success': False, 'error': 'Rendu en cours', 'status': job.status}), 409
+    if render_cache.lookup(job.result) is None:
+        return jsonify({'success': False, 'error': 'Résultat expiré'}), 404
+    return send_processed(job.result, as_attachment=request.args.get('download') == 'true')
 
 @app.route('/process_card', methods=['POST'])
-def process_card_route():
+def process_card_route(preview=None):
     try:
+        if preview is None:
+            preview = preview_requested()
         # Récupérer les paramètres
         horizontal_offset = float(request.form.get('horizontal_offset', 0))
         vertical_offset = float(request.form.get('vertical_offset', 0))
@@ -135,38 +654,315 @@ def process_card_route():
         override_param = request.form.get('override')
         override_scale = override_param == 'scale'
         override_position = override_param == 'pos'
-        # Vérifier le fichier
-        if 'logo' not in request.files:
-            return jsonify({'success': False, 'error': 'Aucun fichier envoyé'}), 400
-        file = request.files['logo']
-        if file.filename == '':
-            return jsonify({'success': False, 'error': 'Aucun fichier sélectionné'}), 400
-        # Sauvegarder le fichier
-        filename = secure_filename(file.filename)
-        input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(input_path)
-        # Générer un nom de fichier unique pour la carte générée
-        output_filename = f"card_{uuid.uuid4().hex[:8]}.png"
-        output_path = os.path.join(app.config['PROCESSED_FOLDER'], output_filename)
-        # Traiter la carte
-        process_card_logo(
-            input_path,
-            output_path,
+        template_name = request.form.get('template') or None
+        if template_name and template_name not in CARD_TEMPLATES:
+            return jsonify({'success': False, 'error': 'Modèle de carte inconnu'}), 400
+        try:
+            profile = requested_profile(request.form, 'card', preview)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        extension = profile_extension(profile)
+        render_options = dict(
             scale_factor=scale_factor,
             horizontal_offset=horizontal_offset,
             vertical_offset=vertical_offset,
-            override_limits={'scale': override_scale, 'position': override_position}
+            override_limits={'scale': override_scale, 'position': override_position},
+            preview=preview,
+            profile=profile,
+            trim=trim_requested(request.form),
+            **card_template_options(template_name)
         )
-        # Supprimer le fichier d'entrée
-        os.remove(input_path)
-        return jsonify({'success': True, 'filename': output_filename})
+        params = normalize_params(**render_options)
+        if client_composite_requested():
+            handle, error = composite_handle(check_extension=False)
+            if error:
+                return error
+            return client_composite_response(handle, 'card', render_options, template_name)
+        handle = request.form.get('handle')
+        if handle:
+            # Logo déjà téléversé : le détourage n'est fait qu'en cas d'absence du rendu
+            if handle not in logo_cache:
+                return expired_handle_response()
+            render = handle_renderer(handle, 'card', render_options)
+            return render_response('card', extension, handle, 'card', params, render)
+        # Vérifier le fichier
+        file, data, error = read_uploaded_logo(check_extension=False)
+        if error:
+            return error
+        # Traiter la carte en mémoire (aucun fichier temporaire dans uploads/)
+        def render(output_path):
+            return process_card_logo(io.BytesIO(data), output_path, is_svg=is_svg_filename(file.filename), **render_options)
+        return render_response('card', extension, compute_handle(data), 'card', params, render)
+    except ImageTooLargeError as e:
+        logging.warning(f"Rejected oversized image: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 413
     except Exception as e:
         logging.error(f"Error processing card: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# Rendus de /process_outputs : préfixe du fichier, fonction de la clé de rendu (mêmes valeurs que
+# /process_logo et /process_card, dont les rendus en cache sont ainsi partagés) et cible du profil
+OUTPUT_TARGETS = {
+    'canvas': ('processed', 'logo', 'logo'),
+    'canvas_inverted': ('inverted', 'logo_inverted', 'logo'),
+    'card': ('card', 'card', 'card'),
+    'thumbnail': ('thumbnail', 'thumbnail', 'thumbnail'),
+}
+
+# Bornes des tailles de vignette demandées (px)
+MIN_THUMBNAIL_SIZE = 16
+MAX_THUMBNAIL_SIZE = 1024
+
+@app.route('/process_outputs', methods=['POST'])
+def process_outputs_route():
+    """
+    Plusieurs rendus d'un même logo à partir d'un seul décodage et détourage ('outputs' :
+    liste parmi canvas, canvas_inverted, card et thumbnail ; 'thumbnail_sizes' : côtés des
+    vignettes en px, ex. 64,160). Mêmes champs que /process_logo et /process_card, avec un
+    handle ou un fichier 'logo'. La réponse JSON donne le fichier de chaque rendu dans /processed.
+    """
+    try:
+        values = request.form.to_dict()
+        kinds = [kind.strip() for kind in (values.get('outputs') or 'canvas,card').split(',') if kind.strip()]
+        unknown = [kind for kind in kinds if kind not in OUTPUT_TARGETS]
+        if unknown:
+            return jsonify({'success': False, 'error': f"Rendu inconnu : {', '.join(unknown)}"}), 400
+        try:
+            sizes = [int(size) for size in (values.get('thumbnail_sizes') or str(THUMBNAIL_SIZE[0])).split(',')]
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Taille de vignette invalide'}), 400
+        if any(not MIN_THUMBNAIL_SIZE <= size <= MAX_THUMBNAIL_SIZE for size in sizes):
+            return jsonify({'success': False, 'error': f"Taille de vignette entre {MIN_THUMBNAIL_SIZE} et {MAX_THUMBNAIL_SIZE} px"}), 400
+        try:
+            outputs = {}
+            for kind in kinds:
+                target = OUTPUT_TARGETS[kind][2]
+                if kind == 'thumbnail':
+                    for size in sizes:
+                        outputs[f"thumbnail_{size}"] = dict(
+                            kind=kind, size=(size, size), profile=requested_profile(values, target), trim=trim_requested(values)
+                        )
+                else:
+                    outputs[kind] = dict(render_options_from(values, target), kind=kind)
+        except KeyError:
+            return jsonify({'success': False, 'error': 'Modèle de carte inconnu'}), 400
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        handle = values.get('handle')
+        if handle:
+            if handle not in logo_cache:
+                return expired_handle_response()
+            source_digest = handle
+        else:
+            file, data, error = read_uploaded_logo()
+            if error:
+                return error
+            source_digest = compute_handle(data)
+
+        filenames = {}
+        for name, options in outputs.items():
+            options = dict(options)
+            prefix, function, _ = OUTPUT_TARGETS[options.pop('kind')]
+            key = render_key(source_digest, function, normalize_params(**options))
+            filenames[name] = f"{prefix}_{key}.{profile_extension(options['profile'])}"
+        missing = {name: outputs[name] for name, filename in filenames.items() if not render_cache.lookup(filename)}
+        if missing:
+            if handle and logo_cache.is_svg(handle):
+                results = render_outputs(None, missing, svg=logo_cache.get_svg(handle))
+            elif handle:
+                # Préparations en cache du logo téléversé : aucun décodage
+                results = render_outputs(lambda preparation: logo_cache.get_prepared(handle, preparation), missing)
+            else:
+                results = process_outputs(io.BytesIO(data), missing, is_svg=is_svg_filename(file.filename))
+            for name, encoded in results.items():
+                render_cache.get_or_render(filenames[name], lambda path, encoded=encoded: write_file(path, encoded))
+        return jsonify({'success': True, 'outputs': filenames})
+    except ImageTooLargeError as e:
+        logging.warning(f"Rejected oversized image: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 413
+    except Exception as e:
+        logging.error(f"Error processing outputs: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+@app.route('/render_cache/stats')
+def render_cache_stats_route():
+    return jsonify({'success': True, **render_cache.stats()})
+
+@app.route('/metrics')
+def metrics_route():
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/card_templates')
+def card_templates_route():
+    return jsonify({'success': True, 'templates': list(CARD_TEMPLATES)})
+
+@app.route('/card_templates/<name>/image')
+def card_template_image_route(name):
+    # Image du modèle, fond de l'aperçu composé côté client
+    if name not in CARD_TEMPLATES:
+        return jsonify({'success': False, 'error': 'Modèle de carte inconnu'}), 404
+    path = os.path.join(app.root_path, CARD_TEMPLATES[name]['card_template_path'])
+    return send_file(path, max_age=3600)
+
+@app.route('/export', methods=['POST'])
+def export_route():
+    # Rendu final en qualité impression, produit une seule fois quand l'utilisateur télécharge
+    if request.form.get('target') == 'card':
+        return process_card_route(preview=False)
+    return process_logo_route(preview=False)
+
+def render_options_from(values, target, preview=False):
+    """
+    Paramètres de rendu lus dans un dict de champs (mêmes champs que /process_logo et /process_card).
+    Lève ValueError si un champ est invalide, KeyError si le modèle de carte est inconnu.
+    """
+    override_param = values.get('override')
+    options = dict(
+        horizontal_offset=float(values.get('horizontal_offset', 0)),
+        vertical_offset=float(values.get('vertical_offset', 0)),
+        scale_factor=float(values.get('scale_factor', 1.0)),
+        override_limits={'scale': override_param == 'scale', 'position': override_param == 'pos'},
+        preview=preview,
+        profile=requested_profile(values, target, preview),
+        trim=trim_requested(values)
+    )
+    if target == 'card':
+        # KeyError si le modèle est inconnu
+        options.update(card_template_options(values.get('template') or None))
+    return options
+
+@app.route('/batch', methods=['POST'])
+def batch_route():
+    """
+    Rendu d'un lot : fichiers 'logos' multiples et/ou archive zip 'archive'.
+    Les champs du formulaire s'appliquent à tous les éléments ('target' : logo, card
+    ou both ; 'profile' : profil d'encodage) ; le champ JSON 'params' peut les remplacer
+    par nom de fichier.
+    La réponse est une archive zip produite au fil des rendus, avec manifest.json. Les
+    fichiers sont écrits dans un dossier temporaire, supprimé une fois la réponse terminée.
+    """
+    request.max_content_length = app.config['BATCH_MAX_CONTENT_LENGTH']
+    directory = tempfile.mkdtemp(prefix='batch-', dir=app.config['BATCH_TMP_DIR'])
+    streaming = False
+    try:
+        shared = request.form.to_dict()
+        per_item = json.loads(request.form.get('params') or '{}')
+        sources = save_uploads([file for file in request.files.getlist('logos') if file.filename], directory)
+        if 'archive' in request.files:
+            sources += extract_archive(request.files['archive'], ALLOWED_EXTENSIONS, directory)
+        if not sources:
+            return jsonify({'success': False, 'error': 'Aucun fichier envoyé'}), 400
+        items = []
+        for name, path in sources:
+            values = dict(shared, **per_item.get(name, per_item.get(os.path.basename(name), {})))
+            target = values.get('target') or 'logo'
+            for item_target in (list(TARGETS) if target == 'both' else [target]):
+                if item_target not in TARGETS:
+                    return jsonify({'success': False, 'error': f"Cible inconnue : {item_target}"}), 400
+                options = render_options_from(values, item_target)
+                items.append({'name': name, 'path': path, 'target': item_target, 'options': options})
+        logging.info(f"Batch of {len(items)} item(s) submitted to {batch_renderer.workers} worker(s)")
+        response = Response(
+            batch_renderer.stream_zip(items),
+            mimetype='application/zip',
+            headers={'Content-Disposition': 'attachment; filename=batch.zip'}
+        )
+        response.call_on_close(lambda: shutil.rmtree(directory, ignore_errors=True))
+        streaming = True
+        return response
+    except KeyError:
+        return jsonify({'success': False, 'error': 'Modèle de carte inconnu'}), 400
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except HTTPException:
+        # Envoi au-delà de BATCH_MAX_CONTENT_LENGTH : 413 du gestionnaire d'erreurs
+        raise
+    except Exception as e:
+        logging.error(f"Error preparing batch: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        if not streaming:
+            shutil.rmtree(directory, ignore_errors=True)
+
+@app.route('/live/<channel_id>', methods=['POST'])
+def live_request_route(channel_id):
+    """
+    Demande d'aperçu sur un canal en direct ('target' : logo, card ou text ; mêmes champs
+    que /process_logo et /process_card, avec un handle pour les logos). La réponse 202
+    est immédiate, l'aperçu arrive sur /live/<channel_id>/events.
+    """
+    if not is_valid_channel(channel_id):
+        return jsonify({'success': False, 'error': 'Canal invalide'}), 400
+    values = request.form.to_dict()
+    target = values.get('target') or 'logo'
+    if target not in ('logo', 'card', 'text'):
+        return jsonify({'success': False, 'error': f"Cible inconnue : {target}"}), 400
+    try:
+        render_options = render_options_from(values, 'card' if target == 'card' else 'logo', preview=True)
+    except KeyError:
+        return jsonify({'success': False, 'error': 'Modèle de carte inconnu'}), 400
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if target == 'text':
+        text = values.get('logo-text', '')
+        if not text:
+            return jsonify({'success': False, 'error': 'Aucun texte fourni'}), 400
+        # Le texte est déjà ajusté à ses glyphes : pas de rognage
+        render_options.pop('trim')
+        def render(output_path):
+            return process_text_logo(text, output_path, **render_options)
+        prefix, source_digest, function = 'text', content_digest(text), 'text'
+    else:
+        handle = values.get('handle')
+        if handle not in logo_cache:
+            return expired_handle_response()
+        render = handle_renderer(handle, target, render_options)
+        prefix = 'card' if target == 'card' else 'processed'
+        source_digest, function = handle, target
+    # Même nom que l'aperçu de /process_logo et /process_card : réutilisé s'il est déjà en cache
+    key = render_key(source_digest, function, normalize_params(**render_options))
+    output_filename = preview_filename(f"{prefix}_{key}.{profile_extension(render_options['profile'])}", True)
+
+    def work():
+        cached_path = render_cache.lookup(output_filename)
+        if cached_path:
+            with open(cached_path, 'rb') as f:
+                data = f.read()
+        else:
+            data = render(None)
+        return {'mimetype': processed_mimetype(output_filename), 'image': base64.b64encode(data).decode('ascii')}
+
+    seq = live_hub.request(channel_id, work)
+    return jsonify({'success': True, 'seq': seq}), 202
+
+@app.route('/live/<channel_id>/events')
+def live_events_route(channel_id):
+    """
+    Flux SSE des aperçus d'un canal, de durée bornée : EventSource se reconnecte de lui-même
+    avec l'en-tête Last-Event-ID, et le flux reprend après le dernier aperçu reçu.
+    """
+    if not is_valid_channel(channel_id):
+        return jsonify({'success': False, 'error': 'Canal invalide'}), 400
+    try:
+        last_seq = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_seq = 0
+    return Response(
+        live_hub.events(channel_id, last_seq=last_seq),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 # Error handlers
 @app.errorhandler(413)
 def request_entity_too_large(error):
+    if request.endpoint == 'batch_route':
+        return jsonify({'error': f"Batch too large. Maximum size is {app.config['BATCH_MAX_CONTENT_LENGTH'] // (1024 * 1024)}MB."}), 413
     return jsonify({'error': 'File too large. Maximum size is 16MB.'}), 413
 
 @app.errorhandler(404)
@@ -178,4 +974,6 @@ def server_error(error):
     return jsonify({'error': 'Server error occurred'}), 500
 
 if __name__ == '__main__':
+    create_app()
+    init_worker()
     app.run(debug=True)
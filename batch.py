@@ -0,0 +1,253 @@
+"""
+Traitement par lots des logos.
+
+Les éléments d'un lot (fichiers envoyés ou contenu d'une archive zip) sont écrits dans un
+dossier temporaire, jamais gardés en mémoire, puis répartis par chemin sur un pool de processus qui exécute process_logo / process_card_logo. Les rendus
+sont ajoutés à une archive zip produite au fil de l'eau, dans l'ordre où ils se
+terminent, suivie d'un manifeste JSON donnant le résultat de chaque élément. Le délai
+d'un élément court à partir de son démarrage réel dans un processus ; un élément qui le
+dépasse est arrêté avec son processus (voir worker_pool).
+"""
+import io
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, CancelledError, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import logo_processor
+import tiling
+from logo_processor import ENCODER_PROFILES, process_logo, process_card_logo
+from worker_pool import WatchedPool
+
+# Cibles d'un élément (canevas d'impression et/ou maquette de carte) et suffixe du fichier produit ;
+# l'extension suit le profil d'encodage de l'élément
+TARGETS = {
+    'logo': '',
+    'card': '_card',
+}
+
+# Nouvelles soumissions d'un élément dont le processus est mort avec un autre (élément arrêté, OOM)
+MAX_ITEM_RETRIES = 2
+
+# Réglages de l'application repris dans les processus du pool, qui n'importent pas app :
+# nom de configuration -> (module, attribut)
+WORKER_SETTINGS = {
+    'MAX_INPUT_PIXELS': (logo_processor, 'MAX_INPUT_PIXELS'),
+    'TILE_MIN_PIXELS': (tiling, 'TILE_MIN_PIXELS'),
+    'TILE_ROWS': (tiling, 'TILE_ROWS'),
+    'TILE_THREADS': (tiling, 'TILE_THREADS'),
+}
+
+# Limites d'une archive : nombre d'éléments et taille décompressée (protection zip bomb)
+MAX_ARCHIVE_ITEMS = 500
+MAX_ARCHIVE_BYTES = 512 * 1024 * 1024
+
+
+def configure_worker(settings):
+    """Initialisation d'un processus du pool : réglages de WORKER_SETTINGS donnés par l'application."""
+    for name, value in settings.items():
+        module, attribute = WORKER_SETTINGS[name]
+        setattr(module, attribute, value)
+
+
+def render_item(target, path, options):
+    """
+    Rendu d'un élément dans un processus du pool : retourne (octets encodés, durée en secondes).
+    Fonction de module pour pouvoir être transmise au pool ; la source est lue depuis path.
+    """
+    start = time.perf_counter()
+    render = process_card_logo if target == 'card' else process_logo
+    result = render(path, None, **options)
+    return result, time.perf_counter() - start
+
+
+def _source_path(directory, name):
+    # Fichier propre à l'élément (les noms envoyés peuvent se répéter), extension conservée
+    fd, path = tempfile.mkstemp(dir=directory, suffix=f".{name.rsplit('.', 1)[-1].lower()}")
+    os.close(fd)
+    return path
+
+
+def save_uploads(files, directory):
+    """Écrit les fichiers envoyés (FileStorage) dans directory : liste (nom, chemin)."""
+    sources = []
+    for file in files:
+        path = _source_path(directory, file.filename)
+        file.save(path)
+        sources.append((file.filename, path))
+    return sources
+
+
+def extract_archive(archive, allowed_extensions, directory):
+    """
+    Extrait dans directory les images d'une archive zip, en ignorant dossiers, fichiers
+    cachés et extensions non supportées : liste (nom, chemin). Lève ValueError si l'archive
+    dépasse les limites.
+    """
+    sources = []
+    total = 0
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or not name or name.startswith('.'):
+                continue
+            if name.rsplit('.', 1)[-1].lower() not in allowed_extensions:
+                continue
+            total += info.file_size
+            if len(sources) >= MAX_ARCHIVE_ITEMS or total > MAX_ARCHIVE_BYTES:
+                raise ValueError(f"Archive trop volumineuse (maximum {MAX_ARCHIVE_ITEMS} fichiers, {MAX_ARCHIVE_BYTES // (1024 * 1024)} Mo)")
+            path = _source_path(directory, name)
+            with zf.open(info) as src, open(path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            sources.append((info.filename, path))
+    return sources
+
+
+class _ZipStream(io.RawIOBase):
+    """Flux non positionnable dans lequel zipfile écrit ; drain() retourne ce qui a été écrit."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class BatchRenderer:
+    """
+    Pool de processus partagé par les lots d'un worker, créé à la première utilisation.
+
+    Les processus ne sont pas forkés depuis le worker web (ses threads et verrous en cours
+    ne sont pas copiés) : démarrage forkserver, qui a déjà importé ce module, ou spawn.
+
+    Args:
+        workers: Nombre de processus de rendu (default: nombre de CPU)
+        item_timeout: Durée maximale d'un élément, en secondes (default: 60)
+        start_method: Démarrage des processus, voir multiprocessing (default: forkserver si
+            disponible, sinon spawn)
+        settings: Réglages de WORKER_SETTINGS appliqués dans chaque processus (default: None,
+            valeurs par défaut des modules)
+    """
+
+    def __init__(self, workers=None, item_timeout=60, start_method=None, settings=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.item_timeout = item_timeout
+        if start_method is None:
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        context = multiprocessing.get_context(start_method)
+        if start_method == 'forkserver':
+            context.set_forkserver_preload(['batch'])
+        self.pool = WatchedPool(self.workers, initializer=configure_worker, initargs=(dict(settings or {}),), context=context)
+
+    def stream_zip(self, items):
+        """
+        Génère l'archive zip des rendus, morceau par morceau.
+
+        items: liste de dicts {'name', 'path', 'target', 'options'} ; chaque rendu est
+        ajouté dès qu'il est prêt, puis manifest.json termine l'archive.
+        """
+        stream = _ZipStream()
+        manifest = []
+        used_names = set()
+        with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as zf:
+            for entry, data in self._run(items):
+                if data is not None:
+                    entry['output'] = self._output_name(entry, used_names)
+                    zf.writestr(entry['output'], data)
+                manifest.append(entry)
+                yield stream.drain()
+            zf.writestr('manifest.json', json.dumps(manifest, indent=2, ensure_ascii=False))
+        yield stream.drain()
+
+    def _run(self, items):
+        """
+        Soumet les éléments au pool (au plus `workers` à la fois) et les produit à mesure
+        qu'ils se terminent : (entrée du manifeste, octets du rendu ou None). Le délai de
+        chaque élément court à partir de son démarrage dans un processus (le pool est partagé
+        avec les autres lots) ; un élément qui le dépasse est arrêté avec son processus et
+        les autres éléments de ce pool sont soumis à nouveau.
+        """
+        queue = [(index, item, 0) for index, item in enumerate(items)]
+        queue.reverse()
+        pending = {}
+        while queue or pending:
+            while queue and len(pending) < self.workers:
+                index, item, retries = queue.pop()
+                try:
+                    options = dict(item['options'], is_svg=item['name'].lower().endswith('.svg'))
+                    future, token = self.pool.submit(render_item, item['target'], item['path'], options)
+                except Exception as e:
+                    yield self._entry(index, item, error=str(e)), None
+                    continue
+                pending[future] = (index, item, retries, token)
+            done, _ = wait(pending, timeout=min(1.0, self.item_timeout), return_when=FIRST_COMPLETED)
+            for future in done:
+                index, item, retries, token = pending.pop(future)
+                try:
+                    data, seconds = future.result()
+                except (BrokenProcessPool, CancelledError) as e:
+                    # Pool abandonné après la mort d'un processus (élément arrêté ou OOM) : élément resoumis
+                    self.pool.discard(token)
+                    if retries < MAX_ITEM_RETRIES:
+                        queue.append((index, item, retries + 1))
+                        continue
+                    logging.error(f"Batch item {item['name']} failed: {str(e)}")
+                    yield self._entry(index, item, error=str(e) or type(e).__name__), None
+                    continue
+                except Exception as e:
+                    logging.error(f"Batch item {item['name']} failed: {str(e)}")
+                    yield self._entry(index, item, error=str(e) or type(e).__name__), None
+                    continue
+                finally:
+                    self.pool.forget(token)
+                yield self._entry(index, item, seconds=seconds), data
+            for future, (index, item, retries, token) in list(pending.items()):
+                if not future.done() and self.pool.expired(token, self.item_timeout):
+                    self.pool.kill(future, token)
+                    self.pool.forget(token)
+                    del pending[future]
+                    logging.warning(f"Batch item {item['name']} timed out after {self.item_timeout}s")
+                    yield self._entry(index, item, error=f"Délai dépassé ({self.item_timeout:g} s)"), None
+
+    @staticmethod
+    def _entry(index, item, seconds=None, error=None):
+        entry = {
+            'index': index,
+            'name': item['name'],
+            'target': item['target'],
+            'profile': item['options']['profile'],
+            'success': error is None,
+        }
+        if error is None:
+            entry['seconds'] = round(seconds, 3)
+        else:
+            entry['error'] = error
+        return entry
+
+    @staticmethod
+    def _output_name(entry, used_names):
+        suffix = TARGETS[entry['target']]
+        extension = ENCODER_PROFILES[entry['profile']]['extension']
+        stem = os.path.splitext(os.path.basename(entry['name']))[0] or 'logo'
+        name = f"{stem}{suffix}.{extension}"
+        counter = 1
+        while name in used_names:
+            counter += 1
+            name = f"{stem}{suffix}_{counter}.{extension}"
+        used_names.add(name)
+        return name
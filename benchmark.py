@@ -0,0 +1,296 @@
+"""
+Banc d'essai reproductible des trois points d'entrée de rendu.
+
+Génère localement des entrées synthétiques (PNG avec alpha petit et très grand,
+JPEG opaque, GIF à palette, SVG de complexité variable, texte sur une ou plusieurs
+lignes), chronomètre process_logo / process_text_logo / process_card_logo étape par
+étape et rapporte débit, latences p50/p95, mémoire (pic RSS et tracemalloc) et,
+pour chaque profil d'encodage demandé, durée d'encodage et taille produite.
+Les résultats sont enregistrés en JSON pour être comparés à une exécution de référence.
+
+    python benchmark.py --repeat 5 --output bench.json
+    python benchmark.py --baseline bench.json
+    python benchmark.py --profile print --profile web --profile webp --filter jpeg
+    python benchmark.py --load --clients 16 --requests 200
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw
+
+from logo_processor import ENCODER_PROFILES, process_logo, process_text_logo, process_card_logo
+import svg_render
+from timing import recording
+
+SEED = 1234
+
+
+def _draw_shapes(draw, size, count, rng, fill):
+    width, height = size
+    for _ in range(count):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1 = min(width, x0 + rng.randrange(10, max(11, width // 3)))
+        y1 = min(height, y0 + rng.randrange(10, max(11, height // 3)))
+        if rng.random() < 0.5:
+            draw.ellipse((x0, y0, x1, y1), fill=fill(rng))
+        else:
+            draw.rectangle((x0, y0, x1, y1), fill=fill(rng))
+
+
+def make_png_alpha(size, rng):
+    img = Image.new('RGBA', size, (0, 0, 0, 0))
+    _draw_shapes(ImageDraw.Draw(img), size, 40, rng,
+                 lambda r: (r.randrange(256), r.randrange(256), r.randrange(256), r.randrange(128, 256)))
+    buffer = io.BytesIO()
+    img.save(buffer, 'PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def make_jpeg_opaque(size, rng):
+    img = Image.new('RGB', size, (255, 255, 255))
+    _draw_shapes(ImageDraw.Draw(img), size, 40, rng,
+                 lambda r: (r.randrange(200), r.randrange(200), r.randrange(200)))
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def make_gif_palette(size, rng):
+    img = Image.new('RGB', size, (255, 255, 255))
+    _draw_shapes(ImageDraw.Draw(img), size, 30, rng,
+                 lambda r: (r.randrange(200), r.randrange(200), r.randrange(200)))
+    buffer = io.BytesIO()
+    img.convert('P', palette=Image.ADAPTIVE, colors=32).save(buffer, 'GIF')
+    return buffer.getvalue()
+
+
+def make_svg(size, shapes, rng):
+    width, height = size
+    elements = []
+    for _ in range(shapes):
+        x, y = rng.randrange(width), rng.randrange(height)
+        r = rng.randrange(5, max(6, width // 10))
+        elements.append(f'<circle cx="{x}" cy="{y}" r="{r}" fill="#{rng.randrange(0x1000000):06x}"/>')
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'viewBox="0 0 {width} {height}">{"".join(elements)}</svg>').encode('utf-8')
+
+
+def build_corpus(huge=True):
+    """Entrées synthétiques, déterministes pour une graine donnée."""
+    rng = random.Random(SEED)
+    corpus = {
+        'png_alpha_small': make_png_alpha((400, 200), rng),
+        'jpeg_opaque': make_jpeg_opaque((3000, 2000), rng),
+        'gif_palette': make_gif_palette((1200, 800), rng),
+        'svg_simple': make_svg((300, 150), 10, rng),
+        'svg_complex': make_svg((1200, 600), 2000, rng),
+    }
+    if huge:
+        corpus['png_alpha_huge'] = make_png_alpha((6000, 4000), rng)
+    return corpus
+
+
+TEXTS = {
+    'text_single_line': 'Mon Entreprise',
+    'text_multi_line': 'Mon Entreprise\nConseil & Stratégie\nParis',
+}
+
+
+def build_cases(corpus, preview=False, profile=None):
+    """
+    Liste de (nom, fonction) ; chaque fonction fait un rendu complet en mémoire. Avec un
+    profil d'encodage, les noms sont suffixés par @profil et la carte n'est mesurée que
+    si le profil conserve la transparence.
+    """
+    cases = []
+    svg_available = svg_render.svg_available()
+    suffix = f"@{profile}" if profile else ''
+    with_card = profile is None or ENCODER_PROFILES[profile]['alpha']
+    options = dict(preview=preview, profile=profile)
+    for name, data in corpus.items():
+        if name.startswith('svg') and not svg_available:
+            continue
+        cases.append((f"logo/{name}{suffix}", lambda data=data: process_logo(io.BytesIO(data), None, **options)))
+        if with_card:
+            cases.append((f"card/{name}{suffix}", lambda data=data: process_card_logo(io.BytesIO(data), None, **options)))
+    for name, text in TEXTS.items():
+        cases.append((f"text/{name}{suffix}", lambda text=text: process_text_logo(text, None, **options)))
+    return cases
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def max_rss_bytes():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en kilo-octets sous Linux, en octets sous macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def run_case(name, render, repeat, warmup=1):
+    for _ in range(warmup):
+        render()
+    latencies = []
+    stages = {}
+    output_bytes = 0
+    for _ in range(repeat):
+        with recording() as recorder:
+            start = time.perf_counter()
+            data = render()
+            latencies.append(time.perf_counter() - start)
+        for stage_name, seconds in recorder.totals().items():
+            stages.setdefault(stage_name, []).append(seconds)
+        output_bytes = len(data) if isinstance(data, bytes) else 0
+        input_pixels = recorder.values.get('input_pixels', 0)
+
+    # Passe séparée pour la mémoire : tracemalloc ralentit le rendu
+    tracemalloc.start()
+    render()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = sum(latencies)
+    return {
+        'case': name,
+        'repeat': repeat,
+        'throughput_per_s': repeat / total if total else None,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'stages_p50_ms': {stage_name: percentile(values, 0.50) * 1000 for stage_name, values in stages.items()},
+        'input_pixels': input_pixels,
+        'output_bytes': output_bytes,
+        'tracemalloc_peak_bytes': traced_peak,
+        'max_rss_bytes': max_rss_bytes(),
+    }
+
+
+def run_load(clients, requests_count, corpus_name='jpeg_opaque', preview=True):
+    """
+    Charge concurrente sur /process_logo et /process_card via le client de test Flask.
+    Chaque requête a un décalage distinct pour ne pas être servie par le cache de rendus.
+    """
+    from app import app
+    data = build_corpus(huge=False)[corpus_name]
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def one(index):
+        client = app.test_client()
+        url = '/process_logo' if index % 2 == 0 else '/process_card'
+        form = {
+            'logo': (io.BytesIO(data), f'{corpus_name}.jpg'),
+            'horizontal_offset': str(-(index % 400)),
+            'vertical_offset': str(index // 400),
+            'stream': '1',
+        }
+        if preview:
+            form['preview'] = '1'
+        start = time.perf_counter()
+        response = client.post(url, data=form, content_type='multipart/form-data')
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(one, range(requests_count)))
+    wall = time.perf_counter() - start
+    return {
+        'case': f'load/{corpus_name}',
+        'clients': clients,
+        'requests': requests_count,
+        'errors': len(errors),
+        'throughput_per_s': requests_count / wall,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'max_rss_bytes': max_rss_bytes(),
+    }
+
+
+def compare(results, baseline):
+    """Affiche l'évolution de p50 et du pic mémoire par rapport à une exécution de référence."""
+    reference = {result['case']: result for result in baseline['results']}
+    for result in results:
+        base = reference.get(result['case'])
+        if not base:
+            continue
+        speedup = base['p50_ms'] / result['p50_ms'] if result['p50_ms'] else float('inf')
+        line = f"{result['case']:<32} p50 {base['p50_ms']:9.1f} -> {result['p50_ms']:9.1f} ms (x{speedup:.2f})"
+        if 'tracemalloc_peak_bytes' in result and 'tracemalloc_peak_bytes' in base:
+            line += f"  peak {base['tracemalloc_peak_bytes'] / 1e6:8.1f} -> {result['tracemalloc_peak_bytes'] / 1e6:8.1f} MB"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark des rendus de logo_processor")
+    parser.add_argument('--repeat', type=int, default=5, help="Rendus mesurés par cas")
+    parser.add_argument('--preview', action='store_true', help="Mesurer le mode aperçu")
+    parser.add_argument('--no-huge', action='store_true', help="Ignorer le PNG 6000x4000")
+    parser.add_argument('--filter', default='', help="Ne garder que les cas contenant cette chaîne")
+    parser.add_argument('--profile', action='append', choices=sorted(ENCODER_PROFILES),
+                        help="Profil d'encodage à mesurer (répétable ; par défaut celui de chaque rendu)")
+    parser.add_argument('--output', help="Fichier JSON des résultats")
+    parser.add_argument('--baseline', help="Fichier JSON de référence à comparer")
+    parser.add_argument('--load', action='store_true', help="Mode charge via le client de test Flask")
+    parser.add_argument('--clients', type=int, default=8, help="Clients concurrents (mode charge)")
+    parser.add_argument('--requests', type=int, default=64, help="Nombre de requêtes (mode charge)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.load:
+        results = [run_load(args.clients, args.requests, preview=args.preview)]
+    else:
+        results = []
+        corpus = build_corpus(huge=not args.no_huge)
+        cases = [case for profile in (args.profile or [None])
+                 for case in build_cases(corpus, preview=args.preview, profile=profile)]
+        for name, render in cases:
+            if args.filter not in name:
+                continue
+            result = run_case(name, render, args.repeat)
+            results.append(result)
+            print(f"{name:<32} p50 {result['p50_ms']:9.1f} ms  p95 {result['p95_ms']:9.1f} ms  "
+                  f"{result['throughput_per_s']:7.2f}/s  peak {result['tracemalloc_peak_bytes'] / 1e6:8.1f} MB  "
+                  f"encode {result['stages_p50_ms'].get('encode', 0):7.1f} ms  {result['output_bytes'] / 1e3:8.1f} kB")
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pillow': Image.__version__,
+        'cpu_count': os.cpu_count(),
+        'preview': args.preview,
+        'results': results,
+    }
+    if args.load:
+        print(json.dumps(results[0], indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Registre des modèles de carte bancaire.
+
+Chaque modèle nommé associe une image de carte à sa mise en page (marges et zone
+maximale du logo). Les images sont décodées et converties en RGBA une seule fois,
+au démarrage ou à la première utilisation, puis partagées : les rendus travaillent
+sur une copie, ce qui évite un décodage PNG à chaque ajustement. Une image remplacée sur
+disque (date de modification ou taille différente) est décodée à nouveau, et son empreinte
+(template_digest) entre dans la clé des rendus de carte.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from PIL import Image
+
+DEFAULT_TEMPLATE = 'default'
+
+# Mise en page par modèle : mêmes noms que les paramètres de process_card_logo
+CARD_TEMPLATES = {
+    DEFAULT_TEMPLATE: {
+        'card_template_path': 'static/card_template.png',
+        'top_margin': 35,
+        'right_margin': 35,
+        'max_width': 210,
+        'max_height': 100,
+    },
+}
+
+# (chemin, échelle) -> (signature du fichier, image) ; chemin -> (signature, empreinte)
+_images = {}
+_digests = {}
+_lock = threading.RLock()
+
+
+def register_card_template(name, path, top_margin=35, right_margin=35, max_width=210, max_height=100):
+    """Déclare (ou remplace) un modèle de carte nommé."""
+    CARD_TEMPLATES[name] = {
+        'card_template_path': path,
+        'top_margin': top_margin,
+        'right_margin': right_margin,
+        'max_width': max_width,
+        'max_height': max_height,
+    }
+
+
+def load_card_templates_config(config_path):
+    """
+    Charge des modèles supplémentaires depuis un fichier JSON de la forme
+    {"nom": {"path": "...", "top_margin": 35, "right_margin": 35, "max_width": 210, "max_height": 100}}
+    """
+    with open(config_path, encoding='utf-8') as f:
+        config = json.load(f)
+    for name, layout in config.items():
+        layout = dict(layout)
+        register_card_template(name, layout.pop('path'), **layout)
+
+
+def card_template_options(name=None):
+    """
+    Paramètres de process_card_logo / render_card_logo pour le modèle demandé.
+    Lève KeyError si le modèle est inconnu.
+    """
+    return dict(CARD_TEMPLATES[name or DEFAULT_TEMPLATE])
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def template_digest(path):
+    """
+    Empreinte SHA-256 de l'image du modèle (None si le fichier est absent), recalculée
+    seulement quand sa date de modification ou sa taille change.
+    """
+    try:
+        signature = _signature(path)
+    except FileNotFoundError:
+        return None
+    cached = _digests.get(path)
+    if cached is None or cached[0] != signature:
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        cached = _digests[path] = (signature, digest)
+    return cached[1]
+
+
+def get_card_image(path, scale=None):
+    """
+    Image RGBA du modèle, décodée une seule fois par version du fichier (éventuellement
+    réduite à l'échelle d'aperçu). L'image est partagée : en faire une copie avant d'y
+    coller un logo.
+    """
+    key = (path, scale)
+    signature = _signature(path)
+    cached = _images.get(key)
+    if cached is None or cached[0] != signature:
+        with _lock:
+            cached = _images.get(key)
+            if cached is None or cached[0] != signature:
+                if scale is None:
+                    image = Image.open(path).convert('RGBA')
+                else:
+                    full = get_card_image(path)
+                    size = (max(1, int(round(full.width * scale))), max(1, int(round(full.height * scale))))
+                    image = full.resize(size, Image.BILINEAR)
+                cached = _images[key] = (signature, image)
+    return cached[1]
+
+
+def preload_card_templates(scales=(None,)):
+    """Décode tous les modèles déclarés (au démarrage, avant de servir des requêtes)."""
+    for name, layout in CARD_TEMPLATES.items():
+        path = layout['card_template_path']
+        if not os.path.exists(path):
+            logging.warning(f"Card template '{name}' introuvable : {path}")
+            continue
+        for scale in scales:
+            get_card_image(path, scale)
@@ -0,0 +1,136 @@
+"""
+Moteur de détourage vectorisé.
+
+Toutes les étapes du détourage (contraste, autocontraste, seuil) ne dépendent que
+de la valeur du pixel en niveaux de gris : elles se composent en une seule table de
+correspondance (LUT) de 256 entrées, calculée à partir de l'histogramme puis appliquée
+en une passe NumPy sur un tableau uint8. Le résultat est identique, pixel pour pixel,
+à la chaîne PIL d'origine (ImageEnhance.Contrast -> ImageOps.autocontrast -> point).
+Les très grandes images sont traitées par bandes parallèles (voir tiling) : l'histogramme
+est la somme de ceux des bandes, la LUT est calculée une fois pour l'image entière.
+"""
+import numpy as np
+from PIL import Image
+
+import tiling
+
+CONTRAST_FACTOR = 1.2
+AUTOCONTRAST_CUTOFF = 2
+THRESHOLD = 245
+
+_RAMP = Image.frombytes('L', (256, 1), bytes(range(256)))
+
+
+def contrast_lut(histogram, factor=CONTRAST_FACTOR):
+    """LUT équivalente à ImageEnhance.Contrast(gray).enhance(factor) pour cet histogramme."""
+    histogram = np.asarray(histogram, dtype=np.float64)
+    count = histogram.sum()
+    mean = (np.arange(256) * histogram).sum() / count if count else 0.0
+    degenerate = Image.new('L', (256, 1), int(mean + 0.5))
+    # Image.blend sur une rampe 0..255 reproduit exactement l'arrondi de PIL
+    return np.frombuffer(Image.blend(degenerate, _RAMP, factor).tobytes(), dtype=np.uint8)
+
+
+def autocontrast_lut(histogram, cutoff=AUTOCONTRAST_CUTOFF):
+    """LUT équivalente à ImageOps.autocontrast(gray, cutoff) pour cet histogramme."""
+    h = [int(v) for v in histogram]
+    n = sum(h)
+    # Retirer cutoff% des pixels aux deux extrémités de l'histogramme
+    cut = int(n * cutoff // 100)
+    for lo in range(256):
+        if cut > h[lo]:
+            cut -= h[lo]
+            h[lo] = 0
+        else:
+            h[lo] -= cut
+            cut = 0
+        if cut <= 0:
+            break
+    cut = int(n * cutoff // 100)
+    for hi in range(255, -1, -1):
+        if cut > h[hi]:
+            cut -= h[hi]
+            h[hi] = 0
+        else:
+            h[hi] -= cut
+            cut = 0
+        if cut <= 0:
+            break
+    lo = next((i for i in range(256) if h[i]), 255)
+    hi = next((i for i in range(255, -1, -1) if h[i]), 0)
+    if hi <= lo:
+        return np.arange(256, dtype=np.uint8)
+    scale = 255.0 / (hi - lo)
+    offset = -lo * scale
+    return np.array([min(255, max(0, int(ix * scale + offset))) for ix in range(256)], dtype=np.uint8)
+
+
+def detour_lut(histogram, enhance=True):
+    """
+    LUT niveaux de gris -> alpha du détourage : les zones sombres (logo) deviennent
+    opaques (255), les zones claires (fond, >= THRESHOLD) transparentes (0).
+
+    Args:
+        histogram: Histogramme à 256 classes de l'image en niveaux de gris
+        enhance: Appliquer contraste et autocontraste avant le seuil (default: True)
+    """
+    lut = np.arange(256, dtype=np.uint8)
+    if enhance:
+        lut = contrast_lut(histogram)
+        # Histogramme de l'image contrastée, obtenu sans repasser sur les pixels
+        contrasted = np.bincount(lut, weights=histogram, minlength=256)
+        lut = autocontrast_lut(contrasted)[lut]
+    return np.where(lut < THRESHOLD, 255, 0).astype(np.uint8)
+
+
+def detour_mask(gray, enhance=True):
+    """
+    Calcule le masque alpha de détourage d'une image en niveaux de gris.
+
+    Args:
+        gray: Tableau uint8 (ou image 'L') des niveaux de gris
+        enhance: Appliquer contraste et autocontraste avant le seuil (default: True)
+    """
+    gray = np.asarray(gray, dtype=np.uint8)
+    histogram = np.bincount(gray.ravel(), minlength=256)
+    return detour_lut(histogram, enhance=enhance)[gray]
+
+
+def detour_image(img, enhance=True, keep_alpha=False):
+    """
+    Masque alpha de détourage (tableau uint8) d'une image RGB ou RGBA : niveaux de gris,
+    LUT de l'histogramme de l'image entière puis seuil, comme detour_mask. Les grandes
+    images sont traitées par bandes parallèles (voir tiling), avec le même résultat.
+
+    Args:
+        img: RGB or RGBA image
+        enhance: Appliquer contraste et autocontraste avant le seuil (default: True)
+        keep_alpha: Conserver la plus opaque des deux valeurs entre l'alpha de l'image et le détourage (default: False)
+    """
+    if not tiling.tiled(img.size):
+        mask = detour_mask(img.convert('L'), enhance=enhance)
+        if keep_alpha:
+            mask = np.maximum(np.asarray(img.getchannel('A')), mask)
+        return mask
+    img.load()
+    width, height = img.size
+    gray = np.empty((height, width), dtype=np.uint8)
+    mask = np.empty((height, width), dtype=np.uint8)
+
+    def to_gray(top, bottom):
+        strip = img.crop((0, top, width, bottom)).convert('L')
+        gray[top:bottom] = np.asarray(strip)
+        return strip.histogram()
+
+    # Première passe : niveaux de gris et histogramme global, la LUT en dépend
+    histogram = np.sum(tiling.map_strips(to_gray, img.size), axis=0)
+    lut = detour_lut(histogram, enhance=enhance)
+
+    def apply_lut(top, bottom):
+        np.take(lut, gray[top:bottom], out=mask[top:bottom])
+        if keep_alpha:
+            alpha = np.asarray(img.crop((0, top, width, bottom)).getchannel('A'))
+            np.maximum(alpha, mask[top:bottom], out=mask[top:bottom])
+
+    tiling.map_strips(apply_lut, img.size)
+    return mask
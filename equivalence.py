@@ -0,0 +1,472 @@
+"""
+Harnais d'équivalence entre le rendu de référence et une implémentation alternative.
+
+Le comportement de référence de process_logo / process_text_logo / process_card_logo (par
+défaut le code d'origine, voir BASELINE_REVISION) est figé une fois (record) : chaque cas
+d'un corpus généré localement (entrées de benchmark.py, plus des logos en aplat, en niveaux
+de gris, en PNG palette, L et LA et de tailles extrêmes) croisé avec un
+balayage de paramètres (décalages, scale_factor, modes override, aperçu, rognage,
+invert, SVG si cairosvg est disponible) est enregistré sans perte en PNG, avec sa durée
+et son pic mémoire. Une implémentation candidate (module exposant les trois fonctions
+avec les mêmes signatures) est ensuite comparée cas par cas : écarts de couleur et de
+transparence, dans les tolérances demandées, à côté de l'accélération et de l'écart de
+mémoire.
+
+    python equivalence.py record reference/
+    python equivalence.py compare --filter logo/png_ --max-diff 20 --output report.json
+    python equivalence.py compare reference/ --candidate fast_logo_processor
+    python equivalence.py compare reference/ --max-diff 2 --mean-diff 0.05 --output report.json
+    python equivalence.py compare frozen_logo_processor --candidate logo_processor --filter card/
+
+La référence de compare est un dossier enregistré par record, un module exécuté à côté
+du candidat (ex. une copie figée de logo_processor) ou git:RÉVISION, le logo_processor.py
+d'une révision du dépôt (par défaut de record et compare : git:BASELINE_REVISION, le code
+d'origine, et non le module courant qui ne pourrait que se confirmer lui-même). Les
+fonctions d'origine ne prennent que des chemins et écrivent un fichier encodé : l'image
+est capturée au moment de l'encodage, et les cas qui utilisent un paramètre inconnu de la
+révision (aperçu, rognage) sont ignorés. Un chemin rapide activé par une
+variable d'environnement se compare en enregistrant sans la variable puis en comparant
+avec. Les durées d'un dossier enregistré ne sont comparables que sur la même machine.
+Avec --encoded, le fichier encodé (profil par défaut) est décodé et comparé à la place de
+l'image, pour couvrir aussi les changements d'encodeur (prévoir une tolérance pour JPEG).
+Le code de sortie est 1 si un cas sort des tolérances.
+"""
+import argparse
+import contextlib
+import importlib
+import inspect
+import io
+import json
+import logging
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from benchmark import TEXTS, build_corpus
+from render_jobs import job_options
+import svg_render
+
+SEED = 4321
+
+# Révision du code d'origine, référence par défaut
+BASELINE_REVISION = 'b978ed1'
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Balayage des paramètres : nom de la variante, champs de render_jobs.job_options et
+# types de rendu concernés
+SWEEP = [
+    ('default', {}, ('logo', 'card', 'text')),
+    ('scale_min', {'scale_factor': 0.25}, ('logo', 'card', 'text')),
+    ('scale_max', {'scale_factor': 3.0}, ('logo', 'card', 'text')),
+    ('scale_max_override', {'scale_factor': 3.0, 'override': 'scale'}, ('logo', 'card', 'text')),
+    ('offset_clamped', {'horizontal_offset': 500, 'vertical_offset': 500}, ('logo', 'card', 'text')),
+    ('offset_override', {'horizontal_offset': -500, 'vertical_offset': -500, 'override': 'pos'}, ('logo', 'card', 'text')),
+    ('offset_fraction', {'horizontal_offset': 17.6, 'vertical_offset': -3.4, 'scale_factor': 1.15}, ('logo', 'card', 'text')),
+    ('preview', {'preview': True}, ('logo', 'card', 'text')),
+    ('trim', {'trim': True}, ('logo', 'card')),
+    ('invert', {'invert': True}, ('logo',)),
+]
+
+
+def make_flat_logo(size, rng):
+    """Logo noir sur fond blanc (aplat) : chemin le plus courant du détourage."""
+    img = Image.new('RGB', size, (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    width, height = size
+    for _ in range(12):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        draw.ellipse((x0, y0, x0 + rng.randrange(4, max(5, width // 3)), y0 + rng.randrange(4, max(5, height // 3))), fill=(0, 0, 0))
+    buffer = io.BytesIO()
+    img.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def make_tonal_logo(size):
+    """Dégradé en niveaux de gris avec marges : chemin tonal (netteté et contraste)."""
+    width, height = size
+    ramp = np.tile(np.linspace(0, 255, width - 40, dtype=np.uint8), (height - 40, 1))
+    img = Image.new('L', size, 255)
+    img.paste(Image.fromarray(ramp), (20, 20))
+    buffer = io.BytesIO()
+    img.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def make_mode_logo(size, mode, rng, transparent=False):
+    """
+    Logo en couleurs enregistré en PNG palette ('P'), niveaux de gris ('L') ou niveaux de
+    gris avec alpha ('LA') : convertis en RVB avant le détourage, ils ne suivent pas le
+    chemin des PNG RVB(A). transparent : couleur de fond transparente (palette).
+    """
+    img = Image.new('RGB', size, (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    width, height = size
+    for fill in ((30, 60, 120), (200, 40, 40), (90, 90, 90)):
+        x0, y0 = rng.randrange(width // 2), rng.randrange(height // 2)
+        draw.ellipse((x0, y0, x0 + width // 3, y0 + height // 3), fill=fill)
+    options = {}
+    if mode == 'P':
+        img = img.convert('P', palette=Image.ADAPTIVE, colors=16)
+        if transparent:
+            options['transparency'] = img.getpixel((0, 0))
+    else:
+        img = img.convert(mode)
+    buffer = io.BytesIO()
+    img.save(buffer, 'PNG', **options)
+    return buffer.getvalue()
+
+
+def build_equivalence_corpus():
+    """Entrées du benchmark (sans le très grand PNG) et cas limites, déterministes."""
+    rng = random.Random(SEED)
+    corpus = build_corpus(huge=False)
+    corpus['png_flat'] = make_flat_logo((900, 400), rng)
+    corpus['png_tonal'] = make_tonal_logo((640, 240))
+    corpus['png_palette'] = make_mode_logo((700, 300), 'P', rng)
+    corpus['png_palette_transparent'] = make_mode_logo((700, 300), 'P', rng, transparent=True)
+    corpus['png_gray'] = make_mode_logo((700, 300), 'L', rng)
+    corpus['png_gray_alpha'] = make_mode_logo((700, 300), 'LA', rng)
+    corpus['png_tiny'] = make_flat_logo((24, 12), rng)
+    corpus['png_tall'] = make_flat_logo((120, 1600), rng)
+    return corpus
+
+
+def build_cases(corpus):
+    """
+    Liste de (identifiant, type de rendu, source, is_svg, options) ; l'identifiant
+    'type/entrée/variante' est la clé de comparaison avec la référence.
+    """
+    svg_available = svg_render.svg_available()
+    if not svg_available:
+        logging.warning("cairosvg indisponible : cas SVG ignorés")
+    sources = [('logo', name, data) for name, data in corpus.items()
+               if svg_available or not name.startswith('svg')]
+    sources += [('card', name, data) for _, name, data in sources]
+    sources += [('text', name, text) for name, text in TEXTS.items()]
+    cases = []
+    for job_type, name, source in sources:
+        for variant, params, job_types in SWEEP:
+            if job_type in job_types:
+                cases.append((f"{job_type}/{name}/{variant}", job_type, source, name.startswith('svg'),
+                              job_options(job_type, params)))
+    return cases
+
+
+class Implementation:
+    """Module exposant process_logo, process_text_logo et process_card_logo."""
+
+    def __init__(self, module_name, encoded=False):
+        self.name = module_name
+        self.module = importlib.import_module(module_name)
+        self.encoded = encoded
+
+    def render(self, job_type, source, is_svg, options):
+        """Rendu d'un cas : image PIL (ou fichier encodé puis décodé avec encoded)."""
+        output = dict(output_path=None, as_image=not self.encoded)
+        if job_type == 'text':
+            result = self.module.process_text_logo(source, **output, **options)
+        elif job_type == 'card':
+            result = self.module.process_card_logo(io.BytesIO(source), is_svg=is_svg, **output, **options)
+        else:
+            result = self.module.process_logo(io.BytesIO(source), is_svg=is_svg, **output, **options)
+        if self.encoded:
+            result = Image.open(io.BytesIO(result))
+            result.load()
+        return result
+
+    def measure(self, case, repeat):
+        """Retourne (image, durée médiane en ms, pic tracemalloc en octets) d'un cas."""
+        _, job_type, source, is_svg, options = case
+        image = self.render(job_type, source, is_svg, options)  # échauffement
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            self.render(job_type, source, is_svg, options)
+            latencies.append(time.perf_counter() - start)
+        # Passe séparée pour la mémoire : tracemalloc ralentit le rendu
+        tracemalloc.start()
+        self.render(job_type, source, is_svg, options)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return image, statistics.median(latencies) * 1000, peak
+
+
+def load_revision(revision, module_name='logo_processor'):
+    """Module module_name.py tel qu'il était à une révision git du dépôt."""
+    source = subprocess.run(
+        ['git', 'show', f"{revision}:{module_name}.py"],
+        cwd=_BASE_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    module = types.ModuleType(f"{module_name}@{revision}")
+    module.__file__ = os.path.join(_BASE_DIR, f"{module_name}.py")
+    exec(compile(source, f"{revision}:{module_name}.py", 'exec'), module.__dict__)
+    return module
+
+
+@contextlib.contextmanager
+def captured_saves(target):
+    """Remplace l'enregistrement des images vers target par une copie gardée dans la liste produite."""
+    captured = []
+    original = Image.Image.save
+
+    def save(self, fp, *args, **kwargs):
+        if fp == target:
+            captured.append(self.copy())
+            return None
+        return original(self, fp, *args, **kwargs)
+
+    Image.Image.save = save
+    try:
+        yield captured
+    finally:
+        Image.Image.save = original
+
+
+class RevisionImplementation(Implementation):
+    """
+    logo_processor d'une révision git (git:RÉVISION), aux signatures d'origine : sources
+    écrites dans un fichier temporaire, image capturée au lieu d'être encodée (ou fichier
+    encodé relu avec encoded). render retourne None pour un cas hors de ses paramètres.
+    """
+
+    def __init__(self, revision, encoded=False):
+        self.name = f"git:{revision}"
+        self.module = load_revision(revision)
+        self.encoded = encoded
+        self._folder = tempfile.mkdtemp(prefix='equivalence-')
+
+    def render(self, job_type, source, is_svg, options):
+        options = {name: value for name, value in options.items() if name != 'profile'}
+        if options.pop('preview', False) or options.pop('trim', False):
+            return None
+        function = {'text': 'process_text_logo', 'card': 'process_card_logo'}.get(job_type, 'process_logo')
+        function = getattr(self.module, function)
+        if set(options) - set(inspect.signature(function).parameters):
+            return None
+        if job_type != 'text':
+            path = os.path.join(self._folder, 'source.svg' if is_svg else 'source.img')
+            with open(path, 'wb') as f:
+                f.write(source)
+            source = path
+        output_path = os.path.join(self._folder, 'output.png' if job_type == 'card' else 'output.jpg')
+        if self.encoded:
+            function(source, output_path, **options)
+            result = Image.open(output_path)
+            result.load()
+            return result
+        with captured_saves(output_path) as captured:
+            function(source, output_path, **options)
+        return captured[-1]
+
+    def measure(self, case, repeat):
+        _, job_type, source, is_svg, options = case
+        if self.render(job_type, source, is_svg, options) is None:
+            return None, None, None
+        return super().measure(case, repeat)
+
+
+def implementation(name, encoded=False):
+    """Module (nom importable) ou révision git ('git:RÉVISION') exposant les trois rendus."""
+    if name.startswith('git:'):
+        return RevisionImplementation(name[len('git:'):], encoded=encoded)
+    return Implementation(name, encoded=encoded)
+
+
+class RecordedReference:
+    """Référence enregistrée par record : images PNG et manifeste des mesures."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, 'manifest.json'), encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.name = f"{folder} ({self.manifest['module']})"
+        self.encoded = self.manifest['encoded']
+
+    def measure(self, case, repeat):
+        entry = self.manifest['cases'].get(case[0])
+        if entry is None:
+            return None, None, None
+        with Image.open(os.path.join(self.folder, entry['file'])) as image:
+            image.load()
+        return image, entry['ms'], entry['peak_bytes']
+
+
+def case_filename(case_id):
+    return case_id.replace('/', '__') + '.png'
+
+
+def image_diff(reference, candidate):
+    """
+    Écarts entre deux rendus : couleur (0-255, seulement là où l'un des deux est visible)
+    et transparence ; None si les tailles diffèrent.
+    """
+    if reference.size != candidate.size:
+        return None
+    ref = np.asarray(reference.convert('RGBA'), dtype=np.int16)
+    cand = np.asarray(candidate.convert('RGBA'), dtype=np.int16)
+    visible = (ref[..., 3] > 0) | (cand[..., 3] > 0)
+    color = np.abs(ref[..., :3] - cand[..., :3]).max(axis=2) * visible
+    alpha = np.abs(ref[..., 3] - cand[..., 3])
+    return {
+        'max_diff': int(color.max()),
+        'mean_diff': float(color.mean()),
+        'changed_pixels': float((color > 0).mean()),
+        'alpha_max_diff': int(alpha.max()),
+        'alpha_mean_diff': float(alpha.mean()),
+    }
+
+
+def within_tolerance(diff, args):
+    return (diff is not None
+            and diff['max_diff'] <= args.max_diff
+            and diff['mean_diff'] <= args.mean_diff
+            and diff['alpha_max_diff'] <= args.alpha_max_diff
+            and diff['alpha_mean_diff'] <= args.alpha_mean_diff)
+
+
+def record(args, cases):
+    recorded = implementation(args.module, encoded=args.encoded)
+    os.makedirs(args.folder, exist_ok=True)
+    entries = {}
+    for case in cases:
+        image, ms, peak = recorded.measure(case, args.repeat)
+        if image is None:
+            continue
+        filename = case_filename(case[0])
+        image.save(os.path.join(args.folder, filename), 'PNG', compress_level=1)
+        entries[case[0]] = {'file': filename, 'ms': ms, 'peak_bytes': peak}
+        print(f"{case[0]:<48} {ms:9.1f} ms  peak {peak / 1e6:8.1f} MB")
+    manifest = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pillow': Image.__version__,
+        'module': args.module,
+        'encoded': args.encoded,
+        'cases': entries,
+    }
+    with open(os.path.join(args.folder, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"{len(entries)} cas enregistrés dans {args.folder}", file=sys.stderr)
+    return 0
+
+
+def compare(args, cases):
+    if os.path.isdir(args.reference):
+        reference = RecordedReference(args.reference)
+    else:
+        reference = implementation(args.reference, encoded=args.encoded)
+    if reference.encoded != args.encoded:
+        raise SystemExit("La référence et la comparaison doivent utiliser le même mode --encoded")
+    candidate = implementation(args.candidate, encoded=args.encoded)
+    print(f"Référence : {reference.name}  Candidat : {candidate.name}", file=sys.stderr)
+
+    results = []
+    speedups = []
+    for case in cases:
+        ref_image, ref_ms, ref_peak = reference.measure(case, args.repeat)
+        if ref_image is None:
+            results.append({'case': case[0], 'status': 'skipped'})
+            continue
+        try:
+            image, ms, peak = candidate.measure(case, args.repeat)
+        except Exception as e:
+            results.append({'case': case[0], 'status': 'error', 'error': str(e) or type(e).__name__})
+            print(f"{case[0]:<48} ERREUR {str(e) or type(e).__name__}")
+            continue
+        diff = image_diff(ref_image, image)
+        status = 'ok' if within_tolerance(diff, args) else 'fail'
+        speedup = ref_ms / ms if ms else float('inf')
+        speedups.append(speedup)
+        results.append({
+            'case': case[0],
+            'status': status,
+            'size': list(image.size),
+            'reference_size': list(ref_image.size),
+            'diff': diff,
+            'reference_ms': ref_ms,
+            'candidate_ms': ms,
+            'speedup': speedup,
+            'reference_peak_bytes': ref_peak,
+            'candidate_peak_bytes': peak,
+            'peak_delta_bytes': peak - ref_peak,
+        })
+        if diff is None:
+            detail = f"taille {ref_image.size[0]}x{ref_image.size[1]} -> {image.size[0]}x{image.size[1]}"
+        else:
+            detail = (f"max {diff['max_diff']:3d}  moy {diff['mean_diff']:7.4f}  "
+                      f"alpha {diff['alpha_max_diff']:3d}/{diff['alpha_mean_diff']:7.4f}")
+        print(f"{case[0]:<48} {status.upper():<4} {detail}  "
+              f"{ref_ms:8.1f} -> {ms:8.1f} ms (x{speedup:.2f})  peak {(peak - ref_peak) / 1e6:+8.1f} MB")
+
+    counts = {status: sum(1 for result in results if result['status'] == status)
+              for status in ('ok', 'fail', 'error', 'skipped')}
+    # Moyenne géométrique : un cas deux fois plus lent compense un cas deux fois plus rapide
+    overall = math.exp(statistics.mean(math.log(s) for s in speedups)) if speedups else None
+    summary = ', '.join(f"{count} {status}" for status, count in counts.items())
+    if overall:
+        summary += f" ; accélération moyenne x{overall:.2f}"
+    print(summary, file=sys.stderr)
+
+    if args.output:
+        report = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'reference': reference.name,
+            'candidate': candidate.name,
+            'encoded': args.encoded,
+            'tolerances': {name: getattr(args, name) for name in ('max_diff', 'mean_diff', 'alpha_max_diff', 'alpha_mean_diff')},
+            'counts': counts,
+            'speedup_geomean': overall,
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 1 if counts['fail'] or counts['error'] else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Équivalence des rendus de logo_processor avec une référence figée")
+    parser.add_argument('--repeat', type=int, default=3, help="Rendus mesurés par cas")
+    parser.add_argument('--filter', default='', help="Ne garder que les cas contenant cette chaîne")
+    parser.add_argument('--encoded', action='store_true', help="Comparer les fichiers encodés décodés plutôt que les images")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help="Figer les rendus de référence dans un dossier")
+    record_parser.add_argument('folder', help="Dossier de la référence")
+    record_parser.add_argument('--module', default=f"git:{BASELINE_REVISION}",
+                               help="Module de référence, ou git:RÉVISION (par défaut : code d'origine)")
+
+    compare_parser = commands.add_parser('compare', help="Comparer un candidat à la référence")
+    compare_parser.add_argument('reference', nargs='?', default=f"git:{BASELINE_REVISION}",
+                                help="Dossier enregistré par record, module de référence ou git:RÉVISION "
+                                     "(par défaut : code d'origine)")
+    compare_parser.add_argument('--candidate', default='logo_processor', help="Module candidat")
+    compare_parser.add_argument('--max-diff', type=int, default=0, help="Écart de couleur maximal toléré (0-255)")
+    compare_parser.add_argument('--mean-diff', type=float, default=0.0, help="Écart de couleur moyen toléré")
+    compare_parser.add_argument('--alpha-max-diff', type=int, default=0, help="Écart de transparence maximal toléré (0-255)")
+    compare_parser.add_argument('--alpha-mean-diff', type=float, default=0.0, help="Écart de transparence moyen toléré")
+    compare_parser.add_argument('--output', help="Rapport JSON")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    cases = [case for case in build_cases(build_equivalence_corpus()) if args.filter in case[0]]
+    if args.command == 'record':
+        return record(args, cases)
+    return compare(args, cases)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
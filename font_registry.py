@@ -0,0 +1,106 @@
+"""
+Registre de polices partagé par le processus.
+
+La police est résolue une seule fois (chaîne de repli Manrope -> Arial -> Liberation
+Sans) et ses octets gardés en mémoire. Les faces FreeType sont conservées par taille
+dans un LRU et les boîtes englobantes de chaque ligne sont mémoïsées par (texte, taille),
+ce qui évite de relire le TTF et de recréer des images temporaires à chaque mesure.
+"""
+import functools
+import io
+import logging
+import os
+
+from PIL import Image, ImageDraw, ImageFont
+
+FONT_CANDIDATES = (
+    "fonts/Manrope-Regular.ttf",
+    "arial.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+)
+
+# Taille de référence pour l'estimation analytique de la taille de police
+REFERENCE_SIZE = 100
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Surface de mesure partagée : textbbox ne modifie pas l'image
+_MEASURE_DRAW = ImageDraw.Draw(Image.new('RGB', (1, 1), (255, 255, 255)))
+
+
+@functools.lru_cache(maxsize=1)
+def font_source():
+    """
+    Résout la police à utiliser et retourne (chemin, octets du fichier).
+    """
+    for candidate in FONT_CANDIDATES:
+        paths = [candidate]
+        if not os.path.isabs(candidate):
+            paths.append(os.path.join(_BASE_DIR, candidate))
+        for path in paths:
+            try:
+                # truetype résout aussi les noms relatifs dans les dossiers de polices système
+                font = ImageFont.truetype(path, 10)
+            except Exception:
+                continue
+            with open(font.path, 'rb') as f:
+                data = f.read()
+            logging.info(f"Font path used: {font.path}")
+            return font.path, data
+    raise RuntimeError("Aucune police TTF trouvée sur le système. Placez fonts/Manrope-Regular.ttf, arial.ttf ou LiberationSans-Regular.ttf.")
+
+
+@functools.lru_cache(maxsize=64)
+def get_font(size):
+    """Face FreeType de la police résolue, à la taille demandée."""
+    _, data = font_source()
+    return ImageFont.truetype(io.BytesIO(data), size)
+
+
+@functools.lru_cache(maxsize=4096)
+def line_bbox(line, size):
+    """Boîte englobante d'une ligne de texte à la taille demandée."""
+    return _MEASURE_DRAW.textbbox((0, 0), line, font=get_font(size))
+
+
+def measure_lines(lines, size):
+    """
+    Mesure un bloc de texte multiligne.
+    Retourne (largeur max, hauteur totale avec interligne, bboxes, hauteurs, interligne).
+    """
+    line_bboxes = [line_bbox(line, size) for line in lines]
+    line_heights = [bbox[3] - bbox[1] for bbox in line_bboxes]
+    max_line_width = max((bbox[2] - bbox[0] for bbox in line_bboxes), default=0)
+    line_spacing = int(max(line_heights) * 0.3) if line_heights else 0
+    total_height = sum(line_heights) + line_spacing * (len(lines) - 1)
+    return max_line_width, total_height, line_bboxes, line_heights, line_spacing
+
+
+def fit_font_size(lines, max_width, max_height, margin, min_size=10, max_size=1000):
+    """
+    Plus grande taille de police (entre min_size et max_size) pour laquelle le bloc,
+    marges comprises, tient dans max_width × max_height.
+
+    Les dimensions du texte étant quasi proportionnelles à la taille, on mesure une
+    fois à REFERENCE_SIZE, on extrapole, puis on vérifie autour de l'estimation :
+    quelques mesures au lieu d'une dizaine de sondages dichotomiques.
+    """
+    def fits(size):
+        width, height = measure_lines(lines, size)[:2]
+        return width + 2 * margin <= max_width and height + 2 * margin <= max_height
+
+    ref_width, ref_height = measure_lines(lines, REFERENCE_SIZE)[:2]
+    ratios = []
+    if ref_width:
+        ratios.append((max_width - 2 * margin) / ref_width)
+    if ref_height:
+        ratios.append((max_height - 2 * margin) / ref_height)
+    estimate = int(REFERENCE_SIZE * min(ratios)) if ratios else max_size
+    size = max(min_size, min(max_size, estimate))
+
+    # Sondages de vérification : redescendre tant que ça déborde, monter tant que ça tient
+    while size > min_size and not fits(size):
+        size -= 1
+    while size < max_size and fits(size + 1):
+        size += 1
+    return size
@@ -0,0 +1,44 @@
+"""
+Configuration gunicorn de production : gunicorn -c gunicorn.conf.py
+
+L'application est chargée une fois dans le processus maître (preload_app) : police,
+modèles de carte, encodeurs et rendu de chauffe (app.preload) sont faits avant le fork
+et partagés par copie sur écriture entre les workers. Chaque worker lance ensuite ses
+propres threads (app.init_worker) et journalise son démarrage à froid ; la durée de sa
+première requête est journalisée et exportée dans /metrics (logo_startup_seconds).
+
+Variables d'environnement : BIND (ou PORT), WEB_CONCURRENCY (par défaut : nombre de CPU),
+GUNICORN_THREADS, GUNICORN_TIMEOUT, LOG_LEVEL.
+"""
+import os
+import time
+
+wsgi_app = 'app:create_app()'
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '5050')}")
+preload_app = True
+
+# Workers threadés : les aperçus en direct gardent une connexion SSE ouverte par onglet (de
+# durée bornée), et Pillow/NumPy relâchent le GIL pendant les rendus. Un worker par CPU : les
+# canaux d'aperçu et les statuts des tâches asynchrones sont partagés entre workers par fichiers
+# (LIVE_STATE_DIR, JOB_STATE_DIR), les logos téléversés par LOGO_CACHE_DIR.
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+if workers > 1:
+    # Handles valables quel que soit le worker qui reçoit l'ajustement (lu par app au chargement)
+    os.environ.setdefault('LOGO_CACHE_DIR', os.path.join('processed', '.logos'))
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))  # secondes
+keepalive = 5
+
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    # Point de départ du démarrage à froid du worker
+    worker.started = time.perf_counter()
+
+
+def post_worker_init(worker):
+    from app import init_worker
+    init_worker(worker.started)
@@ -0,0 +1,229 @@
+"""
+File de rendus asynchrones.
+
+Une requête en mode asynchrone ne bloque plus son thread pendant le rendu : le travail
+est placé dans une file bornée, consommée par un petit pool de threads du processus
+(Pillow et NumPy relâchent le GIL pendant les calculs), et la requête répond aussitôt
+avec un identifiant de tâche. Le client interroge ensuite le statut (éventuellement
+en attente longue) puis récupère le résultat. Les tâches terminées sont conservées
+pendant result_ttl secondes. Quand la file est pleine, submit() lève QueueFull avec
+une estimation du délai avant de réessayer.
+
+Avec state_dir, le statut de chaque tâche est aussi écrit dans un fichier partagé entre
+processus : le client peut interroger un autre worker que celui qui a reçu la tâche.
+"""
+import json
+import logging
+import math
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+
+_JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class QueueFull(Exception):
+    """File pleine ; retry_after donne le délai conseillé avant de réessayer, en secondes."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"File de rendu pleine, réessayer dans {retry_after} s")
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, job_id, work):
+        self.id = job_id
+        self.work = work
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        data = {'job_id': self.id, 'status': self.status}
+        if self.status == 'done':
+            data['result'] = self.result
+        elif self.status == 'failed':
+            data['error'] = self.error
+        return data
+
+
+class JobQueue:
+    """
+    File bornée de rendus, consommée par des threads du processus.
+
+    Args:
+        workers: Nombre de threads de rendu (default: 2)
+        max_pending: Nombre maximal de tâches en attente (default: 16)
+        result_ttl: Durée de conservation d'une tâche terminée, en secondes (default: 600)
+        state_dir: Dossier partagé entre processus des statuts (default: None, statuts en mémoire)
+        poll_interval: Intervalle de relecture d'un statut partagé en attente longue, en secondes (default: 0.2)
+    """
+
+    def __init__(self, workers=2, max_pending=16, result_ttl=600, state_dir=None, poll_interval=0.2):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.state_dir = state_dir
+        self.poll_interval = poll_interval
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        self._last_sweep = time.time()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        # Durée moyenne (lissée) d'un rendu, pour estimer Retry-After
+        self._average_seconds = 1.0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        """Lance les threads de rendu (une seule fois par processus)."""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"render-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, work):
+        """
+        Place work() dans la file et retourne la tâche. Le résultat de work() doit être
+        sérialisable en JSON. Lève QueueFull si la file est pleine.
+        """
+        self.start()
+        self._purge()
+        job = Job(uuid.uuid4().hex, work)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+                self.rejected += 1
+            raise QueueFull(self.retry_after())
+        self._save(job)
+        return job
+
+    def get(self, job_id, wait=0):
+        """
+        Retourne la tâche (None si inconnue ou expirée), en attendant au plus wait
+        secondes qu'elle se termine (attente longue). Une tâche d'un autre processus est
+        relue dans state_dir.
+        """
+        self._purge()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            if wait > 0:
+                job.done.wait(wait)
+            return job
+        job = self._load(job_id)
+        deadline = time.monotonic() + wait
+        while job is not None and job.status not in ('done', 'failed') and time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            job = self._load(job_id) or job
+        return job
+
+    def _state_path(self, job_id):
+        return os.path.join(self.state_dir, f"{job_id}.json")
+
+    def _save(self, job):
+        """Écrit le statut partagé de la tâche (renommage atomique)."""
+        if not self.state_dir:
+            return
+        path = self._state_path(job.id)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(dict(job.to_dict(), finished=job.finished), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.error(f"Render job {job.id}: statut non partagé ({str(e)})")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _load(self, job_id):
+        """Tâche reconstituée depuis son statut partagé, ou None si inconnue ou expirée."""
+        if not self.state_dir or not _JOB_ID_RE.match(job_id):
+            return None
+        try:
+            with open(self._state_path(job_id)) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        job = Job(job_id, None)
+        job.status = data['status']
+        job.result = data.get('result')
+        job.error = data.get('error')
+        job.finished = data.get('finished')
+        if job.finished:
+            job.done.set()
+        return job
+
+    def retry_after(self):
+        """Délai estimé (secondes, entier) avant qu'une place se libère dans la file."""
+        backlog = self._queue.qsize() + self.workers
+        return max(1, math.ceil(self._average_seconds * backlog / self.workers))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': self._queue.qsize(),
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+            }
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            job.status = 'running'
+            self._save(job)
+            start = time.perf_counter()
+            try:
+                job.result = job.work()
+                job.status = 'done'
+            except Exception as e:
+                logging.error(f"Render job {job.id} failed: {str(e)}")
+                job.error = str(e)
+                job.status = 'failed'
+            elapsed = time.perf_counter() - start
+            job.work = None
+            job.finished = time.time()
+            with self._lock:
+                self._average_seconds = 0.8 * self._average_seconds + 0.2 * elapsed
+                if job.status == 'done':
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            self._save(job)
+            job.done.set()
+
+    def _purge(self):
+        """Oublie les tâches terminées depuis plus de result_ttl secondes."""
+        limit = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished < limit]
+            for job_id in expired:
+                del self._jobs[job_id]
+            sweep = self.state_dir and time.time() - self._last_sweep > self.result_ttl / 10
+            if sweep:
+                self._last_sweep = time.time()
+        if sweep:
+            # Statuts partagés de tous les processus : aucune tâche ne reste en file result_ttl secondes
+            for entry in os.scandir(self.state_dir):
+                try:
+                    if entry.stat().st_mtime < limit:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,303 @@
+"""
+Canal d'aperçu en direct, un par onglet.
+
+Le client envoie ses réglages (POST) à chaque mouvement de curseur et reçoit les
+aperçus par Server-Sent Events. Par canal, seule la demande la plus récente est
+conservée : une demande encore en attente est remplacée, et un rendu en cours
+s'interrompt à la prochaine limite d'étape (timing.stage) dès qu'une demande plus
+récente arrive. Le travail serveur reste ainsi borné à un rendu par utilisateur.
+
+Chaque connexion SSE occupe un thread de son worker : un flux se termine après
+stream_lifetime secondes et le client (EventSource) se reconnecte de lui-même en
+reprenant au dernier aperçu reçu (Last-Event-ID). Au-delà de max_streams flux ouverts
+dans un processus, un nouveau flux livre le dernier aperçu puis se ferme aussitôt en
+demandant une reconnexion plus tardive : les threads restants servent les autres requêtes.
+
+Avec state_dir, la dernière demande et le dernier aperçu de chaque canal sont partagés
+entre les processus par des fichiers : la demande et le flux d'un même canal peuvent
+arriver à des workers différents (le flux relit l'aperçu publié toutes les poll_interval
+secondes). Sans state_dir, les canaux ne vivent que dans la mémoire du processus.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from timing import RenderCancelled, StageRecorder, metrics, recording
+
+try:
+    import fcntl
+except ImportError:
+    # Pas de flock (Windows) : deux demandes simultanées d'un canal peuvent recevoir le même numéro
+    fcntl = None
+
+_CHANNEL_RE = re.compile(r'^[0-9a-f]{16,64}$')
+
+
+def is_valid_channel(channel_id):
+    return bool(channel_id) and bool(_CHANNEL_RE.match(channel_id))
+
+
+class LiveChannel:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.seq = 0            # numéro de la dernière demande reçue
+        self.pending = None     # (seq, work) en attente de rendu
+        self.rendering = False
+        self.result = None      # dernier aperçu publié
+        self.subscribers = 0
+        self.last_active = time.time()
+
+
+class LivePreviewHub:
+    """
+    Canaux d'aperçu en direct et pool de threads qui les sert.
+
+    Args:
+        workers: Nombre de rendus simultanés, tous canaux confondus (default: 4)
+        idle_timeout: Durée après laquelle un canal sans abonné ni demande est oublié, en secondes (default: 600)
+        max_streams: Nombre maximal de flux SSE ouverts dans le processus (default: 8)
+        stream_lifetime: Durée d'un flux SSE avant reconnexion du client, en secondes (default: 30)
+        state_dir: Dossier partagé entre processus des canaux (default: None, canaux en mémoire)
+        poll_interval: Intervalle de relecture de l'aperçu partagé, en secondes (default: 0.1)
+    """
+
+    def __init__(self, workers=4, idle_timeout=600, max_streams=8, stream_lifetime=30, state_dir=None, poll_interval=0.1):
+        self.idle_timeout = idle_timeout
+        self.max_streams = max_streams
+        self.stream_lifetime = stream_lifetime
+        self.state_dir = state_dir
+        self.poll_interval = poll_interval
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='live-preview')
+        self._channels = {}
+        self._lock = threading.Lock()
+        self._streams = 0
+        self._last_sweep = time.time()
+        self.rendered = 0
+        self.dropped = 0
+        self.cancelled = 0
+        self.refused = 0
+
+    def channel(self, channel_id):
+        with self._lock:
+            self._purge()
+            channel = self._channels.get(channel_id)
+            if channel is None:
+                channel = self._channels[channel_id] = LiveChannel()
+            return channel
+
+    def request(self, channel_id, work):
+        """
+        Remplace la demande en attente du canal par work() et retourne son numéro.
+        work() retourne un dict JSON publié tel quel (avec 'seq' et 'success').
+        """
+        channel = self.channel(channel_id)
+        seq = self._next_seq(channel_id, channel)
+        with channel.cond:
+            channel.seq = max(channel.seq, seq)
+            if channel.pending is not None:
+                self._count('dropped')
+            channel.pending = (seq, work)
+            channel.last_active = time.time()
+            start = not channel.rendering
+            channel.rendering = True
+        if start:
+            self._executor.submit(self._drain, channel_id, channel)
+        return seq
+
+    def _next_seq(self, channel_id, channel):
+        """
+        Numéro de la nouvelle demande : croissant par canal, entre processus avec state_dir.
+        Dérivé de l'horloge (ms) pour rester croissant après l'oubli d'un canal inactif.
+        """
+        now = int(time.time() * 1000)
+        if not self.state_dir:
+            with channel.cond:
+                channel.seq = max(channel.seq + 1, now)
+                return channel.seq
+        with open(self._state_path(channel_id, 'seq'), 'a+') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            previous = f.read().strip()
+            seq = max(int(previous) + 1 if previous else 0, now)
+            f.seek(0)
+            f.truncate()
+            f.write(str(seq))
+            f.flush()
+        return seq
+
+    def _latest_seq(self, channel_id, channel):
+        """Numéro de la demande la plus récente du canal, tous processus confondus."""
+        if self.state_dir:
+            try:
+                with open(self._state_path(channel_id, 'seq')) as f:
+                    return int(f.read().strip() or 0)
+            except (FileNotFoundError, ValueError):
+                pass
+        return channel.seq
+
+    def _state_path(self, channel_id, kind):
+        return os.path.join(self.state_dir, f"{channel_id}.{kind}")
+
+    def _drain(self, channel_id, channel):
+        """Rend les demandes du canal, toujours la plus récente, jusqu'à ce qu'il n'y en ait plus."""
+        while True:
+            with channel.cond:
+                if channel.pending is None:
+                    channel.rendering = False
+                    return
+                seq, work = channel.pending
+                channel.pending = None
+            recorder = StageRecorder(should_cancel=lambda: self._latest_seq(channel_id, channel) != seq)
+            start = time.perf_counter()
+            try:
+                with recording(recorder):
+                    result = dict(work(), success=True)
+            except RenderCancelled as e:
+                self._count('cancelled')
+                logging.debug(f"Live preview {seq} superseded before stage {e}")
+                continue
+            except Exception as e:
+                logging.error(f"Live preview error: {str(e)}")
+                result = {'success': False, 'error': str(e)}
+            self._count('rendered')
+            metrics.observe_request('live_preview', recorder, time.perf_counter() - start)
+            if self._latest_seq(channel_id, channel) != seq:
+                # Une demande plus récente est déjà arrivée (dans ce processus ou un autre) : aperçu périmé
+                self._count('dropped')
+                continue
+            result = dict(result, seq=seq)
+            if self.state_dir:
+                self._publish(channel_id, result)
+            with channel.cond:
+                channel.result = result
+                channel.cond.notify_all()
+
+    def _publish(self, channel_id, result):
+        """Écrit l'aperçu partagé du canal (renommage atomique, jamais lu à moitié écrit)."""
+        path = self._state_path(channel_id, 'json')
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(result, f)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _shared_result(self, channel_id, known):
+        """
+        Aperçu partagé du canal s'il a changé depuis known (signature du fichier) :
+        retourne (aperçu ou None, signature).
+        """
+        try:
+            with open(self._state_path(channel_id, 'json')) as f:
+                stat = os.fstat(f.fileno())
+                signature = (stat.st_ino, stat.st_mtime_ns)
+                if signature == known:
+                    return None, known
+                return json.load(f), signature
+        except (FileNotFoundError, ValueError):
+            return None, known
+
+    def events(self, channel_id, last_seq=0, heartbeat=15):
+        """
+        Flux Server-Sent Events des aperçus du canal (événement 'preview', JSON) postérieurs à
+        last_seq, fermé après stream_lifetime secondes ou aussitôt si max_streams est atteint.
+        """
+        channel = self.channel(channel_id)
+        with self._lock:
+            accepted = self._streams < self.max_streams
+            if accepted:
+                self._streams += 1
+            else:
+                self.refused += 1
+        if not accepted:
+            # Trop de flux ouverts : dernier aperçu éventuel, puis reconnexion plus tardive
+            yield f"retry: {int(self.stream_lifetime * 1000 / 3)}\n\n"
+            result = self._latest_result(channel_id, channel, None)[0]
+            if result is not None and result['seq'] > last_seq:
+                yield self._event(result)
+            return
+        with channel.cond:
+            channel.subscribers += 1
+        deadline = time.monotonic() + self.stream_lifetime
+        next_ping = time.monotonic() + heartbeat
+        signature = None
+        try:
+            yield 'retry: 500\n\n'
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # Fin du flux : le client se reconnecte avec Last-Event-ID
+                    return
+                wait = min(remaining, heartbeat, self.poll_interval if self.state_dir else heartbeat)
+                with channel.cond:
+                    channel.cond.wait_for(
+                        lambda: channel.result is not None and channel.result['seq'] > last_seq,
+                        timeout=wait
+                    )
+                    channel.last_active = time.time()
+                result, signature = self._latest_result(channel_id, channel, signature)
+                if result is not None and result['seq'] > last_seq:
+                    last_seq = result['seq']
+                    next_ping = time.monotonic() + heartbeat
+                    yield self._event(result)
+                elif time.monotonic() >= next_ping:
+                    # Commentaire SSE : garde la connexion ouverte et détecte les clients partis
+                    next_ping = time.monotonic() + heartbeat
+                    yield ': ping\n\n'
+        finally:
+            with channel.cond:
+                channel.subscribers -= 1
+                channel.last_active = time.time()
+            with self._lock:
+                self._streams -= 1
+
+    def _latest_result(self, channel_id, channel, signature):
+        """Aperçu le plus récent du canal, publié par ce processus ou un autre : (aperçu, signature)."""
+        with channel.cond:
+            result = channel.result
+        if self.state_dir:
+            shared, signature = self._shared_result(channel_id, signature)
+            if shared is not None and (result is None or shared['seq'] > result['seq']):
+                result = shared
+        return result, signature
+
+    @staticmethod
+    def _event(result):
+        return f"event: preview\nid: {result['seq']}\ndata: {json.dumps(result)}\n\n"
+
+    def stats(self):
+        with self._lock:
+            return {'rendered': self.rendered, 'dropped': self.dropped, 'cancelled': self.cancelled, 'refused': self.refused}
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _purge(self):
+        limit = time.time() - self.idle_timeout
+        idle = [
+            channel_id for channel_id, channel in self._channels.items()
+            if not channel.subscribers and not channel.rendering and channel.last_active < limit
+        ]
+        for channel_id in idle:
+            del self._channels[channel_id]
+        if self.state_dir and time.time() - self._last_sweep > self.idle_timeout / 10:
+            # Fichiers des canaux inactifs dans tous les processus (numéros de demande dérivés de
+            # l'horloge : un canal oublié puis repris reste croissant)
+            self._last_sweep = time.time()
+            for entry in os.scandir(self.state_dir):
+                try:
+                    if entry.stat().st_mtime < limit:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
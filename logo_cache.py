@@ -0,0 +1,230 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageColor
+from PIL.PngImagePlugin import PngInfo
+
+from logo_processor import LogoMask, prepare_logo, prepare_card_logo
+from render_cache import CACHE_VERSION
+from svg_render import parse_svg
+
+# Préparations disponibles pour un logo téléversé : canevas (noir ou blanc) ou carte (blanc),
+# avec ou sans rognage des marges (voir logo_processor.trimmed_preparation) ; la carte d'un
+# modèle à une autre zone a sa propre préparation (voir preparer)
+PREPARERS = {
+    'logo': lambda source, is_svg: prepare_logo(source, is_svg=is_svg),
+    'logo_inverted': lambda source, is_svg: prepare_logo(source, invert=True, is_svg=is_svg),
+    'card': lambda source, is_svg: prepare_card_logo(source, is_svg=is_svg),
+    'logo_trimmed': lambda source, is_svg: prepare_logo(source, is_svg=is_svg, trim=True),
+    'logo_inverted_trimmed': lambda source, is_svg: prepare_logo(source, invert=True, is_svg=is_svg, trim=True),
+    'card_trimmed': lambda source, is_svg: prepare_card_logo(source, is_svg=is_svg, trim=True),
+}
+
+_HANDLE_RE = re.compile(r'^[0-9a-f]{32}$')
+_CARD_BOX_RE = re.compile(r'^card_(\d+)x(\d+)(_trimmed)?$')
+
+
+def preparer(kind):
+    """
+    Fonction de préparation (source, is_svg) -> LogoMask : celles de PREPARERS, ou la carte
+    d'une zone donnée ('card_600x300', voir logo_processor.card_preparation), la source étant
+    réduite d'après cette zone comme dans process_card_logo. Lève KeyError si kind est inconnu.
+    """
+    if kind in PREPARERS:
+        return PREPARERS[kind]
+    match = _CARD_BOX_RE.match(kind)
+    if match is None:
+        raise KeyError(kind)
+    fit_box = (int(match[1]), int(match[2]))
+    trim = bool(match[3])
+    return lambda source, is_svg: prepare_card_logo(source, is_svg=is_svg, fit_box=fit_box, trim=trim)
+
+
+def compute_handle(data):
+    """Identifiant stable d'un logo : empreinte SHA-256 tronquée de son contenu."""
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def is_valid_handle(handle):
+    return bool(handle) and bool(_HANDLE_RE.match(handle))
+
+
+class LogoCache:
+    """
+    Cache LRU borné des logos téléversés.
+
+    Chaque handle (empreinte du contenu) référence les octets source et, une fois
+    calculés, les logos détourés (LogoMask) par préparation (voir preparer). Les
+    ajustements de position/taille n'ont alors plus qu'à redimensionner et coller.
+
+    Args:
+        max_entries: Nombre maximal de logos gardés en mémoire (default: 32)
+        disk_dir: Dossier de second niveau, partagé entre workers (default: None)
+        max_disk_entries: Nombre maximal de logos gardés sur disque (default: 256)
+    """
+
+    def __init__(self, max_entries=32, disk_dir=None, max_disk_entries=256):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._lock = threading.Lock()
+        # handle -> {'data': bytes, 'filename': str, 'prepared': {kind: LogoMask}}
+        self._entries = OrderedDict()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def add(self, data, filename):
+        """Enregistre un logo téléversé et retourne son handle."""
+        handle = compute_handle(data)
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None:
+                self._entries[handle] = {'data': data, 'filename': filename, 'prepared': {}}
+                self._evict()
+            else:
+                self._entries.move_to_end(handle)
+        if self.disk_dir:
+            self._write_source(handle, data, filename)
+        return handle
+
+    def filename(self, handle):
+        entry = self._get_entry(handle)
+        return entry['filename'] if entry else None
+
+    def __contains__(self, handle):
+        return self._get_entry(handle) is not None
+
+    def get_prepared(self, handle, kind):
+        """
+        Retourne le logo détouré pour la préparation demandée, en le calculant au
+        premier appel. Retourne None si le handle est inconnu ou a été évincé.
+        """
+        entry = self._get_entry(handle)
+        if entry is None:
+            return None
+        prepared = entry['prepared'].get(kind)
+        if prepared is None and self.disk_dir:
+            prepared = self._read_prepared(handle, kind)
+        if prepared is None:
+            is_svg = entry['filename'].lower().endswith('.svg')
+            prepared = preparer(kind)(io.BytesIO(entry['data']), is_svg)
+            if self.disk_dir:
+                self._write_prepared(handle, kind, prepared)
+        with self._lock:
+            entry['prepared'][kind] = prepared
+        # Le logo préparé est partagé : les appelants ne doivent pas le modifier
+        return prepared
+
+    def get_svg(self, handle):
+        """
+        Retourne le document SVG analysé du logo (voir svg_render.parse_svg), dessiné
+        ensuite directement à la taille voulue. Retourne None si le handle est inconnu.
+        """
+        entry = self._get_entry(handle)
+        if entry is None:
+            return None
+        return parse_svg(entry['data'])
+
+    def is_svg(self, handle):
+        filename = self.filename(handle)
+        return bool(filename) and filename.lower().endswith('.svg')
+
+    def _get_entry(self, handle):
+        if not is_valid_handle(handle):
+            return None
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is not None:
+                self._entries.move_to_end(handle)
+                return entry
+        if not self.disk_dir:
+            return None
+        entry = self._read_source(handle)
+        if entry is None:
+            return None
+        with self._lock:
+            self._entries[handle] = entry
+            self._evict()
+        return entry
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            handle, _ = self._entries.popitem(last=False)
+            logging.debug(f"Logo {handle} évincé du cache mémoire")
+
+    # --- Niveau disque ---
+
+    def _source_path(self, handle, filename):
+        ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else 'bin'
+        return os.path.join(self.disk_dir, f"{handle}.src.{ext}")
+
+    def _prepared_path(self, handle, kind):
+        return os.path.join(self.disk_dir, f"{handle}.{kind}.mask.png")
+
+    def _write_source(self, handle, data, filename):
+        path = self._source_path(handle, filename)
+        if os.path.exists(path):
+            os.utime(path)
+            return
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._evict_disk()
+
+    def _read_source(self, handle):
+        for name in os.listdir(self.disk_dir):
+            if name.startswith(f"{handle}.src."):
+                path = os.path.join(self.disk_dir, name)
+                with open(path, 'rb') as f:
+                    data = f.read()
+                os.utime(path)
+                ext = name.rsplit('.', 1)[-1]
+                return {'data': data, 'filename': f"{handle}.{ext}", 'prepared': {}}
+        return None
+
+    def _write_prepared(self, handle, kind, prepared):
+        path = self._prepared_path(handle, kind)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        # Masque en PNG 'L' à compression rapide (sans perte, peu coûteux à écrire) ;
+        # couleur de remplissage, nature du masque et version du rendu en métadonnées
+        info = PngInfo()
+        info.add_text('version', str(CACHE_VERSION))
+        info.add_text('fill', '#%02x%02x%02x' % prepared.color)
+        info.add_text('tonal', '1' if prepared.tonal else '0')
+        prepared.mask.save(tmp_path, 'PNG', compress_level=1, pnginfo=info)
+        os.replace(tmp_path, path)
+
+    def _read_prepared(self, handle, kind):
+        path = self._prepared_path(handle, kind)
+        if not os.path.exists(path):
+            return None
+        mask = Image.open(path)
+        mask.load()
+        if mask.mode != 'L' or 'fill' not in mask.info:
+            return None
+        if mask.info.get('version') != str(CACHE_VERSION):
+            # Préparé par une version dont le rendu diffère : à refaire
+            return None
+        return LogoMask(mask, ImageColor.getrgb(mask.info['fill']), tonal=mask.info.get('tonal') == '1')
+
+    def _evict_disk(self):
+        sources = []
+        for name in os.listdir(self.disk_dir):
+            if '.src.' in name and not name.endswith('.tmp'):
+                path = os.path.join(self.disk_dir, name)
+                sources.append((os.path.getmtime(path), name))
+        sources.sort()
+        for _, name in sources[:max(0, len(sources) - self.max_disk_entries)]:
+            handle = name.split('.', 1)[0]
+            for other in os.listdir(self.disk_dir):
+                if other.startswith(f"{handle}."):
+                    try:
+                        os.remove(os.path.join(self.disk_dir, other))
+                    except OSError:
+                        pass
@@ -1,15 +1,105 @@
 from PIL import Image, ImageOps, ImageFilter, ImageDraw, ImageFont, ImageEnhance
 import logging
+import math
 import os
 import io
 import textwrap
 import io as _io
-try:
-    import cairosvg
-except Exception:
-    cairosvg = None
+from detouring import detour_image, detour_lut
+from font_registry import fit_font_size, get_font, measure_lines
+from card_templates import get_card_image
+from timing import annotate, record, stage
+from tiling import convert_image, reduce_image
+from svg_render import load_cairosvg, parse_svg
 
-def process_logo(input_path, output_path, top_margin=73, right_margin=73, scale_factor=1.0, invert=False, horizontal_offset=0, vertical_offset=0, override_limits=False):
+# Échelle des aperçus interactifs (la géométrie est calculée en pleine résolution puis réduite)
+PREVIEW_SCALE = 0.25
+CARD_PREVIEW_SCALE = 0.5
+
+# Canevas d'impression du logo
+CANVAS_SIZE = (2024, 1276)
+
+# Zones maximales du logo (canevas et carte par défaut) et facteur d'échelle maximal du curseur :
+# au-delà de REDUCE_GAP × la plus grande taille de sortie possible, la source est réduite avant le détourage
+LOGO_FIT_BOX = (613, 283)
+CARD_FIT_BOX = (210, 100)
+MAX_SCALE_FACTOR = 3.0
+REDUCE_GAP = 2.0
+# Pré-réduction par blocs (Image.reduce) avant LANCZOS quand le logo est fortement réduit
+RESIZE_REDUCING_GAP = 3.0
+
+# Profils d'encodage nommés : format Pillow, extension et type MIME du fichier produit,
+# options d'encodage et conservation de la transparence (indispensable pour la carte)
+ENCODER_PROFILES = {
+    # Impression : JPG qualité maximale, optimisé, progressif, 1200 DPI
+    'print': {'format': 'JPEG', 'extension': 'jpg', 'mimetype': 'image/jpeg', 'alpha': False,
+              'options': {'quality': 100, 'dpi': (1200, 1200), 'optimize': True, 'progressive': True}},
+    # Web : JPG de base (non progressif), qualité raisonnable, encodage rapide
+    'web': {'format': 'JPEG', 'extension': 'jpg', 'mimetype': 'image/jpeg', 'alpha': False,
+            'options': {'quality': 85}},
+    # PNG sans perte, compression standard ou rapide
+    'png': {'format': 'PNG', 'extension': 'png', 'mimetype': 'image/png', 'alpha': True,
+            'options': {'compress_level': 6}},
+    'png_fast': {'format': 'PNG', 'extension': 'png', 'mimetype': 'image/png', 'alpha': True,
+                 'options': {'compress_level': 1}},
+    # WebP avec perte : fichiers bien plus légers, transparence conservée
+    'webp': {'format': 'WEBP', 'extension': 'webp', 'mimetype': 'image/webp', 'alpha': True,
+             'options': {'quality': 90, 'method': 2}},
+}
+
+# Profils par défaut (rendu final, aperçu) selon la cible ; la carte et les vignettes
+# ont besoin de la transparence
+DEFAULT_PROFILES = {
+    'logo': ('print', 'web'),
+    'card': ('png', 'png_fast'),
+    'thumbnail': ('png', 'png_fast'),
+}
+ALPHA_TARGETS = {'card', 'thumbnail'}
+
+# Taille maximale des vignettes (pages de liste) : le logo y est ajusté sans être agrandi
+THUMBNAIL_SIZE = (160, 160)
+
+# Budget de pixels d'une image source : au-delà, le fichier est refusé avant décodage
+MAX_INPUT_PIXELS = 50_000_000
+
+
+def _debug_enabled():
+    # Les journaux de géométrie sont formatés à chaque rendu : les ignorer hors niveau DEBUG
+    return logging.root.isEnabledFor(logging.DEBUG)
+
+class ImageTooLargeError(ValueError):
+    """Image source dépassant MAX_INPUT_PIXELS (ou bombe de décompression)."""
+
+class LogoMask:
+    """
+    Logo détouré d'une seule couleur : masque de couverture ('L') et couleur de remplissage.
+    Redimensionnement et retouches ne traitent que le masque ; la couleur n'est appliquée
+    qu'au collage final sur le canevas ou la carte.
+
+    Args:
+        mask: Coverage mask, mode 'L' (255 = logo, 0 = background)
+        color: RGB fill color
+        tonal: The mask carries the grey levels of an opaque image (PNG without alpha), so
+            sharpness and contrast are applied to it (default: False)
+    """
+
+    def __init__(self, mask, color, tonal=False):
+        self.mask = mask
+        self.color = tuple(color)
+        self.tonal = tonal
+
+    @property
+    def size(self):
+        return self.mask.size
+
+    def resize(self, size):
+        """
+        Redimensionne le masque avec LANCZOS ; si le logo est très réduit, une pré-réduction
+        par blocs (Image.reduce) laisse au moins RESIZE_REDUCING_GAP fois la taille finale au filtre.
+        """
+        return LogoMask(self.mask.resize(size, Image.LANCZOS, reducing_gap=RESIZE_REDUCING_GAP), self.color, self.tonal)
+
+def process_logo(input_path, output_path, top_margin=73, right_margin=73, scale_factor=1.0, invert=False, horizontal_offset=0, vertical_offset=0, override_limits=False, preview=False, as_image=False, is_svg=None, profile=None, trim=False):
     """
     Process a logo image selon les spécifications exactes :
     1. Pour les PNG : conversion en noir en préservant la transparence
@@ -20,147 +110,385 @@ def process_logo(input_path, output_path, top_margin=73, right_margin=73, scale_
     6. Sauvegarde en JPG avec une résolution de 1200 DPI pour une qualité optimale
     
     Args:
-        input_path: Path to the input image
-        output_path: Path to save the processed image
+        input_path: Path, bytes or binary file-like object of the input image
+        output_path: Path or file-like object to save the processed image, or None to return the encoded bytes
         top_margin: Top margin in pixels (default: 73)
         right_margin: Right margin in pixels (default: 73)
         scale_factor: Scale factor for the logo (default: 1.0)
         invert: Whether to invert the colors (default: False)
         horizontal_offset: Horizontal offset in pixels (default: 0)
         vertical_offset: Vertical offset in pixels (default: 0)
+        preview: Render a reduced, fast-encoded preview instead of the print file (default: False)
+        as_image: Return the rendered PIL image instead of encoding it (default: False)
+        is_svg: Whether the input is an SVG (default: deduced from the path extension or the content)
+        profile: Name of the encoder profile, see ENCODER_PROFILES (default: print, web for previews)
+        trim: Crop the source to its content before detouring, see trim_to_content (default: False)
     """
     try:
-        # Vérifier si c'est un fichier SVG
-        is_svg = input_path.lower().endswith('.svg')
-        
-        # Charger l'image (conversion SVG -> PNG en mémoire si nécessaire)
+        source, is_svg = resolve_source(input_path, is_svg)
         if is_svg:
-            if cairosvg is None:
-                raise RuntimeError("CairoSVG n'est pas installé. Impossible de traiter les fichiers SVG.")
-            png_bytes: bytes = cairosvg.svg2png(url=input_path)
-            img = Image.open(_io.BytesIO(png_bytes)).convert('RGBA')
+            # SVG : dessiné directement à la taille finale, sans détourage ni redimensionnement
+            return render_svg_logo(
+                load_svg(source),
+                output_path,
+                top_margin=top_margin,
+                right_margin=right_margin,
+                scale_factor=scale_factor,
+                invert=invert,
+                horizontal_offset=horizontal_offset,
+                vertical_offset=vertical_offset,
+                override_limits=override_limits,
+                preview=preview,
+                as_image=as_image,
+                profile=profile,
+                trim=trim
+            )
+        processed_img = prepare_logo(source, invert=invert, is_svg=False, trim=trim)
+        return render_logo(
+            processed_img,
+            output_path,
+            top_margin=top_margin,
+            right_margin=right_margin,
+            scale_factor=scale_factor,
+            horizontal_offset=horizontal_offset,
+            vertical_offset=vertical_offset,
+            override_limits=override_limits,
+            preview=preview,
+            as_image=as_image,
+            profile=profile
+        )
+    except Exception as e:
+        logging.error(f"Error processing image: {str(e)}")
+        raise
+
+def _looks_like_svg(head):
+    head = head.lstrip().lower()
+    return head.startswith(b'<svg') or (head.startswith(b'<?xml') and b'<svg' in head)
+
+def resolve_source(source, is_svg=None):
+    """
+    Normalise la source (les octets deviennent un objet fichier) et détermine s'il
+    s'agit d'un SVG : d'après l'extension d'un chemin, sinon d'après le contenu.
+    Retourne (source, is_svg).
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = _io.BytesIO(source)
+    if is_svg is None:
+        if isinstance(source, str):
+            is_svg = source.lower().endswith('.svg')
         else:
-            # Ouvrir l'image avec PIL en utilisant la plus haute qualité possible
-            img = Image.open(input_path)
-        
-        # Convertir en mode RVB si nécessaire pour une meilleure qualité de traitement
-        if img.mode not in ['RGB', 'RGBA']:
-            if 'transparency' in img.info:
-                img = img.convert('RGBA')
+            # Objet fichier : reconnaître un SVG à son contenu
+            position = source.tell()
+            is_svg = _looks_like_svg(source.read(1024))
+            source.seek(position)
+    return source, is_svg
+
+def load_svg(source):
+    """
+    Analyse un SVG (chemin ou objet fichier), une seule fois par contenu : voir svg_render.parse_svg.
+    """
+    load_cairosvg()
+    with stage('parse'):
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                return parse_svg(f.read(), url=source)
+        return parse_svg(source.read())
+
+def _rasterize_svg(svg, size, color, box=None):
+    """
+    Dessine le SVG à exactement size : LogoMask de la couleur demandée. Avec box (contenu
+    du document, voir svg_extent), c'est le contenu qui mesure size : le document est
+    dessiné à l'échelle correspondante puis rogné.
+    """
+    render_size = size
+    if box is not None:
+        render_size = (max(1, round(size[0] / (box[2] - box[0]))), max(1, round(size[1] / (box[3] - box[1]))))
+    pixels = render_size[0] * render_size[1]
+    if pixels > MAX_INPUT_PIXELS:
+        raise ImageTooLargeError(
+            f"Rendu SVG trop grand ({render_size[0]}x{render_size[1]}, {pixels / 1e6:.1f} mégapixels ; "
+            f"maximum {MAX_INPUT_PIXELS / 1e6:.1f} mégapixels)"
+        )
+    with stage('rasterize'):
+        mask = svg.rasterize_mask(render_size)
+        if box is not None:
+            left, top = round(box[0] * render_size[0]), round(box[1] * render_size[1])
+            mask = mask.crop((left, top, left + size[0], top + size[1]))
+    record('input_pixels', pixels)
+    return LogoMask(mask, color)
+
+def svg_extent(svg, trim=False):
+    """
+    Taille à mettre en place d'un SVG et boîte de son contenu (fractions du document, voir
+    ParsedSvg.content_box) : avec trim, seul le dessin compte, pas les marges du document.
+    """
+    if not trim:
+        return svg.size, None
+    box = svg.content_box()
+    if box is None or box == (0.0, 0.0, 1.0, 1.0):
+        return svg.size, None
+    return (svg.size[0] * (box[2] - box[0]), svg.size[1] * (box[3] - box[1])), box
+
+def load_logo_image(source, is_svg=None, fit_box=None):
+    """
+    Charge l'image source, en rastérisant les SVG en PNG en mémoire.
+    Les images dépassant MAX_INPUT_PIXELS sont refusées (ImageTooLargeError) d'après leur
+    en-tête, sans être décodées. Avec fit_box, un JPEG est décodé directement à une
+    résolution réduite (mode draft) si la sortie est beaucoup plus petite que la source.
+
+    Args:
+        source: Path, bytes or binary file-like object of the logo
+        is_svg: Whether the source is an SVG (default: deduced from the path extension or the content)
+        fit_box: Largest box the logo will be fitted into, or None to decode at full size (default: None)
+    """
+    source, is_svg = resolve_source(source, is_svg)
+    if is_svg:
+        cairosvg = load_cairosvg()
+        with stage('rasterize'):
+            if isinstance(source, str):
+                png_bytes: bytes = cairosvg.svg2png(url=source)
             else:
-                img = img.convert('RGB')
-        
-        # Vérifier si c'est un PNG (ou issu d'un SVG converti)
-        is_png = is_svg or (getattr(img, 'format', None) == 'PNG')
-        
+                png_bytes: bytes = cairosvg.svg2png(bytestring=source.read())
+            img = _open_within_budget(_io.BytesIO(png_bytes)).convert('RGBA')
+        record('input_pixels', img.width * img.height)
+        return img, True
+    # Ouvrir l'image avec PIL en utilisant la plus haute qualité possible
+    with stage('decode'):
+        img = _open_within_budget(source)
+        if fit_box and img.format == 'JPEG':
+            factor = reduction_factor(img.size, fit_box)
+            if factor > 1:
+                # Décodage DCT à l'échelle 1/2, 1/4 ou 1/8 (taille résultante >= taille demandée)
+                img.draft(img.mode, (math.ceil(img.width / factor), math.ceil(img.height / factor)))
+        img.load()
+    record('input_pixels', img.width * img.height)
+    return img, False
+
+def _open_within_budget(source):
+    """Ouvre une image (en-tête seulement) et vérifie son nombre de pixels avant décodage."""
+    try:
+        img = Image.open(source)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e)) from e
+    pixels = img.width * img.height
+    if pixels > MAX_INPUT_PIXELS:
+        raise ImageTooLargeError(
+            f"Image trop grande ({img.width}x{img.height}, {pixels / 1e6:.1f} mégapixels ; "
+            f"maximum {MAX_INPUT_PIXELS / 1e6:.1f} mégapixels)"
+        )
+    return img
+
+def reduction_factor(size, fit_box, max_scale=MAX_SCALE_FACTOR, gap=REDUCE_GAP):
+    """
+    Plus grand facteur entier de réduction d'une source de taille size qui la garde
+    au moins gap fois plus grande que le logo le plus grand possible dans fit_box.
+    """
+    ratio = min(fit_box[0] / size[0], fit_box[1] / size[1]) * max_scale * gap
+    if ratio >= 1:
+        return 1
+    return max(1, int(1 / ratio))
+
+def reduce_for_fit(img, fit_box):
+    """
+    Réduit l'image par blocs (Image.reduce, alpha prémultiplié) si elle est bien plus grande
+    que nécessaire pour fit_box, afin que le détourage ne traite pas des pixels inutiles.
+    """
+    if not fit_box:
+        return img
+    factor = reduction_factor(img.size, fit_box)
+    if factor <= 1:
+        return img
+    with stage('reduce'):
+        # Par bandes parallèles pour les très grandes images (voir tiling)
+        reduced = reduce_image(img, factor)
+    if _debug_enabled():
+        logging.debug(f"Source reduced by {factor}: {img.width}x{img.height} -> {reduced.width}x{reduced.height}")
+    return reduced
+
+def trim_to_content(img, tonal=False, enhance=True):
+    """
+    Rogne l'image décodée à la boîte englobante de son contenu, avant la réduction, le
+    détourage et le redimensionnement : ces étapes ne traitent plus les marges, et la mise
+    en place (ajustement à la zone, scale_factor) porte sur la taille utile du logo.
+    Le contenu est ce que le détourage garde : l'alpha non nul d'une image transparente ;
+    pour une image opaque, les pixels non blancs (tonal) ou que le seuil du détourage
+    rend opaques (seuil calculé sur l'image entière, comme detour_mask). L'image n'est pas
+    modifiée ; une image vide ou sans marge est retournée telle quelle.
+
+    Args:
+        img: Decoded RGB or RGBA image
+        tonal: The grey levels of the opaque image become the mask, as for a PNG without alpha (default: False)
+        enhance: Contrast and autocontrast are applied before the detour threshold (default: True)
+    """
+    with stage('trim'):
+        if img.mode == 'RGBA':
+            bbox = img.getchannel('A').getbbox()
+        else:
+            gray = ImageOps.grayscale(img)
+            lut = [255] * 255 + [0] if tonal else detour_lut(gray.histogram(), enhance=enhance).tolist()
+            bbox = gray.point(lut).getbbox()
+        if bbox is None or bbox == (0, 0) + img.size:
+            return img
+        trimmed = img.crop(bbox)
+    if _debug_enabled():
+        logging.debug(f"Source trimmed to content: {img.width}x{img.height} -> {trimmed.width}x{trimmed.height}")
+    return trimmed
+
+def prepare_logo(source, invert=False, is_svg=None, fit_box=LOGO_FIT_BOX, trim=False):
+    """
+    Détoure un logo pour le canevas (étapes 1 et 2 de process_logo) et retourne un LogoMask
+    noir ou blanc. Le résultat ne dépend que du fichier source et de invert, il peut donc
+    être mis en cache et replacé avec render_logo à chaque ajustement.
+
+    Args:
+        source: Path, bytes or binary file-like object of the logo
+        invert: Whether to invert the colors (default: False)
+        is_svg: Whether the source is an SVG (default: deduced from the path extension)
+        fit_box: Box the logo is fitted into; larger sources are reduced before detouring,
+            None keeps the full resolution (default: LOGO_FIT_BOX)
+        trim: Crop the source to its content before detouring, see trim_to_content (default: False)
+    """
+    # La taille du contenu n'est connue qu'après décodage : pas de décodage réduit si trim
+    img, is_svg = load_logo_image(source, is_svg=is_svg, fit_box=None if trim else fit_box)
+    return detour_logo(img, is_svg=is_svg, invert=invert, fit_box=fit_box, trim=trim)
+
+def detour_logo(img, is_svg=False, invert=False, fit_box=LOGO_FIT_BOX, trim=False):
+    """
+    Étapes 1 et 2 de process_logo sur une image déjà décodée (voir load_logo_image),
+    qui n'est pas modifiée : la même image peut servir à plusieurs préparations.
+
+    Args:
+        img: Image returned by load_logo_image
+        is_svg: Whether the image was rasterized from an SVG (default: False)
+        invert: Whether to invert the colors (default: False)
+        fit_box: Box the logo is fitted into, see prepare_logo (default: LOGO_FIT_BOX)
+        trim: Crop the image to its content first, see trim_to_content (default: False)
+    """
+    # Vérifier si c'est un PNG (ou issu d'un SVG converti), avant que la réduction ne perde le
+    # format. Comme à l'origine, où le test suivait la conversion (qui perd le format), un PNG
+    # palette, L ou LA n'est pas traité comme un PNG mais détouré
+    is_png = is_svg or (getattr(img, 'format', None) == 'PNG' and img.mode in ('RGB', 'RGBA'))
+
+    # Convertir en mode RVB si nécessaire pour une meilleure qualité de traitement
+    if img.mode not in ['RGB', 'RGBA']:
+        if 'transparency' in img.info:
+            img = img.convert('RGBA')
+        else:
+            img = img.convert('RGB')
+
+    if trim:
+        # Les PNG opaques gardent leurs niveaux de gris : tout pixel non blanc est du contenu
+        img = trim_to_content(img, tonal=is_png)
+    img = reduce_for_fit(img, fit_box)
+
+    with stage('detour'):
+        # Couleur du logo : noire ou blanche selon le paramètre invert
+        color = (255, 255, 255) if invert else (0, 0, 0)
+
         if is_png:
             # Pour les PNG, on convertit simplement en noir en préservant la transparence
             if img.mode == 'RGBA':
-                # Si l'image a déjà un canal alpha, on le préserve
-                r, g, b, alpha = img.split()
-                # Créer une image noire ou blanche selon le paramètre invert
-                color = (255, 255, 255) if invert else (0, 0, 0)
-                color_img = Image.new('RGB', img.size, color)
-                processed_img = Image.new('RGBA', img.size)
-                processed_img.paste(color_img, (0, 0), mask=alpha)
+                # Si l'image a déjà un canal alpha, il devient le masque du logo
+                processed_img = LogoMask(img.getchannel('A'), color)
             else:
-                # Si l'image n'a pas de canal alpha, on la convertit simplement en noir ou blanc
-                processed_img = ImageOps.grayscale(img)
-                if invert:
-                    processed_img = ImageOps.invert(processed_img)
-                processed_img = processed_img.convert('RGBA')
+                # Si l'image n'a pas de canal alpha, on la convertit simplement en niveaux de gris
+                # (inversés si invert), opaques : sur le canevas blanc, c'est du noir dont la
+                # couverture est l'inverse du niveau de gris
+                gray = convert_image(img, 'L')
+                processed_img = LogoMask(gray if invert else ImageOps.invert(gray), (0, 0, 0), tonal=True)
         else:
-            # Pour les autres formats, procéder au détourage
+            # Pour les autres formats, procéder au détourage (contraste, autocontraste puis
+            # seuil, appliqués en une seule LUT) : les zones sombres (logo) deviennent
+            # opaques (255), les zones claires (fond) transparentes (0)
+            # (par bandes parallèles pour les très grandes images, voir detour_image)
             if img.mode == 'RGBA':
-                # Extraire le canal alpha existant
-                r, g, b, alpha = img.split()
-                
-                # Créer une image en noir et blanc pour déterminer les parties à conserver
-                gray = ImageOps.grayscale(img)
-                
-                # Améliorer le contraste pour un meilleur détourage
-                contrast_enhancer = ImageEnhance.Contrast(gray)
-                gray = contrast_enhancer.enhance(1.2)
-                gray = ImageOps.autocontrast(gray, cutoff=2)
-                
-                # Utiliser un seuil adaptatif pour un meilleur détourage
-                binary = gray.point(lambda p: 0 if p < 245 else 255)
-                
-                # Améliorer le canal alpha en combinant avec notre masque binaire
-                # Les zones noires de binary deviennent opaques (255), les zones blanches transparentes (0)
-                enhanced_alpha = binary.point(lambda p: 255 if p < 128 else 0)
-                
                 # Pour les images avec alpha existant, ne pas perdre la transparence existante
                 # Conserver la valeur la plus opaque entre les deux
-                final_alpha = Image.new('L', img.size)
-                alpha_data = list(alpha.getdata())
-                enhanced_data = list(enhanced_alpha.getdata())
-                final_data = [max(a, e) for a, e in zip(alpha_data, enhanced_data)]
-                final_alpha.putdata(final_data)
-                
-                # Créer une image noire ou blanche selon le paramètre invert
-                color = (255, 255, 255) if invert else (0, 0, 0)
-                color_img = Image.new('RGB', img.size, color)
-                
-                # Fusionner les deux images
-                # Les zones transparentes resteront transparentes, les zones opaques seront noires ou blanches
-                result = Image.new('RGBA', img.size)
-                result.paste(color_img, (0, 0), mask=final_alpha)
-                
-                # Définir l'image traitée
-                processed_img = result
-                
+                alpha_mask = detour_image(img, keep_alpha=True)
             else:
-                # Convertir l'image en RGB si ce n'est pas déjà fait
-                img_rgb = img.convert('RGB')
-                
-                # Créer une version en niveaux de gris
-                gray = ImageOps.grayscale(img_rgb)
-                
-                # Améliorer le contraste pour un meilleur détourage
-                contrast_enhancer = ImageEnhance.Contrast(gray)
-                gray = contrast_enhancer.enhance(1.2)
-                gray = ImageOps.autocontrast(gray, cutoff=2)
-                
-                # Utiliser un seuil adaptatif pour un meilleur détourage
-                threshold = 245
-                binary = gray.point(lambda p: 0 if p < threshold else 255)
-                
-                # Inverser le masque: les zones sombres (logo) sont opaques (255), 
-                # les zones claires (fond) sont transparentes (0)
-                alpha_mask = binary.point(lambda p: 255 if p < 128 else 0)
-                
-                # Créer une version noire ou blanche du logo selon le paramètre invert
-                color = (255, 255, 255) if invert else (0, 0, 0)
-                color_img = Image.new('RGB', img.size, color)
-                
-                # Fusionner l'image avec le masque alpha
-                processed_img = Image.new('RGBA', img.size)
-                processed_img.paste(color_img, (0, 0), mask=alpha_mask)
-        
-        # Redimensionnement proportionnel
-        original_width, original_height = processed_img.size
-        max_width, max_height = 613, 283  # valeurs par défaut pour le logging
-        # Calcul de la taille de base (fit) qui tient dans 613x283
-        base_width_ratio = max_width / original_width
-        base_height_ratio = max_height / original_height
-        base_ratio = min(base_width_ratio, base_height_ratio)
+                alpha_mask = detour_image(img)
 
-        if isinstance(override_limits, dict):
-            override_scale = override_limits.get('scale', False)
-        else:
-            override_scale = bool(override_limits)
+            # Les zones transparentes resteront transparentes, les zones opaques seront noires ou blanches
+            processed_img = LogoMask(Image.fromarray(alpha_mask), color)
 
-        if override_scale:
-            # Appliquer le facteur par rapport à la taille de base (100% = fit)
-            ratio = base_ratio * scale_factor
-        else:
-            # Respecter les limites 613x283 et appliquer le facteur
-            ratio = base_ratio * scale_factor
-        
-        new_width = int(original_width * ratio)
-        new_height = int(original_height * ratio)
-        
+    return processed_img
+
+def render_logo(processed_img, output_path, top_margin=73, right_margin=73, scale_factor=1.0, horizontal_offset=0, vertical_offset=0, override_limits=False, preview=False, as_image=False, profile=None):
+    """
+    Redimensionne un logo déjà détouré (voir prepare_logo) et le place sur le canevas blanc
+    (étapes 3 à 6 de process_logo).
+    
+    Args:
+        processed_img: LogoMask returned by prepare_logo
+        output_path: Path or file-like object to save the processed image, or None to return the encoded bytes
+        top_margin: Top margin in pixels (default: 73)
+        right_margin: Right margin in pixels (default: 73)
+        scale_factor: Scale factor for the logo (default: 1.0)
+        horizontal_offset: Horizontal offset in pixels (default: 0)
+        vertical_offset: Vertical offset in pixels (default: 0)
+        preview: Render a reduced, fast-encoded preview instead of the print file (default: False)
+        as_image: Return the rendered PIL image instead of encoding it (default: False)
+        profile: Name of the encoder profile, see ENCODER_PROFILES (default: print, web for previews)
+    """
+    canvas_size, (paste_x, paste_y, new_width, new_height) = logo_layout(
+        processed_img.size, top_margin, right_margin, scale_factor, horizontal_offset, vertical_offset, override_limits, preview
+    )
+
+    with stage('resize'):
+        # Redimensionner le masque avec LANCZOS pour une meilleure qualité
+        resized_img = processed_img.resize((new_width, new_height))
+
+    return _finish_logo(resized_img, canvas_size, (paste_x, paste_y), output_path, preview, as_image, profile)
+
+def render_svg_logo(svg, output_path, top_margin=73, right_margin=73, scale_factor=1.0, invert=False, horizontal_offset=0, vertical_offset=0, override_limits=False, preview=False, as_image=False, profile=None, trim=False):
+    """
+    Variante de render_logo pour un SVG : le document est dessiné directement à la taille
+    finale (aperçu compris), sans détourage ni redimensionnement.
+
+    Args:
+        svg: ParsedSvg returned by load_svg
+        output_path: Path or file-like object to save the processed image, or None to return the encoded bytes
+        invert: Whether to draw the logo in white instead of black (default: False)
+        trim: Fit the drawing itself, without the document margins (default: False)
+        (other arguments: see render_logo)
+    """
+    size, box = svg_extent(svg, trim)
+    canvas_size, (paste_x, paste_y, new_width, new_height) = logo_layout(
+        size, top_margin, right_margin, scale_factor, horizontal_offset, vertical_offset, override_limits, preview
+    )
+    color = (255, 255, 255) if invert else (0, 0, 0)
+    resized_img = _rasterize_svg(svg, (new_width, new_height), color, box)
+    return _finish_logo(resized_img, canvas_size, (paste_x, paste_y), output_path, preview, as_image, profile)
+
+def logo_layout(size, top_margin=73, right_margin=73, scale_factor=1.0, horizontal_offset=0, vertical_offset=0, override_limits=False, preview=False):
+    """
+    Géométrie du logo sur le canevas : retourne ((largeur, hauteur) du canevas,
+    (x, y, largeur, hauteur) du logo), réduits à l'échelle de l'aperçu si preview.
+    """
+    # Redimensionnement proportionnel
+    original_width, original_height = size
+    max_width, max_height = LOGO_FIT_BOX  # valeurs par défaut pour le logging
+    # Calcul de la taille de base (fit) qui tient dans 613x283
+    base_width_ratio = max_width / original_width
+    base_height_ratio = max_height / original_height
+    base_ratio = min(base_width_ratio, base_height_ratio)
+
+    if isinstance(override_limits, dict):
+        override_scale = override_limits.get('scale', False)
+    else:
+        override_scale = bool(override_limits)
+
+    if override_scale:
+        # Appliquer le facteur par rapport à la taille de base (100% = fit)
+        ratio = base_ratio * scale_factor
+    else:
+        # Respecter les limites 613x283 et appliquer le facteur
+        ratio = base_ratio * scale_factor
+
+    new_width = int(original_width * ratio)
+    new_height = int(original_height * ratio)
+
+    if _debug_enabled():
         logging.debug(f"Original size: {original_width}x{original_height}")
         if override_scale:
             logging.debug("Max size allowed: unlimited (override)")
@@ -168,169 +496,194 @@ def process_logo(input_path, output_path, top_margin=73, right_margin=73, scale_
             logging.debug(f"Max size allowed: {max_width}x{max_height}")
         logging.debug(f"Final resized size: {new_width}x{new_height}")
         logging.debug(f"Ratio applied: {ratio:.3f}")
-        
-        # Redimensionner l'image traitée avec LANCZOS pour une meilleure qualité
-        # Utiliser un redimensionnement en deux étapes pour une qualité supérieure
-        if ratio < 0.5:
-            # Si l'image est très réduite, faire un redimensionnement en deux étapes
-            intermediate_size = (int(original_width * 0.5), int(original_height * 0.5))
-            resized_img = processed_img.resize(intermediate_size, Image.LANCZOS)
-            resized_img = resized_img.resize((new_width, new_height), Image.LANCZOS)
-        else:
-            resized_img = processed_img.resize((new_width, new_height), Image.LANCZOS)
-        
-        # Améliorer la netteté de l'image de manière plus subtile pour éviter les artefacts
-        sharpness = ImageEnhance.Sharpness(resized_img)
-        resized_img = sharpness.enhance(1.3)  # Augmenter la netteté de 30%
-        
-        # Améliorer légèrement le contraste pour une meilleure définition
-        contrast = ImageEnhance.Contrast(resized_img)
-        resized_img = contrast.enhance(1.1)  # Augmenter le contraste de 10%
-        
-        # Créer un canevas blanc avec une meilleure qualité et résolution plus élevée
-        canvas_width, canvas_height = 2024, 1276
-        canvas = Image.new('RGB', (canvas_width, canvas_height), (255, 255, 255))
-        
-        # Positionner le logo selon les paramètres avec vérification des limites
-        paste_x = canvas_width - new_width - right_margin + int(horizontal_offset)
-        paste_y = top_margin + int(vertical_offset)
-        
-        # S'assurer que le logo reste dans les limites du canevas
-        if isinstance(override_limits, dict):
-            override_position = override_limits.get('position', False)
-        else:
-            override_position = bool(override_limits)
-        if not override_position:
-            paste_x = max(0, min(paste_x, canvas_width - new_width))
-            paste_y = max(0, min(paste_y, canvas_height - new_height))
-        
+
+    # Créer un canevas blanc avec une meilleure qualité et résolution plus élevée
+    canvas_width, canvas_height = CANVAS_SIZE
+
+    # Positionner le logo selon les paramètres avec vérification des limites
+    paste_x = canvas_width - new_width - right_margin + int(horizontal_offset)
+    paste_y = top_margin + int(vertical_offset)
+
+    # S'assurer que le logo reste dans les limites du canevas
+    if isinstance(override_limits, dict):
+        override_position = override_limits.get('position', False)
+    else:
+        override_position = bool(override_limits)
+    if not override_position:
+        paste_x = max(0, min(paste_x, canvas_width - new_width))
+        paste_y = max(0, min(paste_y, canvas_height - new_height))
+
+    if _debug_enabled():
         logging.debug(f"Placing logo at position ({paste_x}, {paste_y}) with horizontal offset {horizontal_offset} and vertical offset {vertical_offset}")
-        
-        # Coller l'image traitée sur le canevas en utilisant son propre canal alpha comme masque
-        if resized_img.mode == 'RGBA':
-            canvas.paste(resized_img, (paste_x, paste_y), mask=resized_img.split()[3])
-        else:
-            canvas.paste(resized_img, (paste_x, paste_y))
-        
-        # Définir la résolution à 1200 DPI pour une qualité d'impression supérieure
-        canvas.info['dpi'] = (1200, 1200)
-        
-        # Sauvegarder l'image finale en JPG avec la qualité maximale et 1200 DPI
-        canvas.save(output_path, 'JPEG', quality=100, dpi=(1200, 1200), optimize=True, progressive=True)
-        
-        logging.debug(f"Processed logo saved to {output_path} with 1200 DPI resolution")
-        return True
-        
-    except Exception as e:
-        logging.error(f"Error processing image: {str(e)}")
-        raise
 
-def process_text_logo(text, output_path, top_margin=73, right_margin=73, scale_factor=1.0, horizontal_offset=0, vertical_offset=0, override_limits=False):
+    if preview:
+        # Aperçu : même géométrie, réduite proportionnellement, en un seul redimensionnement rapide
+        canvas_width, canvas_height = _preview_size((canvas_width, canvas_height), PREVIEW_SCALE)
+        paste_x, paste_y, new_width, new_height = _preview_box(paste_x, paste_y, new_width, new_height, PREVIEW_SCALE)
+
+    return (canvas_width, canvas_height), (paste_x, paste_y, new_width, new_height)
+
+def logo_geometry(size, top_margin=73, right_margin=73):
+    """
+    Règles de placement de logo_layout sous forme de données (JSON), pour composer l'aperçu
+    côté client : ratio = min(max_size / size) × scale_factor, taille = int(size × ratio),
+    x = canvas - largeur - right_margin + int(horizontal_offset), y = top_margin +
+    int(vertical_offset), puis ramené dans le canevas sauf si la position est forcée.
+
+    Args:
+        size: (width, height) of the prepared logo, as passed to logo_layout
+        top_margin: Top margin in pixels (default: 73)
+        right_margin: Right margin in pixels (default: 73)
+    """
+    return {
+        'canvas': list(CANVAS_SIZE),
+        'background': '#ffffff',
+        'size': list(size),
+        'max_size': list(LOGO_FIT_BOX),
+        'top_margin': top_margin,
+        'right_margin': right_margin,
+    }
+
+def _finish_logo(resized_img, canvas_size, paste_position, output_path, preview, as_image, profile=None):
+    """Netteté, contraste et placement du logo redimensionné (LogoMask) sur le canevas blanc, puis encodage."""
+    mask = resized_img.mask
+    if resized_img.tonal:
+        # Netteté et contraste ne modifient que les couleurs, jamais la transparence : ils sont
+        # sans effet sur un aplat de couleur et ne concernent que les logos en niveaux de gris
+        with stage('enhance'):
+            # Améliorer la netteté de l'image de manière plus subtile pour éviter les artefacts
+            sharpness = ImageEnhance.Sharpness(mask)
+            mask = sharpness.enhance(1.3)  # Augmenter la netteté de 30%
+
+            # Améliorer légèrement le contraste pour une meilleure définition
+            contrast = ImageEnhance.Contrast(mask)
+            mask = contrast.enhance(1.1)  # Augmenter le contraste de 10%
+
+    with stage('composite'):
+        canvas = Image.new('RGB', canvas_size, (255, 255, 255))
+
+        # Remplir le logo de sa couleur sur le canevas, à travers son masque
+        canvas.paste(resized_img.color, paste_position, mask=mask)
+
+    if as_image:
+        return canvas
+    result = save_canvas(canvas, output_path, preview=preview, profile=profile)
+
+    if _debug_enabled():
+        logging.debug(f"Processed logo saved to {output_path or 'memory'} ({'preview' if preview else '1200 DPI'})")
+    return result
+
+def _preview_size(size, scale):
+    return max(1, int(round(size[0] * scale))), max(1, int(round(size[1] * scale)))
+
+def _preview_box(x, y, width, height, scale):
+    """Réduit une zone de placement calculée en pleine résolution à l'échelle de l'aperçu."""
+    return (int(round(x * scale)), int(round(y * scale))) + _preview_size((width, height), scale)
+
+def save_image(image, output_path, format, **options):
+    """
+    Encode une image vers un chemin ou un objet fichier (retourne True), ou en
+    mémoire si output_path est None (retourne les octets encodés).
+    """
+    with stage('encode'):
+        if output_path is None:
+            buffer = _io.BytesIO()
+            image.save(buffer, format, **options)
+            data = buffer.getvalue()
+            record('output_bytes', len(data))
+            return data
+        image.save(output_path, format, **options)
+    if isinstance(output_path, str):
+        record('output_bytes', os.path.getsize(output_path))
+    return True
+
+def resolve_profile(profile=None, target='logo', preview=False):
+    """
+    Nom du profil d'encodage à utiliser : profile s'il est donné, sinon le profil par défaut
+    de la cible ('logo' et 'text' : print, web en aperçu ; 'card' et 'thumbnail' : png,
+    png_fast en aperçu). Lève ValueError si le profil est inconnu, ou s'il perdrait la
+    transparence de la carte ou de la vignette.
+    """
+    if profile is None:
+        return DEFAULT_PROFILES.get(target, DEFAULT_PROFILES['logo'])[bool(preview)]
+    if profile not in ENCODER_PROFILES:
+        raise ValueError(f"Profil d'encodage inconnu : {profile}")
+    if target in ALPHA_TARGETS and not ENCODER_PROFILES[profile]['alpha']:
+        raise ValueError(f"Le profil {profile} ne conserve pas la transparence de la {'carte' if target == 'card' else 'vignette'}")
+    return profile
+
+def encode_image(image, output_path, profile):
+    """Encode une image avec un profil nommé (voir save_image), en notant le profil pour les métriques."""
+    settings = ENCODER_PROFILES[profile]
+    annotate('profile', profile)
+    return save_image(image, output_path, settings['format'], **settings['options'])
+
+def warm_encoders():
+    """
+    Encode une image minuscule avec chaque profil : charge les greffons d'écriture de PIL
+    (chargés sinon au premier rendu de chaque format) avant de servir des requêtes.
+    """
+    Image.init()
+    for settings in ENCODER_PROFILES.values():
+        mode = 'RGBA' if settings['alpha'] else 'RGB'
+        save_image(Image.new(mode, (8, 8), (255, 255, 255)), None, settings['format'], **settings['options'])
+
+def save_canvas(canvas, output_path, preview=False, profile=None):
+    """
+    Encode le canevas final, par défaut en JPG :
+    - En qualité impression (print) : qualité maximale, optimisé, progressif et 1200 DPI
+    - En aperçu (web) : encodage rapide, sans optimisation ni mode progressif
+    """
+    return encode_image(canvas, output_path, resolve_profile(profile, 'logo', preview))
+
+def process_text_logo(text, output_path, top_margin=73, right_margin=73, scale_factor=1.0, horizontal_offset=0, vertical_offset=0, override_limits=False, preview=False, as_image=False, profile=None):
     """
     Create a text logo with the same constraints as image logos.
     Supports multiline text with automatic line spacing.
     
     Args:
         text: Text to render (can contain newlines)
-        output_path: Path to save the processed image
+        output_path: Path or file-like object to save the processed image, or None to return the encoded bytes
         top_margin: Top margin in pixels (default: 73)
         right_margin: Right margin in pixels (default: 73)
         scale_factor: Scale factor for the text (default: 1.0)
         horizontal_offset: Horizontal offset in pixels (default: 0)
         vertical_offset: Vertical offset in pixels (default: 0)
+        preview: Render a reduced, fast-encoded preview instead of the print file (default: False)
+        as_image: Return the rendered PIL image instead of encoding it (default: False)
+        profile: Name of the encoder profile, see ENCODER_PROFILES (default: print, web for previews)
     """
     try:
-        logging.info(f"Processing text with scale_factor: {scale_factor}")
+        if _debug_enabled():
+            logging.debug(f"Processing text with scale_factor: {scale_factor}")
         text = text.replace('\r', '')
         lines = text.split('\n')
         max_width, max_height = 613, 283
         margin = 50
-        # Recherche dichotomique de la taille de police maximale
-        min_font, max_font = 10, 1000
-        best_font_size = min_font
-        font_path = None
-        try:
-            font_path = "fonts/Manrope-Regular.ttf"
-            font = ImageFont.truetype(font_path, min_font)
-        except:
-            try:
-                font_path = "arial.ttf"
-                font = ImageFont.truetype(font_path, min_font)
-            except:
-                try:
-                    font_path = "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf"
-                    font = ImageFont.truetype(font_path, min_font)
-                except:
-                    font_path = None
-        if not font_path:
-            raise RuntimeError("Aucune police TTF trouvée sur le système. Placez fonts/Manrope-Regular.ttf, arial.ttf ou LiberationSans-Regular.ttf.")
-        logging.info(f"Font path used: {font_path}")
-        while min_font <= max_font:
-            mid_font = (min_font + max_font) // 2
-            if font_path:
-                font = ImageFont.truetype(font_path, mid_font)
-            else:
-                font = ImageFont.load_default()
-            temp_img = Image.new('RGB', (1, 1), (255, 255, 255))
-            draw = ImageDraw.Draw(temp_img)
-            line_heights = []
-            line_widths = []
-            max_line_width = 0
-            total_height = 0
-            for line in lines:
-                bbox = draw.textbbox((0, 0), line, font=font)
-                line_width = bbox[2] - bbox[0]
-                line_height = bbox[3] - bbox[1]
-                max_line_width = max(max_line_width, line_width)
-                line_heights.append(line_height)
-                line_widths.append(line_width)
-                total_height += line_height
-            line_spacing = int(max(line_heights) * 0.3) if line_heights else 0
-            total_height += line_spacing * (len(lines) - 1)
-            if max_line_width + 2 * margin <= max_width and total_height + 2 * margin <= max_height:
-                best_font_size = mid_font
-                min_font = mid_font + 1
-            else:
-                max_font = mid_font - 1
-        # Appliquer le scale_factor
-        final_font_size = int(best_font_size * scale_factor)
-        if font_path:
-            font = ImageFont.truetype(font_path, final_font_size)
-        else:
-            font = ImageFont.load_default()
-        # Recalculer les dimensions finales
-        temp_img = Image.new('RGB', (1, 1), (255, 255, 255))
-        draw = ImageDraw.Draw(temp_img)
-        line_heights = []
-        line_widths = []
-        max_line_width = 0
-        total_height = 0
-        line_bboxes = []
-        for line in lines:
-            bbox = draw.textbbox((0, 0), line, font=font)
-            line_width = bbox[2] - bbox[0]
-            line_height = bbox[3] - bbox[1]
-            max_line_width = max(max_line_width, line_width)
-            line_heights.append(line_height)
-            line_widths.append(line_width)
-            line_bboxes.append(bbox)
-            total_height += line_height
-        line_spacing = int(max(line_heights) * 0.3) if line_heights else 0
-        total_height += line_spacing * (len(lines) - 1)
-        # Sécurité: padding supplémentaire pour éviter toute coupure liée aux métriques
-        safety_pad = max(4, int(final_font_size * 0.1))
-        img_width = max_line_width + (margin * 2) + safety_pad
-        img_height = total_height + (margin * 2) + safety_pad
-        text_img = Image.new('RGBA', (img_width, img_height), (255, 255, 255, 0))
-        draw = ImageDraw.Draw(text_img)
-        # Compenser un éventuel bbox top négatif (ascenders)
-        min_top = min((b[1] for b in line_bboxes), default=0)
-        y = margin - min_top
-        for i, line in enumerate(lines):
-            bbox = line_bboxes[i]
-            x = margin - bbox[0]
-            draw.text((x, y), line, font=font, fill=(0, 0, 0, 255))
-            y += line_heights[i] + line_spacing
+        with stage('font_fit'):
+            # Plus grande taille de police qui tient dans 613x283 (mesures mises en cache par le registre)
+            best_font_size = fit_font_size(lines, max_width, max_height, margin)
+            # Appliquer le scale_factor
+            final_font_size = int(best_font_size * scale_factor)
+            font = get_font(final_font_size)
+            # Recalculer les dimensions finales
+            max_line_width, total_height, line_bboxes, line_heights, line_spacing = measure_lines(lines, final_font_size)
+        with stage('text_draw'):
+            # Sécurité: padding supplémentaire pour éviter toute coupure liée aux métriques
+            safety_pad = max(4, int(final_font_size * 0.1))
+            img_width = max_line_width + (margin * 2) + safety_pad
+            img_height = total_height + (margin * 2) + safety_pad
+            # Masque de couverture du texte (noir sur le canevas)
+            text_img = Image.new('L', (img_width, img_height), 0)
+            draw = ImageDraw.Draw(text_img)
+            # Compenser un éventuel bbox top négatif (ascenders)
+            min_top = min((b[1] for b in line_bboxes), default=0)
+            y = margin - min_top
+            for i, line in enumerate(lines):
+                bbox = line_bboxes[i]
+                x = margin - bbox[0]
+                draw.text((x, y), line, font=font, fill=255)
+                y += line_heights[i] + line_spacing
         # Contraindre l'image de texte aux limites 613x283 si nécessaire
         if isinstance(override_limits, dict):
             override_scale = override_limits.get('scale', False)
@@ -341,9 +694,9 @@ def process_text_logo(text, output_path, top_margin=73, right_margin=73, scale_f
             if text_img.width > max_width or text_img.height > max_height:
                 ratio = min(max_width / text_img.width, max_height / text_img.height)
                 new_size = (max(1, int(text_img.width * ratio)), max(1, int(text_img.height * ratio)))
-                text_img = text_img.resize(new_size, Image.LANCZOS)
-        canvas_width, canvas_height = 2024, 1276
-        canvas = Image.new('RGB', (canvas_width, canvas_height), (255, 255, 255))
+                with stage('resize'):
+                    text_img = text_img.resize(new_size, Image.LANCZOS)
+        canvas_width, canvas_height = CANVAS_SIZE
         paste_x = canvas_width - text_img.width - right_margin + int(horizontal_offset)
         paste_y = top_margin + int(vertical_offset)
         if isinstance(override_limits, dict):
@@ -353,94 +706,343 @@ def process_text_logo(text, output_path, top_margin=73, right_margin=73, scale_f
         if not override_position:
             paste_x = max(0, min(paste_x, canvas_width - text_img.width))
             paste_y = max(0, min(paste_y, canvas_height - text_img.height))
-        canvas.paste(text_img, (paste_x, paste_y), mask=text_img.split()[3])
-        canvas.info['dpi'] = (1200, 1200)
-        canvas.save(output_path, 'JPEG', quality=100, dpi=(1200, 1200), optimize=True, progressive=True)
-        logging.info(f"Processed text logo saved to {output_path} with font size {final_font_size}")
-        return True
+        if preview:
+            # Aperçu : même géométrie, réduite proportionnellement
+            canvas_width, canvas_height = _preview_size((canvas_width, canvas_height), PREVIEW_SCALE)
+            paste_x, paste_y, width, height = _preview_box(paste_x, paste_y, text_img.width, text_img.height, PREVIEW_SCALE)
+            with stage('resize'):
+                text_img = text_img.resize((width, height), Image.LANCZOS, reducing_gap=RESIZE_REDUCING_GAP)
+        with stage('composite'):
+            canvas = Image.new('RGB', (canvas_width, canvas_height), (255, 255, 255))
+            canvas.paste((0, 0, 0), (paste_x, paste_y), mask=text_img)
+        if as_image:
+            return canvas
+        result = save_canvas(canvas, output_path, preview=preview, profile=profile)
+        if _debug_enabled():
+            logging.debug(f"Processed text logo saved to {output_path or 'memory'} with font size {final_font_size}")
+        return result
     except Exception as e:
         logging.error(f"Error processing text: {str(e)}")
         raise
 
-def process_card_logo(logo_path, output_path, card_template_path='static/card_template.png', top_margin=35, right_margin=35, max_width=210, max_height=100, scale_factor=1.0, horizontal_offset=0, vertical_offset=0, override_limits=False):
+def process_card_logo(logo_path, output_path, card_template_path='static/card_template.png', top_margin=35, right_margin=35, max_width=210, max_height=100, scale_factor=1.0, horizontal_offset=0, vertical_offset=0, override_limits=False, preview=False, as_image=False, is_svg=None, profile=None, trim=False):
     """
     Place un logo détouré/redimensionné sur une carte bancaire.
-    - logo_path: chemin du logo utilisateur
-    - output_path: chemin de sauvegarde
+    - logo_path: chemin, octets ou objet fichier du logo utilisateur
+    - output_path: chemin ou objet fichier de sauvegarde ; None pour retourner les octets encodés
     - card_template_path: chemin de l'image de carte
     - top_margin, right_margin: marges en px
     - max_width, max_height: taille max du logo
     - scale_factor: multiplicateur de taille
+    - preview: aperçu réduit à CARD_PREVIEW_SCALE, encodé rapidement
+    - as_image: retourne l'image PIL de la carte au lieu de l'encoder
+    - is_svg: force le traitement SVG (par défaut : déduit de l'extension ou du contenu)
+    - profile: profil d'encodage, avec transparence (voir ENCODER_PROFILES ; par défaut png, png_fast en aperçu)
+    - trim: rogne le logo à son contenu avant le détourage (voir trim_to_content)
     """
     try:
-        # Charger la carte
-        card = Image.open(card_template_path).convert('RGBA')
-        # Charger et traiter le logo (détourage, noir, etc.)
-        processed_logo = None
-        is_svg = logo_path.lower().endswith('.svg')
+        layout_options = dict(
+            card_template_path=card_template_path,
+            top_margin=top_margin,
+            right_margin=right_margin,
+            max_width=max_width,
+            max_height=max_height,
+            scale_factor=scale_factor,
+            horizontal_offset=horizontal_offset,
+            vertical_offset=vertical_offset,
+            override_limits=override_limits,
+            preview=preview,
+            as_image=as_image,
+            profile=profile
+        )
+        source, is_svg = resolve_source(logo_path, is_svg)
         if is_svg:
-            if cairosvg is None:
-                raise RuntimeError("CairoSVG n'est pas installé. Impossible de traiter les fichiers SVG.")
-            png_bytes: bytes = cairosvg.svg2png(url=logo_path)
-            img = Image.open(_io.BytesIO(png_bytes)).convert('RGBA')
-        else:
-            img = Image.open(logo_path)
-        if img.mode not in ['RGB', 'RGBA']:
-            img = img.convert('RGBA')
-        # Détourage simplifié (fond blanc -> transparent)
+            # SVG : dessiné directement à la taille finale, sans détourage ni redimensionnement
+            return render_svg_card_logo(load_svg(source), output_path, trim=trim, **layout_options)
+        processed_logo = prepare_card_logo(source, is_svg=False, fit_box=(max_width, max_height), trim=trim)
+        return render_card_logo(processed_logo, output_path, **layout_options)
+    except Exception as e:
+        logging.error(f"Error processing card logo: {str(e)}")
+        raise
+
+def prepare_card_logo(source, is_svg=None, fit_box=CARD_FIT_BOX, trim=False):
+    """
+    Détoure un logo pour la carte et retourne un LogoMask blanc.
+    - source: chemin, octets ou objet fichier du logo utilisateur
+    - is_svg: force le traitement SVG (par défaut : déduit de l'extension)
+    - fit_box: zone max du logo ; une source beaucoup plus grande est réduite avant le détourage (None : pleine résolution)
+    - trim: rogne le logo à son contenu avant le détourage (voir trim_to_content)
+    """
+    img, is_svg = load_logo_image(source, is_svg=is_svg, fit_box=None if trim else fit_box)
+    return detour_card_logo(img, fit_box=fit_box, trim=trim)
+
+def detour_card_logo(img, fit_box=CARD_FIT_BOX, trim=False):
+    """
+    Détourage de prepare_card_logo sur une image déjà décodée (voir load_logo_image), non modifiée.
+    - img: image retournée par load_logo_image
+    - fit_box: zone max du logo (voir prepare_card_logo)
+    - trim: rogne d'abord l'image à son contenu (voir trim_to_content)
+    """
+    if img.mode not in ['RGB', 'RGBA']:
+        img = img.convert('RGBA')
+    if trim:
+        img = trim_to_content(img, enhance=False)
+    img = reduce_for_fit(img, fit_box)
+    # Détourage simplifié (fond blanc -> transparent)
+    with stage('detour'):
         if img.mode == 'RGBA':
-            # Pour les PNG (ou images déjà avec transparence), on garde l'alpha et on colore en BLANC
-            r, g, b, alpha = img.split()
-            color_img = Image.new('RGB', img.size, (255, 255, 255))  # blanc
-            result = Image.new('RGBA', img.size)
-            result.paste(color_img, (0, 0), mask=alpha)
-            processed_logo = result
+            # Pour les PNG (ou images déjà avec transparence), l'alpha devient le masque du logo BLANC
+            processed_logo = LogoMask(img.getchannel('A'), (255, 255, 255))
         else:
-            # Pour les autres formats : détourage et recolorisation en BLANC
-            img_rgb = img.convert('RGB')
-            gray = ImageOps.grayscale(img_rgb)
-            binary = gray.point(lambda p: 0 if p < 245 else 255)
-            alpha_mask = binary.point(lambda p: 255 if p < 128 else 0)
-            color_img = Image.new('RGB', img.size, (255, 255, 255))
-            processed_logo = Image.new('RGBA', img.size)
-            processed_logo.paste(color_img, (0, 0), mask=alpha_mask)
-        # Redimensionnement proportionnel
-        original_width, original_height = processed_logo.size
-        # Calcul de la taille de base (fit) qui tient dans max_width×max_height
-        base_width_ratio = max_width / original_width
-        base_height_ratio = max_height / original_height
-        base_ratio = min(base_width_ratio, base_height_ratio)
+            # Pour les autres formats : détourage (seuil seul), logo BLANC
+            alpha_mask = detour_image(img, enhance=False)
+            processed_logo = LogoMask(Image.fromarray(alpha_mask), (255, 255, 255))
+    return processed_logo
 
-        if isinstance(override_limits, dict):
-            override_scale = override_limits.get('scale', False)
-        else:
-            override_scale = bool(override_limits)
+def render_card_logo(processed_logo, output_path, card_template_path='static/card_template.png', top_margin=35, right_margin=35, max_width=210, max_height=100, scale_factor=1.0, horizontal_offset=0, vertical_offset=0, override_limits=False, preview=False, as_image=False, profile=None):
+    """
+    Place un logo déjà détouré (voir prepare_card_logo) sur une carte bancaire.
+    - processed_logo: LogoMask blanc retourné par prepare_card_logo
+    - output_path: chemin ou objet fichier de sauvegarde ; None pour retourner les octets encodés
+    - card_template_path: chemin de l'image de carte
+    - top_margin, right_margin: marges en px
+    - max_width, max_height: taille max du logo
+    - scale_factor: multiplicateur de taille
+    - preview: aperçu réduit à CARD_PREVIEW_SCALE, encodé rapidement
+    - as_image: retourne l'image PIL de la carte au lieu de l'encoder
+    - profile: profil d'encodage, avec transparence (voir ENCODER_PROFILES ; par défaut png, png_fast en aperçu)
+    """
+    card, (paste_x, paste_y, new_width, new_height) = card_layout(
+        processed_logo.size, card_template_path, top_margin, right_margin, max_width, max_height,
+        scale_factor, horizontal_offset, vertical_offset, override_limits, preview
+    )
+    with stage('resize'):
+        resized_logo = processed_logo.resize((new_width, new_height))
+    return _finish_card(card, resized_logo, (paste_x, paste_y), output_path, preview, as_image, profile)
 
-        if override_scale:
-            # Appliquer le facteur par rapport à la taille de base (100% = fit)
-            ratio = base_ratio * scale_factor
-        else:
-            # Respecter les limites et appliquer le facteur
-            ratio = base_ratio * scale_factor
-        new_width = int(original_width * ratio)
-        new_height = int(original_height * ratio)
-        resized_logo = processed_logo.resize((new_width, new_height), Image.LANCZOS)
-        # Position sur la carte
-        paste_x = card.width - new_width - right_margin + int(horizontal_offset)
-        paste_y = top_margin + int(vertical_offset)
-        # S'assurer que le logo reste dans les limites du canevas
-        if isinstance(override_limits, dict):
-            override_position = override_limits.get('position', False)
-        else:
-            override_position = bool(override_limits)
-        if not override_position:
-            paste_x = max(0, min(paste_x, card.width - new_width))
-            paste_y = max(0, min(paste_y, card.height - new_height))
-        # Coller le logo
-        card.paste(resized_logo, (paste_x, paste_y), mask=resized_logo.split()[3])
-        # Sauvegarder en PNG pour conserver la transparence des coins
-        card.save(output_path, 'PNG')
-        return True
+def render_svg_card_logo(svg, output_path, card_template_path='static/card_template.png', top_margin=35, right_margin=35, max_width=210, max_height=100, scale_factor=1.0, horizontal_offset=0, vertical_offset=0, override_limits=False, preview=False, as_image=False, profile=None, trim=False):
+    """
+    Variante de render_card_logo pour un SVG, dessiné en blanc directement à la taille finale.
+    - svg: ParsedSvg retourné par load_svg
+    - trim: ajuste le dessin lui-même, sans les marges du document
+    - autres paramètres : voir render_card_logo
+    """
+    size, box = svg_extent(svg, trim)
+    card, (paste_x, paste_y, new_width, new_height) = card_layout(
+        size, card_template_path, top_margin, right_margin, max_width, max_height,
+        scale_factor, horizontal_offset, vertical_offset, override_limits, preview
+    )
+    resized_logo = _rasterize_svg(svg, (new_width, new_height), (255, 255, 255), box)
+    return _finish_card(card, resized_logo, (paste_x, paste_y), output_path, preview, as_image, profile)
+
+def card_layout(size, card_template_path='static/card_template.png', top_margin=35, right_margin=35, max_width=210, max_height=100, scale_factor=1.0, horizontal_offset=0, vertical_offset=0, override_limits=False, preview=False):
+    """
+    Géométrie du logo sur la carte : retourne (copie de la carte, (x, y, largeur, hauteur) du logo),
+    réduits à CARD_PREVIEW_SCALE si preview.
+    """
+    # Charger la carte (décodée une seule fois par le registre de modèles)
+    card_width, card_height = get_card_image(card_template_path).size
+    # Redimensionnement proportionnel
+    original_width, original_height = size
+    # Calcul de la taille de base (fit) qui tient dans max_width×max_height
+    base_width_ratio = max_width / original_width
+    base_height_ratio = max_height / original_height
+    base_ratio = min(base_width_ratio, base_height_ratio)
+
+    if isinstance(override_limits, dict):
+        override_scale = override_limits.get('scale', False)
+    else:
+        override_scale = bool(override_limits)
+
+    if override_scale:
+        # Appliquer le facteur par rapport à la taille de base (100% = fit)
+        ratio = base_ratio * scale_factor
+    else:
+        # Respecter les limites et appliquer le facteur
+        ratio = base_ratio * scale_factor
+    new_width = int(original_width * ratio)
+    new_height = int(original_height * ratio)
+    # Position sur la carte
+    paste_x = card_width - new_width - right_margin + int(horizontal_offset)
+    paste_y = top_margin + int(vertical_offset)
+    # S'assurer que le logo reste dans les limites du canevas
+    if isinstance(override_limits, dict):
+        override_position = override_limits.get('position', False)
+    else:
+        override_position = bool(override_limits)
+    if not override_position:
+        paste_x = max(0, min(paste_x, card_width - new_width))
+        paste_y = max(0, min(paste_y, card_height - new_height))
+    if preview:
+        # Aperçu : même géométrie, réduite proportionnellement
+        card = get_card_image(card_template_path, CARD_PREVIEW_SCALE).copy()
+        paste_x, paste_y, new_width, new_height = _preview_box(paste_x, paste_y, new_width, new_height, CARD_PREVIEW_SCALE)
+    else:
+        card = get_card_image(card_template_path).copy()
+    return card, (paste_x, paste_y, new_width, new_height)
+
+def card_geometry(size, card_template_path='static/card_template.png', top_margin=35, right_margin=35, max_width=210, max_height=100):
+    """
+    Règles de placement de card_layout sous forme de données (JSON), comme logo_geometry ;
+    le canevas est la carte, dessinée en fond par le client.
+    - size: taille du logo préparé, telle que passée à card_layout
+    - autres paramètres : voir card_layout
+    """
+    return {
+        'canvas': list(get_card_image(card_template_path).size),
+        'size': list(size),
+        'max_size': [max_width, max_height],
+        'top_margin': top_margin,
+        'right_margin': right_margin,
+    }
+
+def _finish_card(card, resized_logo, paste_position, output_path, preview, as_image, profile=None):
+    """Colle le logo redimensionné (LogoMask) sur la carte, puis encode en PNG."""
+    # Remplir le logo de sa couleur sur la carte, à travers son masque
+    with stage('composite'):
+        card.paste(resized_logo.color, paste_position, mask=resized_logo.mask)
+    if as_image:
+        return card
+    # Sauvegarder en PNG pour conserver la transparence des coins (compression rapide en aperçu)
+    return encode_image(card, output_path, resolve_profile(profile, 'card', preview))
+
+def render_thumbnail(processed_img, output_path, size=THUMBNAIL_SIZE, as_image=False, profile=None):
+    """
+    Vignette d'un logo déjà détouré (LogoMask) pour les pages de liste : le logo est ajusté
+    dans size sans être agrandi, sur fond transparent, puis encodé (PNG par défaut).
+
+    Args:
+        processed_img: LogoMask returned by prepare_logo
+        output_path: Path or file-like object to save the thumbnail, or None to return the encoded bytes
+        size: Largest (width, height) of the thumbnail (default: THUMBNAIL_SIZE)
+        as_image: Return the RGBA thumbnail instead of encoding it (default: False)
+        profile: Name of an encoder profile keeping transparency (default: png)
+    """
+    with stage('resize'):
+        logo = processed_img.resize(_thumbnail_size(processed_img.size, size))
+    return _finish_thumbnail(logo, output_path, as_image, profile)
+
+def render_svg_thumbnail(svg, output_path, size=THUMBNAIL_SIZE, as_image=False, profile=None, trim=False, invert=False):
+    """
+    Variante de render_thumbnail pour un SVG, dessiné directement à la taille de la vignette,
+    en noir (en blanc avec invert, comme sur une carte).
+    """
+    extent, box = svg_extent(svg, trim)
+    color = (255, 255, 255) if invert else (0, 0, 0)
+    logo = _rasterize_svg(svg, _thumbnail_size(extent, size), color, box)
+    return _finish_thumbnail(logo, output_path, as_image, profile)
+
+def _thumbnail_size(size, box):
+    ratio = min(1.0, box[0] / size[0], box[1] / size[1])
+    return max(1, int(size[0] * ratio)), max(1, int(size[1] * ratio))
+
+def _finish_thumbnail(logo, output_path, as_image, profile):
+    with stage('composite'):
+        thumbnail = Image.new('RGBA', logo.size, logo.color + (0,))
+        thumbnail.putalpha(logo.mask)
+    if as_image:
+        return thumbnail
+    return encode_image(thumbnail, output_path, resolve_profile(profile, 'thumbnail'))
+
+# Rendus de process_outputs : préparation utilisée, rendu d'un logo détouré, rendu d'un SVG
+# et options propres au SVG
+OUTPUT_KINDS = {
+    'canvas': ('logo', render_logo, render_svg_logo, {}),
+    'canvas_inverted': ('logo_inverted', render_logo, render_svg_logo, {'invert': True}),
+    'card': ('card', render_card_logo, render_svg_card_logo, {}),
+    'thumbnail': ('logo', render_thumbnail, render_svg_thumbnail, {}),
+}
+
+def card_preparation(max_width=CARD_FIT_BOX[0], max_height=CARD_FIT_BOX[1]):
+    """
+    Nom de la préparation de carte pour la zone max_width×max_height d'un modèle : la source
+    est réduite d'après cette zone avant le détourage, chaque zone a donc sa propre préparation
+    ('card' pour la zone par défaut, 'card_600x300' sinon).
+    """
+    if (max_width, max_height) == CARD_FIT_BOX:
+        return 'card'
+    return f"card_{int(max_width)}x{int(max_height)}"
+
+def trimmed_preparation(preparation, trim):
+    """Nom de la préparation, rognée à son contenu si trim (voir trim_to_content) : 'logo' -> 'logo_trimmed'."""
+    return f"{preparation}_trimmed" if trim else preparation
+
+def process_outputs(input_path, outputs, is_svg=None):
+    """
+    Produit plusieurs rendus d'un même logo (canevas, canevas inversé, carte, vignettes) en
+    ne décodant le fichier qu'une fois : chaque préparation (logo noir, logo blanc, logo de
+    carte) est calculée au plus une fois et partagée par tous les rendus qui l'utilisent.
+
+    Args:
+        input_path: Path, bytes or binary file-like object of the logo
+        outputs: Dict of output name -> options; options['kind'] is one of OUTPUT_KINDS
+            (default: 'canvas'), options['trim'] crops the logo to its content (see trim_to_content),
+            the other options are passed to render_logo, render_card_logo or render_thumbnail
+            (output_path defaults to None: encoded bytes are returned)
+        is_svg: Whether the input is an SVG (default: deduced from the path extension or the content)
+
+    Returns:
+        Dict of output name -> result of the renderer
+    """
+    try:
+        source, is_svg = resolve_source(input_path, is_svg)
+        if is_svg:
+            # SVG : chaque rendu est dessiné directement à sa taille, à partir du même document
+            return render_outputs(None, outputs, svg=load_svg(source))
+        # Zone de détourage de chaque préparation : une carte d'un autre modèle a sa propre zone
+        card_box = CARD_FIT_BOX
+        for options in outputs.values():
+            if options.get('kind') == 'card':
+                card_box = (options.get('max_width', CARD_FIT_BOX[0]), options.get('max_height', CARD_FIT_BOX[1]))
+        # Un seul décodage, assez grand pour la plus grande des zones (pleine résolution si un
+        # rendu est rogné : la taille du contenu n'est connue qu'après décodage)
+        decode_box = (max(LOGO_FIT_BOX[0], card_box[0]), max(LOGO_FIT_BOX[1], card_box[1]))
+        if any(options.get('trim') for options in outputs.values()):
+            decode_box = None
+        img, _ = load_logo_image(source, is_svg=False, fit_box=decode_box)
+        card = card_preparation(*card_box)
+        preparers = {
+            'logo': lambda: detour_logo(img),
+            'logo_inverted': lambda: detour_logo(img, invert=True),
+            card: lambda: detour_card_logo(img, fit_box=card_box),
+            'logo_trimmed': lambda: detour_logo(img, trim=True),
+            'logo_inverted_trimmed': lambda: detour_logo(img, invert=True, trim=True),
+            f"{card}_trimmed": lambda: detour_card_logo(img, fit_box=card_box, trim=True),
+        }
+        prepared = {}
+
+        def prepare(preparation):
+            if preparation not in prepared:
+                prepared[preparation] = preparers[preparation]()
+            return prepared[preparation]
+
+        return render_outputs(prepare, outputs)
     except Exception as e:
-        logging.error(f"Error processing card logo: {str(e)}")
+        logging.error(f"Error processing outputs: {str(e)}")
         raise
+
+def render_outputs(prepare, outputs, svg=None):
+    """
+    Rendus demandés (voir process_outputs) à partir de préparations partagées.
+    prepare(preparation) retourne le LogoMask de la préparation ('logo', 'logo_inverted' ou
+    celle de la zone de la carte, voir card_preparation, suffixée par _trimmed pour un rendu
+    rogné), calculé une seule fois par l'appelant ;
+    avec svg (ParsedSvg), les rendus sont dessinés directement depuis le document et prepare
+    n'est pas utilisé.
+    """
+    for name, options in outputs.items():
+        if options.get('kind', 'canvas') not in OUTPUT_KINDS:
+            raise ValueError(f"Rendu inconnu pour {name} : {options.get('kind')}")
+    results = {}
+    for name, options in outputs.items():
+        options = dict(options)
+        preparation, render, render_svg, svg_options = OUTPUT_KINDS[options.pop('kind', 'canvas')]
+        output_path = options.pop('output_path', None)
+        trim = options.pop('trim', False)
+        if preparation == 'card':
+            preparation = card_preparation(options.get('max_width', CARD_FIT_BOX[0]), options.get('max_height', CARD_FIT_BOX[1]))
+        if svg is not None:
+            results[name] = render_svg(svg, output_path, trim=trim, **options, **svg_options)
+        else:
+            results[name] = render(prepare(trimmed_preparation(preparation, trim)), output_path, **options)
+    return results
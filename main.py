@@ -1,6 +1,12 @@
-import logging
-from app import app
+import os
+
+# Serveur de développement : journaux détaillés par défaut (production : gunicorn -c gunicorn.conf.py)
+os.environ.setdefault('LOG_LEVEL', 'DEBUG')
+
+from app import create_app, init_worker
+
+app = create_app()
 
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.DEBUG)
+    init_worker()
     app.run(host="0.0.0.0", port=5050, debug=True)
@@ -0,0 +1,312 @@
+"""
+Cache des rendus du dossier processed/.
+
+Le nom de chaque rendu est dérivé d'une empreinte de (contenu source, fonction,
+paramètres normalisés) : une requête identique retrouve le fichier déjà produit au
+lieu de refaire le rendu. Un concierge en tâche de fond supprime les rendus trop
+anciens puis, si le dossier dépasse son quota, les moins récemment utilisés.
+
+Les rendus identiques demandés en même temps sont fusionnés (single-flight) : dans un
+processus, un seul thread exécute le rendu et les autres attendent son résultat ; entre
+les workers d'un même hôte, un verrou de fichier (flock) par rendu fait attendre les
+autres processus, qui trouvent ensuite le fichier produit.
+"""
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from card_templates import template_digest
+
+try:
+    import fcntl
+except ImportError:
+    # Pas de flock (Windows) : seule la fusion entre threads d'un même processus s'applique
+    fcntl = None
+
+# À incrémenter quand le rendu change, pour invalider les fichiers déjà en cache
+CACHE_VERSION = 5
+
+
+def content_digest(data):
+    """Empreinte SHA-256 d'un contenu source (octets ou texte)."""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def normalize_params(horizontal_offset=0, vertical_offset=0, scale_factor=1.0, override_limits=None, trim=False, **extra):
+    """
+    Paramètres de rendu sous une forme canonique : deux requêtes qui produisent le
+    même rendu (ex. offset '10' et '10.4') donnent la même clé. trim n'apparaît que s'il
+    est demandé, les clés des rendus non rognés restent inchangées. Pour une carte,
+    l'empreinte de l'image du modèle s'ajoute au chemin : remplacer le fichier change la clé.
+    """
+    if isinstance(override_limits, dict):
+        override = {'scale': bool(override_limits.get('scale')), 'position': bool(override_limits.get('position'))}
+    else:
+        override = {'scale': bool(override_limits), 'position': bool(override_limits)}
+    params = {
+        'horizontal_offset': int(horizontal_offset),
+        'vertical_offset': int(vertical_offset),
+        'scale_factor': round(float(scale_factor), 6),
+        'override': override,
+    }
+    if trim:
+        params['trim'] = True
+    params.update(extra)
+    if 'card_template_path' in extra:
+        params['card_template_digest'] = template_digest(extra['card_template_path'])
+    return params
+
+
+def render_key(source_digest, function, params):
+    """Clé d'un rendu : empreinte de la source, de la fonction et des paramètres."""
+    payload = json.dumps(
+        {'version': CACHE_VERSION, 'source': source_digest, 'function': function, 'params': params},
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+class _Flight:
+    """Rendu en cours dans le processus, attendu par les demandes identiques."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class RenderCache:
+    """
+    Cache disque des rendus, avec éviction par âge et par quota (LRU sur la date
+    de dernier accès, mise à jour à chaque succès du cache).
+
+    Args:
+        folder: Dossier des rendus (processed/)
+        max_age: Âge maximal d'un rendu non réutilisé, en secondes (default: 24 h)
+        max_bytes: Taille totale maximale du dossier, en octets (default: 512 Mo)
+        janitor_interval: Intervalle entre deux passages du concierge, en secondes (default: 300)
+    """
+
+    def __init__(self, folder, max_age=24 * 3600, max_bytes=512 * 1024 * 1024, janitor_interval=300):
+        self.folder = folder
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.janitor_interval = janitor_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._janitor = None
+        # Verrous de rendu partagés entre processus, un fichier par rendu
+        self.lock_dir = os.path.join(folder, '.locks')
+        os.makedirs(self.lock_dir, exist_ok=True)
+
+    def lookup(self, filename):
+        """Chemin du rendu s'il est en cache (compté comme succès), sinon None (échec)."""
+        path = os.path.join(self.folder, filename)
+        try:
+            # Succès : rafraîchir la date d'accès pour l'éviction LRU
+            os.utime(path)
+        except FileNotFoundError:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return path
+
+    def get_or_render(self, filename, render):
+        """
+        Retourne True si filename était déjà en cache (ou vient d'être produit par un rendu
+        identique concurrent), sinon appelle render(path) pour le produire (écriture
+        atomique) et retourne False.
+        """
+        if self.lookup(filename):
+            return True
+        rendered, _ = self._coalesce(filename, render)
+        return not rendered
+
+    def render_bytes(self, filename, render):
+        """
+        Octets d'un rendu absent du cache (après un échec de lookup) : render(None) retourne
+        les octets encodés, qui sont aussi écrits dans le cache. Les demandes identiques
+        concurrentes partagent le même rendu.
+        """
+        def produce(tmp_path):
+            data = render(None)
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            return data
+
+        _, data = self._coalesce(filename, produce)
+        if not isinstance(data, bytes):
+            # Produit par un autre processus, ou par get_or_render qui ne partage pas d'octets :
+            # relire le fichier publié
+            with open(os.path.join(self.folder, filename), 'rb') as f:
+                data = f.read()
+        return data
+
+    def _coalesce(self, filename, produce):
+        """
+        Exécute produce(tmp_path) une seule fois pour des demandes simultanées du même fichier,
+        puis le publie par renommage atomique. Retourne (True, valeur de produce) pour la
+        demande qui a fait le rendu, (False, octets partagés ou None) pour une demande fusionnée :
+        seuls des octets sont partagés, une autre valeur (ex. celle de save_image) ne l'est pas.
+        """
+        with self._lock:
+            flight = self._flights.get(filename)
+            leader = flight is None
+            if leader:
+                flight = self._flights[filename] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            self._count('coalesced')
+            return False, flight.value
+        try:
+            path = os.path.join(self.folder, filename)
+            with self._file_lock(filename):
+                if os.path.exists(path):
+                    # Produit par un autre processus pendant l'attente du verrou
+                    os.utime(path)
+                    self._count('coalesced')
+                    return False, None
+                tmp_path = os.path.join(self.folder, f".{uuid.uuid4().hex}.tmp")
+                try:
+                    value = produce(tmp_path)
+                    os.replace(tmp_path, path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+            flight.value = value if isinstance(value, bytes) else None
+            return True, value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[filename]
+            flight.done.set()
+
+    @contextlib.contextmanager
+    def _file_lock(self, filename):
+        """
+        Verrou exclusif du rendu entre processus (flock, libéré aussi si le processus meurt).
+        Le concierge peut supprimer un fichier de verrou libre : un verrou obtenu sur un
+        fichier qui n'est plus celui du chemin est repris sur le nouveau fichier.
+        """
+        if fcntl is None:
+            yield
+            return
+        path = os.path.join(self.lock_dir, f"{filename}.lock")
+        while True:
+            f = open(path, 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            except BaseException:
+                f.close()
+                raise
+            f.close()
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+    def _remove_lock(self, path):
+        """Supprime un fichier de verrou s'il n'est tenu par aucun processus (verrou pris sans attendre)."""
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            try:
+                # Supprimé tant que le verrou est tenu : un processus qui l'obtient ensuite
+                # constate que le fichier n'est plus celui du chemin
+                if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'coalesced': self.coalesced}
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def sweep(self):
+        """Supprime les rendus expirés puis les moins récents au-delà du quota."""
+        now = time.time()
+        entries = []
+        evicted = 0
+        for entry in os.scandir(self.folder):
+            if not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            # Les fichiers temporaires d'un rendu en cours ne sont supprimés que s'ils sont orphelins
+            max_age = self.max_age if not entry.name.endswith('.tmp') else max(self.max_age, 3600)
+            if now - stat.st_mtime > max_age:
+                evicted += self._remove(entry.path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            evicted += self._remove(path)
+            total -= size
+        # Verrous de rendus anciens, seulement s'ils sont libres
+        if fcntl is not None:
+            for entry in os.scandir(self.lock_dir):
+                try:
+                    if now - entry.stat().st_mtime > 3600:
+                        self._remove_lock(entry.path)
+                except FileNotFoundError:
+                    pass
+        if evicted:
+            self._count('evictions', evicted)
+            logging.info(f"Render cache: {evicted} fichier(s) évincé(s), {total} octets restants")
+        return evicted
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+
+    def start_janitor(self):
+        """Lance le concierge dans un thread démon (une seule fois par processus)."""
+        if self._janitor is not None:
+            return
+        self._janitor = threading.Thread(target=self._run_janitor, name='render-cache-janitor', daemon=True)
+        self._janitor.start()
+
+    def _run_janitor(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logging.error(f"Render cache janitor error: {str(e)}")
+            time.sleep(self.janitor_interval)
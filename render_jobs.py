@@ -0,0 +1,336 @@
+"""
+Rendus en ligne de commande, sans Flask, à partir de tâches JSON Lines.
+
+Chaque ligne de l'entrée (fichier ou stdin) décrit un rendu :
+
+    {"id": "acme", "type": "logo", "input": "logos/acme.png", "output": "out/acme.jpg",
+     "params": {"scale_factor": 1.2, "profile": "print"}}
+    {"type": "text", "text": "Mon Entreprise", "output": "out/texte.jpg"}
+    {"type": "card", "input": "logos/acme.svg", "output": "out/acme_card.png", "params": {"template": "default"}}
+
+Les paramètres sont ceux des formulaires /process_logo et /process_card (horizontal_offset,
+vertical_offset, scale_factor, override 'scale' ou 'pos', preview, profile, trim pour rogner
+les marges de l'image ; template pour une carte ; invert pour un logo). Les tâches sont
+exécutées par un pool de processus et une ligne de résultat JSON est écrite dès que chaque
+tâche se termine (ordre de fin, pas d'entrée), avec sa durée, ses étapes et son erreur
+éventuelle. L'entrée est lue au fil de l'eau : au plus --pending tâches sont en cours à la
+fois, quelle que soit la longueur du fichier.
+
+Avec --checkpoint, le nombre de lignes de tête entièrement traitées est enregistré au fil des
+résultats ; relancer la même commande reprend après ces lignes et complète le fichier de
+résultats. Une tâche terminée après le point de reprise peut être refaite (et son résultat
+réécrit) : chaque sortie est écrite de façon atomique, la refaire est sans danger.
+
+Le délai d'une tâche (--timeout) court à partir de son démarrage dans un processus, pas de
+sa soumission. Une tâche qui le dépasse est arrêtée avec son processus (voir worker_pool) ;
+le rendu est écrit dans un fichier temporaire que seul le processus principal renomme, une
+fois la tâche réussie : une tâche marquée en échec ne publie jamais de sortie.
+
+    python render_jobs.py jobs.jsonl --workers 8 --output results.jsonl --checkpoint jobs.ckpt
+    cat jobs.jsonl | python render_jobs.py - > results.jsonl
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, CancelledError, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from card_templates import card_template_options, load_card_templates_config
+from logo_processor import process_logo, process_text_logo, process_card_logo, resolve_profile
+from timing import StageRecorder, recording
+from worker_pool import WatchedPool
+import tiling
+
+JOB_TYPES = ('logo', 'text', 'card')
+
+# Nouvelles soumissions d'une tâche dont le processus est mort avec une autre (tâche arrêtée, OOM)
+MAX_JOB_RETRIES = 2
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def job_options(job_type, params):
+    """
+    Paramètres de rendu d'une tâche, lus comme les champs des formulaires de l'application.
+    Lève ValueError si un paramètre est invalide, KeyError si le modèle de carte est inconnu.
+    """
+    override = params.get('override')
+    preview = params.get('preview') in (True, 1, '1', 'true')
+    target = 'card' if job_type == 'card' else 'logo'
+    options = dict(
+        horizontal_offset=float(params.get('horizontal_offset', 0)),
+        vertical_offset=float(params.get('vertical_offset', 0)),
+        scale_factor=float(params.get('scale_factor', 1.0)),
+        override_limits={'scale': override == 'scale', 'position': override == 'pos'},
+        preview=preview,
+        profile=resolve_profile(params.get('profile') or None, target, preview)
+    )
+    if job_type == 'card':
+        options.update(card_template_options(params.get('template') or None))
+        path = options['card_template_path']
+        if not os.path.isabs(path) and not os.path.exists(path):
+            # Modèles déclarés relativement au dépôt : valables quel que soit le dossier courant
+            options['card_template_path'] = os.path.join(_BASE_DIR, path)
+    elif job_type == 'logo' and params.get('invert'):
+        options['invert'] = True
+    if job_type != 'text' and params.get('trim') in (True, 1, '1', 'true'):
+        options['trim'] = True
+    return options
+
+
+def parse_job(line):
+    """
+    Tâche d'une ligne JSON : (type, source, chemin de sortie, options).
+    Lève ValueError (ou KeyError) si la tâche est invalide.
+    """
+    job = json.loads(line)
+    if not isinstance(job, dict):
+        raise ValueError("Tâche invalide : objet JSON attendu")
+    job_type = job.get('type', 'logo')
+    if job_type not in JOB_TYPES:
+        raise ValueError(f"Type de tâche inconnu : {job_type} (attendu : {', '.join(JOB_TYPES)})")
+    source = job.get('text') if job_type == 'text' else job.get('input')
+    if not source:
+        raise ValueError("Texte manquant" if job_type == 'text' else "Chemin d'entrée manquant")
+    if not job.get('output'):
+        raise ValueError("Chemin de sortie manquant")
+    return job_type, source, job['output'], job_options(job_type, job.get('params') or {})
+
+
+def configure_worker(tile_threads):
+    """Initialisation d'un processus du pool : threads du traitement par bandes (voir tiling)."""
+    tiling.TILE_THREADS = tile_threads
+
+
+def run_job(job_type, source, tmp_path, options):
+    """
+    Rendu d'une tâche dans un processus du pool : retourne (durée en secondes, durées par étape).
+    La sortie est écrite dans tmp_path ; le processus principal la renomme si la tâche réussit.
+    """
+    recorder = StageRecorder()
+    start = time.perf_counter()
+    try:
+        with recording(recorder):
+            if job_type == 'text':
+                process_text_logo(source, tmp_path, **options)
+            elif job_type == 'card':
+                process_card_logo(source, tmp_path, **options)
+            else:
+                process_logo(source, tmp_path, **options)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    stages = {name: round(seconds, 4) for name, seconds in recorder.totals().items()}
+    return time.perf_counter() - start, stages
+
+
+class Checkpoint:
+    """
+    Nombre de lignes de tête de l'entrée entièrement traitées, enregistré dans un fichier.
+    Les lignes terminées dans le désordre sont gardées jusqu'à ce que le front les rejoigne.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = 0
+        self._finished = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.done = int(json.load(f)['done'])
+
+    def finish(self, line_number):
+        self._finished.add(line_number)
+        advanced = False
+        while self.done + 1 in self._finished:
+            self._finished.remove(self.done + 1)
+            self.done += 1
+            advanced = True
+        if advanced and self.path:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'done': self.done}, f)
+            os.replace(tmp_path, self.path)
+
+
+class JobRunner:
+    """
+    Exécute des tâches JSON Lines sur un pool de processus.
+
+    Args:
+        workers: Nombre de processus de rendu (default: nombre de CPU)
+        max_pending: Nombre maximal de tâches en cours (default: 2 × workers)
+        job_timeout: Durée maximale d'une tâche, en secondes (default: 60)
+        tile_threads: Threads par processus pour les très grandes images, voir tiling (default: 1,
+            les processus occupent déjà les cœurs)
+    """
+
+    def __init__(self, workers=None, max_pending=None, job_timeout=60, tile_threads=1):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 2 * self.workers
+        self.job_timeout = job_timeout
+        self.tile_threads = tile_threads
+        self.succeeded = 0
+        self.failed = 0
+
+    def run(self, lines, results, checkpoint):
+        """
+        Lit les tâches de lines (itérable de lignes) en sautant les checkpoint.done premières,
+        et écrit une ligne JSON par tâche terminée dans results.
+        """
+        pool = WatchedPool(self.workers, initializer=configure_worker, initargs=(self.tile_threads,))
+        pending = {}
+        # Tâches à soumettre de nouveau : (ligne, infos, arguments de run_job, soumissions refaites)
+        retry = []
+        # Fichiers temporaires des tâches arrêtées, supprimés une fois le pool arrêté
+        abandoned = []
+        lines = iter(lines)
+        line_number = 0
+        exhausted = False
+        try:
+            while not exhausted or pending or retry:
+                while retry and len(pending) < self.max_pending:
+                    number, job, args, retries = retry.pop()
+                    future, token = pool.submit(run_job, *args)
+                    pending[future] = (number, job, args, retries, token)
+                while not exhausted and len(pending) < self.max_pending:
+                    line = next(lines, None)
+                    if line is None:
+                        exhausted = True
+                        break
+                    line_number += 1
+                    if line_number <= checkpoint.done:
+                        continue
+                    if not line.strip():
+                        checkpoint.finish(line_number)
+                        continue
+                    job = self._job_info(line)
+                    try:
+                        job_type, source, output_path, options = parse_job(line)
+                        job['profile'] = options['profile']
+                        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+                        args = (job_type, source, self._tmp_path(output_path), options)
+                        future, token = pool.submit(run_job, *args)
+                    except Exception as e:
+                        self._write(results, checkpoint, line_number, job, error=str(e) or type(e).__name__)
+                        continue
+                    pending[future] = (line_number, job, args, 0, token)
+                if not pending:
+                    continue
+                done, _ = wait(pending, timeout=min(1.0, self.job_timeout), return_when=FIRST_COMPLETED)
+                for future in done:
+                    number, job, args, retries, token = pending.pop(future)
+                    try:
+                        seconds, stages = future.result()
+                        # Sortie publiée par le processus principal, seulement pour une tâche réussie
+                        os.replace(args[2], job['output'])
+                    except CancelledError:
+                        # Tâche pas encore démarrée dans un pool abandonné : soumise à nouveau
+                        retry.append((number, job, args, retries))
+                        continue
+                    except BrokenProcessPool as e:
+                        # Un processus mort (tâche arrêtée, OOM) rend le pool inutilisable : recréé
+                        # à la prochaine soumission, la tâche est soumise à nouveau
+                        pool.discard(token)
+                        abandoned.append(args[2])
+                        if retries < MAX_JOB_RETRIES:
+                            retry.append((number, job, args, retries + 1))
+                            continue
+                        self._write(results, checkpoint, number, job, error=str(e) or type(e).__name__)
+                        continue
+                    except Exception as e:
+                        self._write(results, checkpoint, number, job, error=str(e) or type(e).__name__)
+                        continue
+                    finally:
+                        pool.forget(token)
+                    self._write(results, checkpoint, number, job, seconds=seconds, stages=stages)
+                for future, (number, job, args, retries, token) in list(pending.items()):
+                    if not future.done() and pool.expired(token, self.job_timeout):
+                        pool.kill(future, token)
+                        pool.forget(token)
+                        del pending[future]
+                        abandoned.append(args[2])
+                        self._write(results, checkpoint, number, job, error=f"Délai dépassé ({self.job_timeout:g} s)")
+        finally:
+            pool.shutdown()
+            for tmp_path in abandoned:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    @staticmethod
+    def _tmp_path(output_path):
+        """Fichier temporaire propre à une tâche, dans le dossier de sa sortie (renommage atomique)."""
+        return f"{output_path}.{uuid.uuid4().hex[:12]}.tmp"
+
+    @staticmethod
+    def _job_info(line):
+        """Champs d'identification repris dans le résultat (même si la tâche est invalide)."""
+        try:
+            job = json.loads(line)
+        except ValueError:
+            return {}
+        if not isinstance(job, dict):
+            return {}
+        return {key: job[key] for key in ('id', 'type', 'output') if key in job}
+
+    def _write(self, results, checkpoint, line_number, job, seconds=None, stages=None, error=None):
+        entry = dict(job, line=line_number, success=error is None)
+        if error is None:
+            self.succeeded += 1
+            entry['seconds'] = round(seconds, 3)
+            entry['stages'] = stages
+        else:
+            self.failed += 1
+            logging.error(f"Job line {line_number} failed: {error}")
+            entry['error'] = error
+        results.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        results.flush()
+        # Le point de reprise n'avance qu'une fois le résultat écrit
+        checkpoint.finish(line_number)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rendus de logos à partir de tâches JSON Lines")
+    parser.add_argument('input', nargs='?', default='-', help="Fichier de tâches JSON Lines ('-' : entrée standard)")
+    parser.add_argument('--output', '-o', default='-', help="Fichier des résultats JSON Lines ('-' : sortie standard)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Processus de rendu")
+    parser.add_argument('--pending', type=int, help="Tâches en cours au maximum (par défaut : 2 × workers)")
+    parser.add_argument('--timeout', type=float, default=60, help="Durée maximale d'une tâche, en secondes")
+    parser.add_argument('--tile-threads', type=int, default=1,
+                        help="Threads par processus pour les très grandes images (traitement par bandes)")
+    parser.add_argument('--checkpoint', help="Fichier de reprise : lignes déjà traitées sautées, mis à jour au fil des résultats")
+    parser.add_argument('--card-templates', default=os.environ.get('CARD_TEMPLATES_FILE'),
+                        help="Fichier JSON de modèles de carte supplémentaires")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'WARNING').upper())
+    if args.card_templates:
+        load_card_templates_config(args.card_templates)
+
+    checkpoint = Checkpoint(args.checkpoint)
+    if checkpoint.done:
+        logging.warning(f"Reprise après la ligne {checkpoint.done}")
+    runner = JobRunner(workers=args.workers, max_pending=args.pending, job_timeout=args.timeout,
+                       tile_threads=args.tile_threads)
+    start = time.perf_counter()
+    source = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+    # Résultats complétés (et non écrasés) lors d'une reprise
+    results = sys.stdout if args.output == '-' else open(args.output, 'a' if checkpoint.done else 'w', encoding='utf-8')
+    try:
+        runner.run(source, results, checkpoint)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if results is not sys.stdout:
+            results.close()
+    elapsed = time.perf_counter() - start
+    print(f"{runner.succeeded} rendu(s), {runner.failed} échec(s) en {elapsed:.1f} s", file=sys.stderr)
+    return 1 if runner.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,6 +2,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const logoForm = document.getElementById('logo-form');
     const uploadBtn = document.getElementById('upload-btn');
     const previewImage = document.getElementById('preview-image');
+    const previewCanvas = document.getElementById('preview-canvas');
     const noPreview = document.getElementById('no-preview');
     const loading = document.getElementById('loading');
     const previewDownloadBtn = document.getElementById('preview-download-btn');
@@ -25,6 +26,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const verticalIncrease = document.getElementById('vertical-increase');
     const scaleDecrease = document.getElementById('scale-decrease');
     const scaleIncrease = document.getElementById('scale-increase');
+    const trimMargins = document.getElementById('trim-margins');
     
     // Nouveaux éléments pour le choix image/texte
     const typeImage = document.getElementById('type-image');
@@ -37,10 +39,44 @@ document.addEventListener('DOMContentLoaded', function() {
     const typeCard = document.getElementById('type-card');
     const cardSection = document.getElementById('card-section');
     const cardLogoInput = document.getElementById('card-logo');
+    const cardTemplateGroup = document.getElementById('card-template-group');
+    const cardTemplateSelect = document.getElementById('card-template');
+    
+    // Charger la liste des modèles de carte (sélecteur affiché s'il y en a plusieurs)
+    fetch('/card_templates')
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) return;
+        data.templates.forEach(name => {
+            const option = document.createElement('option');
+            option.value = name;
+            option.textContent = name;
+            cardTemplateSelect.appendChild(option);
+        });
+        if (data.templates.length > 1) {
+            cardTemplateGroup.classList.remove('d-none');
+        }
+    })
+    .catch(() => {});
+    
+    cardTemplateSelect.addEventListener('change', function() {
+        if (currentType === 'card' && currentFilename) {
+            debounceUpdate();
+        }
+    });
     
     let currentFilename = null; // Stocker le nom du fichier traité
     let currentType = 'image'; // Type actuel (image ou text)
     let lastAction = null; // 'pos' | 'scale' | null
+    let currentHandle = null; // Handle du logo déjà téléversé sur le serveur
+    let handleFile = null; // Fichier auquel correspond currentHandle
+    let previewObjectUrl = null; // URL locale de l'aperçu reçu en mode stream
+    let lastOverride = null; // Override envoyé avec le dernier aperçu, réutilisé à l'export
+    // Aperçu composé par le navigateur (logo image et carte) : le calque du logo détouré et les
+    // règles de placement sont reçus une fois, chaque ajustement est ensuite dessiné localement
+    const clientComposite = !!(previewCanvas && previewCanvas.getContext);
+    let clientLayer = null; // { target, file, trim, template, geometry, layer, background }
+    let pendingLayer = null; // Calque en cours de chargement
     
     // Gestionnaire pour le champ texte avec mise à jour automatique
     logoTextInput.addEventListener('input', function() {
@@ -78,6 +114,13 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
+    // Rognage des marges du fichier : le logo remplit sa zone à 100 %
+    trimMargins.addEventListener('change', function() {
+        if (currentFilename) {
+            debounceUpdate();
+        }
+    });
+
     // --- Boutons de nudge ---
     function clamp(value, min, max) { return Math.max(min, Math.min(max, value)); }
     function nudgeHorizontal(delta) {
@@ -161,6 +204,9 @@ document.addEventListener('DOMContentLoaded', function() {
     let updateTimeout;
     function debounceUpdate() {
         clearTimeout(updateTimeout);
+        if (compositeIfReady()) {
+            return;
+        }
         updateTimeout = setTimeout(() => {
             if (currentType === 'text') {
                 const text = logoTextInput.value.trim();
@@ -224,24 +270,342 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
     
+    // Téléverser le fichier une seule fois et récupérer son handle
+    function getHandle(file) {
+        if (currentHandle && handleFile === file) {
+            return Promise.resolve(currentHandle);
+        }
+        const formData = new FormData();
+        formData.append('logo', file);
+        return fetch('/upload_logo', {
+            method: 'POST',
+            body: formData
+        })
+        .then(handleResponse)
+        .then(data => {
+            if (!data.success) {
+                throw new Error(data.error || 'Une erreur est survenue lors du téléversement');
+            }
+            currentHandle = data.handle;
+            handleFile = file;
+            return currentHandle;
+        });
+    }
+    
+    // Envoyer les paramètres avec le handle du logo (sans renvoyer le fichier)
+    function postWithHandle(url, file, formData, retried) {
+        return getHandle(file)
+            .then(handle => {
+                formData.set('handle', handle);
+                return fetch(url, {
+                    method: 'POST',
+                    body: formData
+                });
+            })
+            .then(response => {
+                if (response.status === 404 && !retried) {
+                    // Logo évincé du cache serveur : le renvoyer une fois
+                    currentHandle = null;
+                    return postWithHandle(url, file, formData, true);
+                }
+                return response;
+            });
+    }
+    
+    // Canal d'aperçu en direct : les réglages partent en POST, les aperçus reviennent par SSE et
+    // le serveur ne garde que la demande la plus récente (les rendus périmés sont abandonnés)
+    const liveChannelId = Array.from(crypto.getRandomValues(new Uint8Array(16)), b => b.toString(16).padStart(2, '0')).join('');
+    let liveSource = null;
+    
+    function liveAvailable() {
+        // Le premier rendu passe par la requête classique ; les ajustements suivants par le canal
+        return !!window.EventSource && currentFilename !== null;
+    }
+    
+    function openLiveChannel() {
+        if (liveSource) return;
+        liveSource = new EventSource(`/live/${liveChannelId}/events`);
+        liveSource.addEventListener('preview', function(e) {
+            const data = JSON.parse(e.data);
+            if (!data.success) {
+                showError(data.error || 'Une erreur est survenue lors du traitement');
+                return;
+            }
+            const bytes = Uint8Array.from(atob(data.image), c => c.charCodeAt(0));
+            handleSuccess({ success: true, blob: new Blob([bytes], { type: data.mimetype }) });
+        });
+    }
+    
+    function sendLive(target, file, formData) {
+        openLiveChannel();
+        formData.set('target', target);
+        const url = `/live/${liveChannelId}`;
+        const request = file ? postWithHandle(url, file, formData) : fetch(url, { method: 'POST', body: formData });
+        return request
+            .then(handleResponse)
+            .then(data => {
+                if (!data.success) {
+                    throw new Error(data.error || 'Une erreur est survenue lors du traitement');
+                }
+            })
+            .catch(handleError);
+    }
+    
+    // Override du dernier ajustement ('pos' ou 'scale'), consommé par l'aperçu et réutilisé à l'export
+    function consumeOverride() {
+        lastOverride = null;
+        if (fromSlider && lastAction) {
+            lastOverride = lastAction;
+            fromSlider = false;
+            lastAction = null;
+        }
+        return lastOverride;
+    }
+    
+    // Options communes aux aperçus interactifs : override éventuel et rendu basse résolution
+    function appendRenderOptions(formData) {
+        if (consumeOverride()) {
+            formData.append('override', lastOverride);
+        }
+        if (trimMargins.checked) {
+            formData.append('trim', '1');
+        }
+        formData.append('preview', '1');
+        // Recevoir l'image directement dans la réponse, sans second aller-retour
+        formData.append('stream', '1');
+    }
+    
+    // Export final en qualité impression, produit uniquement au téléchargement
+    function exportFinal() {
+        const formData = new FormData();
+        formData.append('horizontal_offset', horizontalPosition.value);
+        formData.append('vertical_offset', verticalPosition.value);
+        formData.append('scale_factor', scaleFactor.value);
+        if (lastOverride) {
+            formData.append('override', lastOverride);
+        }
+        if (trimMargins.checked) {
+            formData.append('trim', '1');
+        }
+        
+        // Rendu impression en tâche asynchrone : le serveur répond tout de suite avec un identifiant
+        formData.append('async', '1');
+        
+        let send;
+        if (currentType === 'text') {
+            formData.append('type', 'text');
+            formData.append('logo-text', logoTextInput.value.trim());
+            send = () => fetch('/export', {
+                method: 'POST',
+                body: formData
+            });
+        } else if (currentType === 'card') {
+            formData.append('target', 'card');
+            formData.append('template', cardTemplateSelect.value);
+            send = () => postWithHandle('/export', cardLogoInput.files[0], formData);
+        } else {
+            formData.append('type', 'image');
+            send = () => postWithHandle('/export', document.getElementById('logo').files[0], formData);
+        }
+        
+        previewDownloadBtn.classList.add('disabled');
+        submitJob(send)
+        .then(waitForJob)
+        .then(data => {
+            const link = document.createElement('a');
+            link.href = `/processed/${data.filename}?download=true`;
+            link.download = data.filename;
+            document.body.appendChild(link);
+            link.click();
+            link.remove();
+        })
+        .catch(handleError)
+        .finally(() => previewDownloadBtn.classList.remove('disabled'));
+    }
+    
+    // Soumet une tâche de rendu ; si la file du serveur est pleine (429), réessaie après Retry-After
+    function submitJob(send, attempt = 0) {
+        return send().then(response => {
+            if (response.status === 429 && attempt < 5) {
+                const retryAfter = parseInt(response.headers.get('Retry-After'), 10) || 2;
+                return new Promise(resolve => setTimeout(resolve, retryAfter * 1000))
+                    .then(() => submitJob(send, attempt + 1));
+            }
+            return handleResponse(response);
+        });
+    }
+    
+    // Attente longue du résultat : chaque requête reste ouverte jusqu'à la fin du rendu (ou 25 s)
+    function waitForJob(data) {
+        if (!data.success) {
+            throw new Error(data.error || 'Une erreur est survenue lors de l\'export');
+        }
+        if (!data.job_id) {
+            // Réponse synchrone (mode async non pris en charge)
+            return data;
+        }
+        return fetch(`/jobs/${data.job_id}?wait=25`)
+            .then(handleResponse)
+            .then(job => {
+                if (job.status === 'done') {
+                    return job;
+                }
+                if (job.status === 'failed') {
+                    throw new Error(job.error || 'Une erreur est survenue lors de l\'export');
+                }
+                return waitForJob(job);
+            });
+    }
+    
+    previewDownloadBtn.addEventListener('click', function(e) {
+        e.preventDefault();
+        exportFinal();
+    });
+    
+    // --- Composition locale de l'aperçu ---
+    function layerState(target, file) {
+        return {
+            target: target,
+            file: file,
+            trim: trimMargins.checked,
+            template: target === 'card' ? cardTemplateSelect.value : null
+        };
+    }
+    
+    function sameLayer(layer, target, file) {
+        const state = layerState(target, file);
+        return !!layer && layer.target === state.target && layer.file === state.file
+            && layer.trim === state.trim && layer.template === state.template;
+    }
+    
+    function loadImage(url) {
+        return new Promise((resolve, reject) => {
+            const image = new Image();
+            image.onload = () => resolve(image);
+            image.onerror = () => reject(new Error('Impossible de charger l\'aperçu'));
+            image.src = url;
+        });
+    }
+    
+    // Calque du logo et règles de placement, demandés une fois par logo, rognage et modèle
+    function loadComposite(target, file) {
+        if (sameLayer(clientLayer, target, file)) {
+            drawComposite();
+            return;
+        }
+        if (sameLayer(pendingLayer, target, file)) {
+            // Déjà demandé : le calque sera dessiné avec les réglages du moment à son arrivée
+            return;
+        }
+        const state = layerState(target, file);
+        pendingLayer = state;
+        const formData = new FormData();
+        formData.append('composite', 'client');
+        if (state.trim) {
+            formData.append('trim', '1');
+        }
+        let url = '/process_logo';
+        if (target === 'card') {
+            formData.append('template', state.template);
+            url = '/process_card';
+        } else {
+            formData.append('type', 'image');
+        }
+        postWithHandle(url, file, formData)
+        .then(handleResponse)
+        .then(data => {
+            if (!data.success) {
+                throw new Error(data.error || 'Une erreur est survenue lors du traitement');
+            }
+            const background = data.geometry.background_url ? loadImage(data.geometry.background_url) : null;
+            return Promise.all([loadImage(data.layer_url), background]).then(([layer, backgroundImage]) => {
+                if (pendingLayer !== state) return;  // Réponse périmée (logo, rognage ou modèle changé)
+                pendingLayer = null;
+                clientLayer = Object.assign(state, { geometry: data.geometry, layer: layer, background: backgroundImage });
+                drawComposite();
+            });
+        })
+        .catch(error => {
+            if (pendingLayer === state) {
+                pendingLayer = null;
+                handleError(error);
+            }
+        });
+    }
+    
+    // Ajustement dessiné sans requête si le calque du logo courant est déjà chargé
+    function compositeIfReady() {
+        if (!clientComposite || currentType === 'text') return false;
+        const file = currentType === 'card' ? cardLogoInput.files[0] : document.getElementById('logo').files[0];
+        if (!file || !sameLayer(clientLayer, currentType, file)) return false;
+        drawComposite();
+        return true;
+    }
+    
+    // Mêmes règles que logo_layout / card_layout côté serveur (int() de Python : Math.trunc)
+    function placeLayer(geometry, override) {
+        const [width, height] = geometry.size;
+        const [maxWidth, maxHeight] = geometry.max_size;
+        const [canvasWidth, canvasHeight] = geometry.canvas;
+        const ratio = Math.min(maxWidth / width, maxHeight / height) * parseFloat(scaleFactor.value);
+        const newWidth = Math.trunc(width * ratio);
+        const newHeight = Math.trunc(height * ratio);
+        let x = canvasWidth - newWidth - geometry.right_margin + Math.trunc(parseFloat(horizontalPosition.value));
+        let y = geometry.top_margin + Math.trunc(parseFloat(verticalPosition.value));
+        if (override !== 'pos') {
+            // Le logo reste dans les limites du canevas
+            x = clamp(x, 0, canvasWidth - newWidth);
+            y = clamp(y, 0, canvasHeight - newHeight);
+        }
+        return { x: x, y: y, width: newWidth, height: newHeight };
+    }
+    
+    function drawComposite() {
+        const geometry = clientLayer.geometry;
+        const place = placeLayer(geometry, consumeOverride());
+        const [canvasWidth, canvasHeight] = geometry.canvas;
+        previewCanvas.width = canvasWidth;
+        previewCanvas.height = canvasHeight;
+        const context = previewCanvas.getContext('2d');
+        if (clientLayer.background) {
+            context.drawImage(clientLayer.background, 0, 0, canvasWidth, canvasHeight);
+        } else {
+            context.fillStyle = geometry.background;
+            context.fillRect(0, 0, canvasWidth, canvasHeight);
+        }
+        context.imageSmoothingQuality = 'high';
+        context.drawImage(clientLayer.layer, place.x, place.y, place.width, place.height);
+        
+        currentFilename = 'client';
+        adjustmentControls.classList.remove('d-none');
+        downloadContainer.classList.remove('d-none');
+        previewImage.classList.add('d-none');
+        previewCanvas.classList.remove('d-none');
+        noPreview.classList.add('d-none');
+        loading.classList.add('d-none');
+        errorMessage.classList.add('d-none');
+        adjustGuidesToImage();
+        simpleGuides.classList.remove('d-none');
+    }
+    
     // Fonction pour traiter l'image
     function processImage(file) {
+        if (clientComposite) {
+            loadComposite('image', file);
+            return;
+        }
         const formData = new FormData();
-        formData.append('logo', file);
         formData.append('horizontal_offset', horizontalPosition.value);
         formData.append('vertical_offset', verticalPosition.value);
         formData.append('scale_factor', scaleFactor.value);
         formData.append('type', 'image');
-        if (fromSlider && lastAction) {
-            formData.append('override', lastAction);
-            fromSlider = false;
-            lastAction = null;
+        appendRenderOptions(formData);
+        if (liveAvailable()) {
+            sendLive('logo', file, formData);
+            return;
         }
         
-        fetch('/process_logo', {
-            method: 'POST',
-            body: formData
-        })
+        postWithHandle('/process_logo', file, formData)
         .then(handleResponse)
         .then(handleSuccess)
         .catch(handleError);
@@ -255,10 +619,10 @@ document.addEventListener('DOMContentLoaded', function() {
         formData.append('vertical_offset', verticalPosition.value);
         formData.append('scale_factor', parseFloat(scaleFactor.value));
         formData.append('type', 'text');
-        if (fromSlider && lastAction) {
-            formData.append('override', lastAction);
-            fromSlider = false;
-            lastAction = null;
+        appendRenderOptions(formData);
+        if (liveAvailable()) {
+            sendLive('text', null, formData);
+            return;
         }
         
         console.log('Sending text with scale_factor:', parseFloat(scaleFactor.value));
@@ -274,50 +638,64 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Fonction pour traiter le logo pour la carte
     function processCard(file) {
+        if (clientComposite) {
+            loadComposite('card', file);
+            return;
+        }
         const formData = new FormData();
-        formData.append('logo', file);
+        formData.append('template', cardTemplateSelect.value);
         formData.append('horizontal_offset', horizontalPosition.value);
         formData.append('vertical_offset', verticalPosition.value);
         formData.append('scale_factor', scaleFactor.value);
-        if (fromSlider && lastAction) {
-            formData.append('override', lastAction);
-            fromSlider = false;
-            lastAction = null;
+        appendRenderOptions(formData);
+        if (liveAvailable()) {
+            sendLive('card', file, formData);
+            return;
         }
-        fetch('/process_card', {
-            method: 'POST',
-            body: formData
-        })
+        postWithHandle('/process_card', file, formData)
         .then(handleResponse)
         .then(handleSuccess)
         .catch(handleError);
     }
     
-    // Fonction pour gérer la réponse
+    // Fonction pour gérer la réponse (JSON avec nom de fichier, ou image en mode stream)
     function handleResponse(response) {
         if (!response.ok) {
             return response.json().then(data => {
                 throw new Error(data.error || 'Une erreur est survenue lors du traitement');
             });
         }
+        const contentType = response.headers.get('Content-Type') || '';
+        if (contentType.startsWith('image/')) {
+            return response.blob().then(blob => ({ success: true, blob: blob }));
+        }
         return response.json();
     }
     
     // Fonction pour gérer le succès
     function handleSuccess(data) {
         if (data.success) {
-            currentFilename = data.filename;
+            currentFilename = data.filename || 'stream';
             
             // Afficher les contrôles d'ajustement
             adjustmentControls.classList.remove('d-none');
             
-            // Mettre à jour le bouton de téléchargement
-            previewDownloadBtn.href = `/processed/${data.filename}?download=true`;
+            // Le bouton de téléchargement déclenche l'export en qualité impression
             downloadContainer.classList.remove('d-none');
             
             // Afficher l'image
-            const timestamp = new Date().getTime(); // Cache-busting
-            previewImage.src = `/processed/${data.filename}?t=${timestamp}`;
+            if (previewObjectUrl) {
+                URL.revokeObjectURL(previewObjectUrl);
+                previewObjectUrl = null;
+            }
+            if (data.blob) {
+                previewObjectUrl = URL.createObjectURL(data.blob);
+                previewImage.src = previewObjectUrl;
+            } else {
+                // Le nom dérive de l'empreinte du rendu : l'image déjà vue reste dans le cache du navigateur
+                previewImage.src = `/processed/${data.filename}`;
+            }
+            previewCanvas.classList.add('d-none');
             previewImage.classList.remove('d-none');
             previewImage.classList.add('fadeIn');
             
@@ -376,6 +754,7 @@ document.addEventListener('DOMContentLoaded', function() {
         loading.classList.remove('d-none');
         errorMessage.classList.add('d-none');
         previewImage.classList.add('d-none');
+        previewCanvas.classList.add('d-none');
         noPreview.classList.add('d-none');
         downloadContainer.classList.add('d-none');
         simpleGuides.classList.add('d-none');
@@ -383,7 +762,9 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Fonction pour ajuster les guides aux dimensions de l'image
     function adjustGuidesToImage() {
-        const imgRect = previewImage.getBoundingClientRect();
+        // Image reçue du serveur ou aperçu composé localement
+        const target = previewCanvas.classList.contains('d-none') ? previewImage : previewCanvas;
+        const imgRect = target.getBoundingClientRect();
         const containerRect = document.getElementById('preview-container').getBoundingClientRect();
         
         // Positionner le conteneur des guides exactement sur l'image
@@ -398,8 +779,11 @@ document.addEventListener('DOMContentLoaded', function() {
     function resetUI() {
         // Réinitialiser le fichier sélectionné et le nom
         currentFilename = null;
+        clientLayer = null;
+        pendingLayer = null;
         // Masquer preview, guides, download etc.
         previewImage.classList.add('d-none');
+        previewCanvas.classList.add('d-none');
         noPreview.classList.remove('d-none');
         loading.classList.add('d-none');
         downloadContainer.classList.add('d-none');
@@ -0,0 +1,141 @@
+"""
+Rendu direct des logos SVG à leur taille finale.
+
+Un SVG n'a pas besoin d'être rastérisé à sa taille intrinsèque puis détouré et réduit :
+on lit ses dimensions, on calcule la taille de sortie (cadre × scale_factor) et cairo
+dessine le document une seule fois à exactement cette taille. Seul le canal alpha est
+conservé, il est déjà exact. Les documents analysés sont gardés par empreinte de
+contenu, si bien qu'un changement d'échelle ne fait que redessiner l'arbre.
+
+cairosvg n'est importé qu'au premier SVG (voir load_cairosvg) : son import charge cairo
+et cffi, inutiles à un worker qui ne traite que des images matricielles.
+"""
+import hashlib
+import logging
+import sys
+import threading
+import types
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+
+# Nombre de documents SVG analysés gardés en mémoire
+MAX_PARSED_SVG = 16
+
+# Côté du rendu d'essai sur lequel la boîte englobante du dessin est mesurée (ParsedSvg.content_box)
+CONTENT_BOX_SIZE = 1024
+
+# Contexte minimal pour résoudre les unités de width/height comme le fait cairosvg (96 dpi, 12pt)
+_SIZE_CONTEXT = types.SimpleNamespace(dpi=96, font_size=16, context_width=None, context_height=None)
+
+# Indice de l'alpha dans un pixel ARGB32 cairo (entier 32 bits natif)
+_ALPHA_INDEX = 3 if sys.byteorder == 'little' else 0
+
+_parsed = OrderedDict()
+_lock = threading.Lock()
+
+# Module cairosvg une fois importé, False s'il n'est pas installé (import non retenté)
+_cairosvg = None
+_import_lock = threading.Lock()
+
+
+def load_cairosvg():
+    """
+    Importe cairosvg au premier appel et le retourne.
+    Lève RuntimeError s'il n'est pas installé (ou si la bibliothèque cairo est introuvable).
+    """
+    global _cairosvg
+    if _cairosvg is None:
+        with _import_lock:
+            if _cairosvg is None:
+                try:
+                    import cairosvg
+                    import cairosvg.helpers
+                    import cairosvg.parser
+                    import cairosvg.surface
+                    _cairosvg = cairosvg
+                except Exception as e:
+                    logging.warning(f"CairoSVG indisponible : {str(e)}")
+                    _cairosvg = False
+    if _cairosvg is False:
+        raise RuntimeError("CairoSVG n'est pas installé. Impossible de traiter les fichiers SVG.")
+    return _cairosvg
+
+
+def svg_available():
+    """Indique si les SVG peuvent être traités (importe cairosvg si besoin)."""
+    try:
+        load_cairosvg()
+    except RuntimeError:
+        return False
+    return True
+
+
+class ParsedSvg:
+    """
+    Document SVG analysé une fois : arbre cairosvg et dimensions intrinsèques (px).
+
+    Args:
+        data: SVG source bytes (gzip-compressed SVGZ is accepted)
+        url: Path of the document, used to resolve relative references (default: None)
+    """
+
+    def __init__(self, data, url=None):
+        cairosvg = load_cairosvg()
+        self.tree = cairosvg.parser.Tree(bytestring=data, url=url)
+        width, height, _ = cairosvg.helpers.node_format(_SIZE_CONTEXT, self.tree)
+        if not width or not height:
+            raise ValueError("Dimensions du SVG indéfinies (ni width/height ni viewBox)")
+        self.size = (width, height)
+        # cairosvg annote l'arbre pendant le dessin : un seul rendu à la fois par document
+        self._lock = threading.Lock()
+        self._content_box = None
+
+    def rasterize_mask(self, size):
+        """Dessine le document à exactement size (largeur, hauteur) et retourne son alpha ('L')."""
+        width, height = size
+        with self._lock:
+            surface = load_cairosvg().surface.PNGSurface(self.tree, None, 96, output_width=width, output_height=height)
+            surface.cairo.flush()
+            stride = surface.cairo.get_stride()
+            pixels = np.frombuffer(surface.cairo.get_data(), dtype=np.uint8)
+            # La prémultiplication ne touche pas l'alpha ; les lignes sont alignées sur stride
+            pixels = pixels.reshape(surface.height, stride // 4, 4)
+            alpha = np.ascontiguousarray(pixels[:, :surface.width, _ALPHA_INDEX])
+            surface.finish()
+        return Image.fromarray(alpha)
+
+    def content_box(self):
+        """
+        Boîte englobante du dessin en fractions de la taille du document (x0, y0, x1, y1),
+        mesurée une fois sur un rendu de CONTENT_BOX_SIZE px de côté et élargie d'un pixel
+        de ce rendu ; None si le document ne dessine rien.
+        """
+        if self._content_box is None:
+            scale = CONTENT_BOX_SIZE / max(self.size)
+            width, height = max(1, round(self.size[0] * scale)), max(1, round(self.size[1] * scale))
+            bbox = self.rasterize_mask((width, height)).getbbox()
+            if bbox is None:
+                self._content_box = ()
+            else:
+                left, top, right, bottom = max(0, bbox[0] - 1), max(0, bbox[1] - 1), min(width, bbox[2] + 1), min(height, bbox[3] + 1)
+                self._content_box = (left / width, top / height, right / width, bottom / height)
+        return self._content_box or None
+
+
+def parse_svg(data, url=None):
+    """ParsedSvg du contenu, analysé une seule fois par empreinte (LRU de MAX_PARSED_SVG documents)."""
+    digest = hashlib.sha256(data).hexdigest()
+    with _lock:
+        parsed = _parsed.get(digest)
+        if parsed is not None:
+            _parsed.move_to_end(digest)
+            return parsed
+    parsed = ParsedSvg(data, url=url)
+    with _lock:
+        _parsed[digest] = parsed
+        while len(_parsed) > MAX_PARSED_SVG:
+            _parsed.popitem(last=False)
+    return parsed
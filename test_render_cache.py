@@ -0,0 +1,64 @@
+"""
+Fusion des rendus simultanés du cache : une demande JSON (get_or_render, qui écrit le
+fichier) et une demande en flux (render_bytes, qui attend des octets) du même rendu.
+
+    python -m pytest test_render_cache.py
+"""
+import threading
+import time
+
+from render_cache import RenderCache
+
+DATA = b'\x89PNG rendu'
+
+
+def _race(tmp_path, leader, follower):
+    """Lance leader puis, pendant son rendu, follower sur le même fichier : (résultat leader, résultat follower)."""
+    cache = RenderCache(str(tmp_path))
+    started = threading.Event()
+    release = threading.Event()
+
+    def render(output_path):
+        started.set()
+        release.wait(5)
+        if output_path is None:
+            return DATA
+        with open(output_path, 'wb') as f:
+            f.write(DATA)
+        # Comme save_image : une valeur qui n'est pas le contenu du rendu
+        return True
+
+    results = {}
+    leader_thread = threading.Thread(target=lambda: results.update(leader=leader(cache, render)))
+    leader_thread.start()
+    assert started.wait(5)
+    follower_thread = threading.Thread(target=lambda: results.update(follower=follower(cache, render)))
+    follower_thread.start()
+    # Laisser le suiveur rejoindre le rendu en cours avant qu'il se termine
+    time.sleep(0.2)
+    release.set()
+    leader_thread.join(5)
+    follower_thread.join(5)
+    assert cache.stats()['coalesced'] == 1
+    return results['leader'], results['follower']
+
+
+def get_or_render(cache, render):
+    return cache.get_or_render('render.png', render)
+
+
+def render_bytes(cache, render):
+    return cache.render_bytes('render.png', render)
+
+
+def test_stream_follower_of_json_leader_gets_bytes(tmp_path):
+    leader, follower = _race(tmp_path, get_or_render, render_bytes)
+    assert leader is False
+    assert follower == DATA
+
+
+def test_json_follower_of_stream_leader(tmp_path):
+    leader, follower = _race(tmp_path, render_bytes, get_or_render)
+    assert leader == DATA
+    assert follower is True
+    assert (tmp_path / 'render.png').read_bytes() == DATA
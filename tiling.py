@@ -0,0 +1,98 @@
+"""
+Exécution par bandes des étapes pixel par pixel des très grandes images.
+
+Au-delà de TILE_MIN_PIXELS, l'image est découpée en bandes horizontales de TILE_ROWS
+lignes traitées en parallèle sur un pool de TILE_THREADS threads (Pillow et NumPy
+relâchent le GIL), puis les résultats sont réassemblés. Les bandes ne servent qu'aux
+opérations locales à chaque pixel (ou à chaque bloc de réduction, les bandes étant alors
+alignées sur le facteur) : le résultat est identique, pixel pour pixel, au traitement
+de l'image entière. En dessous du seuil, ou avec un seul thread, l'image est traitée d'un
+seul tenant.
+"""
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# Réglages (remplacés par la configuration de l'application, voir app.py)
+TILE_MIN_PIXELS = 8_000_000
+TILE_ROWS = 512
+TILE_THREADS = os.cpu_count() or 1
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _reset_pool():
+    # Les threads du pool ne survivent pas à un fork (workers gunicorn, pool de processus)
+    global _pool
+    _pool = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool)
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=TILE_THREADS, thread_name_prefix='tile')
+    return _pool
+
+
+def tiled(size):
+    """Vrai si une image de cette taille est traitée par bandes."""
+    return TILE_THREADS > 1 and size[0] * size[1] >= TILE_MIN_PIXELS
+
+
+def strips(height, align=1):
+    """Bandes (haut, bas) couvrant height lignes, de TILE_ROWS lignes arrondies à un multiple de align."""
+    rows = max(align, TILE_ROWS // align * align)
+    return [(top, min(height, top + rows)) for top in range(0, height, rows)]
+
+
+def map_strips(func, size, align=1):
+    """
+    Appelle func(haut, bas) pour chaque bande d'une image de taille size, en parallèle si
+    elle est traitée par bandes, et retourne les résultats dans l'ordre des bandes. func ne
+    doit écrire que dans ses propres lignes.
+    """
+    if not tiled(size):
+        return [func(0, size[1])]
+    return list(_get_pool().map(lambda strip: func(*strip), strips(size[1], align)))
+
+
+def convert_image(img, mode):
+    """img.convert(mode) par bandes (conversion pixel par pixel, ex. niveaux de gris)."""
+    if not tiled(img.size):
+        return img.convert(mode)
+    img.load()
+    width = img.width
+    result = Image.new(mode, img.size)
+    converted = map_strips(lambda top, bottom: (top, img.crop((0, top, width, bottom)).convert(mode)), img.size)
+    for top, strip in converted:
+        result.paste(strip, (0, top))
+    return result
+
+
+def reduce_image(img, factor):
+    """
+    img.reduce(factor) par bandes alignées sur factor : chaque bloc de factor × factor pixels
+    est moyenné dans une seule bande (seule la dernière bande a des blocs incomplets).
+    """
+    if not tiled(img.size):
+        return img.reduce(factor)
+    img.load()
+    width = img.width
+    result = Image.new(img.mode, (math.ceil(img.width / factor), math.ceil(img.height / factor)))
+    # Bande recadrée avant la réduction : Image.reduce convertirait sinon l'image entière
+    # (alpha prémultiplié) pour chaque bande
+    reduced = map_strips(lambda top, bottom: (top, img.crop((0, top, width, bottom)).reduce(factor)), img.size, align=factor)
+    for top, strip in reduced:
+        result.paste(strip, (0, top // factor))
+    return result
+
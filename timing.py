@@ -0,0 +1,194 @@
+"""
+Chronométrage par étape des rendus.
+
+Les fonctions de rendu délimitent leurs étapes avec `with stage('detour'):`. Sans
+enregistreur actif (chronométrage désactivé, appel hors requête), stage() ne fait
+rien d'autre que lire une ContextVar. Les limites d'étapes servent aussi de points
+d'annulation pour les rendus devenus inutiles. Côté Flask, un StageRecorder est activé pour
+chaque requête : ses mesures alimentent l'en-tête Server-Timing et les histogrammes
+exposés au format Prometheus sur /metrics.
+"""
+import contextlib
+import contextvars
+import threading
+import time
+
+_recorder = contextvars.ContextVar('stage_recorder', default=None)
+
+# Bornes des histogrammes (secondes, pixels, octets)
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PIXELS_BUCKETS = (1e4, 1e5, 5e5, 1e6, 4e6, 1.6e7, 6.4e7)
+BYTES_BUCKETS = (1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 4e6, 1.6e7)
+
+
+class RenderCancelled(Exception):
+    """Rendu abandonné entre deux étapes, à la demande de l'enregistreur actif."""
+
+
+class StageRecorder:
+    """
+    Mesures d'une requête : durées par étape, valeurs (pixels en entrée, octets en sortie)
+    et étiquettes (profil d'encodage).
+    Si should_cancel est fourni, il est consulté au début de chaque étape : le rendu
+    s'interrompt (RenderCancelled) dès qu'il retourne vrai.
+    """
+
+    def __init__(self, should_cancel=None):
+        self.stages = []
+        self.values = {}
+        self.labels = {}
+        self.should_cancel = should_cancel
+
+    def add(self, name, seconds):
+        self.stages.append((name, seconds))
+
+    def totals(self):
+        """Durée cumulée par étape (une étape peut être traversée plusieurs fois)."""
+        totals = {}
+        for name, seconds in self.stages:
+            totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+    def server_timing(self):
+        """Valeur de l'en-tête Server-Timing (durées en millisecondes)."""
+        return ', '.join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.totals().items())
+
+
+def activate(recorder):
+    """Active un enregistreur pour le contexte courant ; retourne le jeton de reset()."""
+    return _recorder.set(recorder)
+
+
+def deactivate(token):
+    _recorder.reset(token)
+
+
+@contextlib.contextmanager
+def recording(recorder=None):
+    """Active un enregistreur (nouveau par défaut) le temps du bloc (hors Flask : CLI, benchmarks, threads)."""
+    recorder = recorder or StageRecorder()
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Chronomètre une étape si un enregistreur est actif (et l'annule si le rendu est abandonné)."""
+    recorder = _recorder.get()
+    if recorder is None:
+        yield
+        return
+    if recorder.should_cancel is not None and recorder.should_cancel():
+        raise RenderCancelled(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.add(name, time.perf_counter() - start)
+
+
+def record(name, value):
+    """Enregistre une valeur associée au rendu courant (ex. input_pixels, output_bytes)."""
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.values[name] = recorder.values.get(name, 0) + value
+
+
+def annotate(name, value):
+    """Associe une étiquette au rendu courant (ex. profile), reprise dans les métriques."""
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.labels[name] = value
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """Histogrammes agrégés par endpoint et par étape, rendus au format texte Prometheus."""
+
+    METRICS = {
+        'logo_request_seconds': ('Durée totale des requêtes de rendu', SECONDS_BUCKETS),
+        'logo_stage_seconds': ('Durée des étapes de rendu', SECONDS_BUCKETS),
+        'logo_input_pixels': ('Pixels de l\'image source décodée', PIXELS_BUCKETS),
+        'logo_output_bytes': ('Taille du rendu encodé', BYTES_BUCKETS),
+        'logo_encode_seconds': ('Durée d\'encodage par profil', SECONDS_BUCKETS),
+        'logo_startup_seconds': ('Démarrage du serveur (préchargement, démarrage à froid et première requête des workers)', SECONDS_BUCKETS),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._collectors = []
+
+    def observe(self, metric, value, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.METRICS[metric][1])
+            histogram.observe(value)
+
+    def observe_request(self, endpoint, recorder, seconds):
+        self.observe('logo_request_seconds', seconds, endpoint=endpoint)
+        totals = recorder.totals()
+        for name, stage_seconds in totals.items():
+            self.observe('logo_stage_seconds', stage_seconds, endpoint=endpoint, stage=name)
+        if 'input_pixels' in recorder.values:
+            self.observe('logo_input_pixels', recorder.values['input_pixels'], endpoint=endpoint)
+        # Taille et durée d'encodage par profil d'encodage
+        profile = recorder.labels.get('profile', 'default')
+        if 'output_bytes' in recorder.values:
+            self.observe('logo_output_bytes', recorder.values['output_bytes'], endpoint=endpoint, profile=profile)
+        if 'encode' in totals:
+            self.observe('logo_encode_seconds', totals['encode'], endpoint=endpoint, profile=profile)
+
+    def add_collector(self, collect):
+        """
+        Ajoute une source de compteurs : collect() retourne une liste de
+        (nom, aide, valeur) exposés comme compteurs Prometheus.
+        """
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            items = sorted(self._histograms.items())
+            snapshot = [(key, list(h.counts), h.count, h.sum, h.buckets) for key, h in items]
+        described = set()
+        for (metric, labels), counts, count, total, buckets in snapshot:
+            if metric not in described:
+                described.add(metric)
+                lines.append(f"# HELP {metric} {self.METRICS[metric][0]}")
+                lines.append(f"# TYPE {metric} histogram")
+            label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+            prefix = f"{label_text}," if label_text else ''
+            for bound, bucket_count in zip(buckets, counts):
+                lines.append(f'{metric}_bucket{{{prefix}le="{bound:g}"}} {bucket_count}')
+            lines.append(f'{metric}_bucket{{{prefix}le="+Inf"}} {count}')
+            lines.append(f"{metric}_sum{{{label_text}}} {total:g}")
+            lines.append(f"{metric}_count{{{label_text}}} {count}")
+        for collect in self._collectors:
+            for name, help_text, value in collect():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
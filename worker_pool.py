@@ -0,0 +1,128 @@
+"""
+Pool de processus dont les tâches signalent leur démarrage réel.
+
+Une tâche soumise à un ProcessPoolExecutor peut attendre longtemps qu'un processus se
+libère, et future.cancel() est sans effet sur une tâche en cours. Ici chaque tâche
+envoie, au moment où elle démarre, son identifiant, le pid de son processus et l'heure :
+le délai d'une tâche se mesure à partir de ce démarrage, et une tâche qui le dépasse est
+arrêtée en tuant son processus. Le pool, alors inutilisable, est recréé ; les autres
+tâches qu'il exécutait échouent avec BrokenProcessPool et peuvent être soumises à nouveau.
+"""
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+_KILL_SIGNAL = getattr(signal, 'SIGKILL', signal.SIGTERM)
+
+# File des démarrages, côté processus du pool
+_started_queue = None
+
+
+def _init_worker(queue, initializer, initargs):
+    global _started_queue
+    _started_queue = queue
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _run_task(token, func, args):
+    # SimpleQueue : écriture synchrone, aucun verrou n'est tenu pendant la tâche elle-même
+    _started_queue.put((token, os.getpid(), time.time()))
+    return func(*args)
+
+
+class WatchedPool:
+    """
+    Pool de processus créé à la première soumission, recréé après une tâche arrêtée ou un
+    processus mort.
+
+    Args:
+        workers: Nombre de processus
+        initializer: Fonction appelée au démarrage de chaque processus (default: None)
+        initargs: Arguments de initializer (default: ())
+        context: Contexte multiprocessing (default: contexte par défaut de la plateforme)
+    """
+
+    def __init__(self, workers, initializer=None, initargs=(), context=None):
+        self.workers = workers
+        self.initializer = initializer
+        self.initargs = initargs
+        self._context = context or multiprocessing.get_context()
+        # File créée avec le premier pool : propre au processus qui soumet (worker gunicorn)
+        self._queue = None
+        self._lock = threading.Lock()
+        self._pool = None
+        # token -> pool de la tâche ; token -> (pid, heure de démarrage)
+        self._pools = {}
+        self._started = {}
+
+    def submit(self, func, *args):
+        """Soumet func(*args) ; retourne (future, token), token identifiant la tâche."""
+        token = uuid.uuid4().hex
+        with self._lock:
+            if self._pool is None:
+                if self._queue is None:
+                    self._queue = self._context.SimpleQueue()
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=self._context,
+                    initializer=_init_worker,
+                    initargs=(self._queue, self.initializer, self.initargs)
+                )
+            pool = self._pool
+            self._pools[token] = pool
+        return pool.submit(_run_task, token, func, args), token
+
+    def started_at(self, token):
+        """Heure (time.time) du démarrage de la tâche, ou None si elle attend encore un processus."""
+        with self._lock:
+            while self._queue is not None and not self._queue.empty():
+                started_token, pid, started = self._queue.get()
+                self._started[started_token] = (pid, started)
+            started = self._started.get(token)
+        return started[1] if started else None
+
+    def expired(self, token, timeout):
+        """Vrai si la tâche a démarré depuis plus de timeout secondes."""
+        started = self.started_at(token)
+        return started is not None and time.time() - started > timeout
+
+    def kill(self, future, token):
+        """
+        Arrête une tâche en cours en tuant son processus, puis abandonne son pool : les
+        autres tâches de ce pool échouent avec BrokenProcessPool.
+        """
+        with self._lock:
+            started = self._started.get(token)
+        if started is not None and not future.done():
+            try:
+                os.kill(started[0], _KILL_SIGNAL)
+            except ProcessLookupError:
+                pass
+        self.discard(token)
+
+    def discard(self, token):
+        """Abandonne le pool de la tâche (processus mort) : le suivant sera créé à la prochaine soumission."""
+        with self._lock:
+            pool = self._pools.get(token)
+            if pool is None:
+                return
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def forget(self, token):
+        """Libère le suivi d'une tâche terminée."""
+        with self._lock:
+            self._pools.pop(token, None)
+            self._started.pop(token, None)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)